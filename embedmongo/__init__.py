@@ -14,10 +14,21 @@
 
 import logging
 
-from .core import EmbedMongo
-from .package import Version
+from .aio import AsyncEmbedMongo, AsyncMongodLauncher, AsyncMongodProcess
+from .capabilities import Capabilities
+from .catalog import Release, ReleaseCatalog
+from .core import EmbedMongo, PrepareResult
+from .package import Revalidate, Version
+from .pool import MongodPool
+from .process import MongodLauncher, MongodProcess
+from .progress import LoggingReporter, ProgressReporter, set_progress_reporter, TqdmReporter
+from .registry import InstanceRegistry
+from .snapshot import DataSnapshots
+from .topology import ReplicaSet, ShardedCluster
 
 __version__ = '0.1.0'
-__all__ = ['EmbedMongo', 'Version']
+__all__ = ['AsyncEmbedMongo', 'AsyncMongodLauncher', 'AsyncMongodProcess', 'Capabilities', 'DataSnapshots', 'EmbedMongo', 'InstanceRegistry',
+           'LoggingReporter', 'MongodLauncher', 'MongodPool', 'MongodProcess', 'PrepareResult', 'ProgressReporter', 'Release', 'ReleaseCatalog',
+           'ReplicaSet', 'Revalidate', 'ShardedCluster', 'TqdmReporter', 'Version', 'set_progress_reporter']
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -0,0 +1,367 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    asyncio API. Packages are prepared by `EmbedMongo` in thread pool, so event loop isn't blocked by downloads
+    and extraction. mongod runs as asyncio subprocess and its output is read by the loop, without extra threads.
+"""
+
+import asyncio
+import collections
+from concurrent import futures
+import functools
+import logging
+from pathlib import Path
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Any, Callable, Deque, Iterable, List, Optional, Pattern, Sequence, Set, TypeVar  # noqa: F401
+
+from .blobstore import clone_tree
+from .capabilities import Capabilities
+from .catalog import Release
+from .core import EmbedMongo, PrepareResult
+from .downloader import DownloadStats
+from .events import hooks, MongodStarted
+from .exceptions import MongodStartException
+from .package import AnyVersion
+from .process import free_port, output_redirected, READY_RE
+from .registry import InstanceRegistry
+from .snapshot import DataSnapshots, Seed
+from .storage import binary_info, ram_args, ram_dir
+
+logger = logging.getLogger(__name__)
+
+# max length of mongod output line
+_STREAM_LIMIT = 1024 * 1024
+
+T = TypeVar('T')
+
+
+class AsyncMongodProcess:
+    """Handle of mongod started by `AsyncMongodLauncher`. Use `await stop()` or `async with` to shut it down."""
+    _OUTPUT_LINES = 200
+
+    def __init__(self, process: asyncio.subprocess.Process, host: str, port: int, dbpath: Path, remove_dbpath: bool,
+                 registry: Optional[InstanceRegistry] = None):
+        self.host = host
+        self.port = port
+        self.dbpath = dbpath
+        self.startup_time = None  # type: Optional[float]
+
+        self._process = process
+        self._remove_dbpath = remove_dbpath
+        self._registry = registry
+        self._output = collections.deque(maxlen=self._OUTPUT_LINES)  # type: Deque[str]
+        self._output_changed = asyncio.Condition()
+        self._output_closed = False
+        self._reader = asyncio.ensure_future(self._read_output())
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._process.returncode
+
+    @property
+    def address(self) -> str:
+        return '{host}:{port}'.format(host=self.host, port=self.port)
+
+    @property
+    def uri(self) -> str:
+        return 'mongodb://{address}'.format(address=self.address)
+
+    @property
+    def output(self) -> List[str]:
+        """Last lines of mongod output."""
+        return list(self._output)
+
+    def is_running(self) -> bool:
+        return self._process.returncode is None
+
+    async def wait_for_output(self, pattern: Pattern[str], timeout: float) -> bool:
+        """Waits until mongod prints line matching `pattern`. Returns False on timeout or when process exited."""
+        def matched() -> bool:
+            return any(pattern.search(line) for line in self._output)
+
+        async with self._output_changed:
+            try:
+                await asyncio.wait_for(self._output_changed.wait_for(lambda: self._output_closed or matched()), timeout)
+            except asyncio.TimeoutError:
+                return False
+
+        return matched()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Asks mongod for clean shutdown (SIGTERM) and kills it if it doesn't stop within `timeout`."""
+        if self.is_running():
+            logger.info("Stopping mongod {address} (pid {pid})".format(address=self.address, pid=self.pid))
+            self._process.terminate()
+            try:
+                await asyncio.wait_for(self._process.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("mongod {address} didn't stop in {timeout}s. Killing it.".format(address=self.address, timeout=timeout))
+                self._process.kill()
+                await self._process.wait()
+
+        await self._reader
+        if self._remove_dbpath:
+            await asyncio.get_event_loop().run_in_executor(None, functools.partial(shutil.rmtree, str(self.dbpath), ignore_errors=True))
+        if self._registry is not None:
+            await asyncio.get_event_loop().run_in_executor(None, self._registry.release, self.port)
+
+    async def __aenter__(self) -> 'AsyncMongodProcess':
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.stop()
+
+    async def _read_output(self) -> None:
+        stdout = self._process.stdout
+        assert stdout is not None
+        while True:
+            raw_line = await stdout.readline()
+            if not raw_line:
+                break
+
+            line = raw_line.decode('utf-8', errors='replace').rstrip()
+            logger.debug("mongod {port}: {line}".format(port=self.port, line=line))
+            async with self._output_changed:
+                self._output.append(line)
+                self._output_changed.notify_all()
+
+        async with self._output_changed:
+            self._output_closed = True
+            self._output_changed.notify_all()
+
+
+class AsyncMongodLauncher:
+    """
+        asyncio variant of `MongodLauncher`, many instances can be started concurrently from one loop. `registry`
+        and `mongod --version` of `ram` mode are used in executor, because they may block.
+    """
+    def __init__(self, bin_dir: Path, registry: Optional[InstanceRegistry] = None, ram: bool = False, capabilities: Optional[Capabilities] = None):
+        self._bin_dir = bin_dir
+        self._registry = registry
+        self._ram = ram
+        self._capabilities = capabilities
+
+    async def start(self, port: Optional[int] = None, host: str = '127.0.0.1', dbpath: Optional[Path] = None, args: Sequence[str] = (),
+                    timeout: float = 30.0, snapshot: Optional[Path] = None) -> AsyncMongodProcess:
+        """Starts mongod and waits until it accepts connections. See `MongodLauncher.start()` for arguments."""
+        loop = asyncio.get_event_loop()
+        args = await self._args(args, snapshot)
+        remove_dbpath = dbpath is None
+        dbpath = await self._dbpath(dbpath, snapshot)
+        registry = self._registry if port is None else None
+
+        # leased right before mongod is spawned, copying snapshot may take longer than the lease lasts
+        if port is None:
+            port = await loop.run_in_executor(None, registry.allocate, host) if registry is not None else free_port(host)
+        try:
+            cmd = [str(self._bin_dir / 'mongod'), '--bind_ip', host, '--port', str(port), '--dbpath', str(dbpath)] + list(args)
+            logger.info("Starting {cmd}".format(cmd=' '.join(cmd)))
+
+            start_time = time.monotonic()
+            subprocess_process = await asyncio.create_subprocess_exec(*cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                                      limit=_STREAM_LIMIT)
+        except BaseException:
+            if registry is not None:
+                await loop.run_in_executor(None, registry.release, port)
+            raise
+        process = AsyncMongodProcess(subprocess_process, host, port, dbpath, remove_dbpath, registry)
+        if registry is not None:
+            await _register(process, registry, dbpath if remove_dbpath else None)
+
+        await _ensure_ready(process, args, timeout)
+
+        process.startup_time = time.monotonic() - start_time
+        logger.info("mongod {address} (pid {pid}) started in {time:.3f}s".format(address=process.address, pid=process.pid, time=process.startup_time))
+        if hooks.active:
+            hooks.emit(MongodStarted(binary='mongod', address=process.address, pid=process.pid, startup_time=process.startup_time))
+
+        return process
+
+    async def _dbpath(self, dbpath: Optional[Path], snapshot: Optional[Path]) -> Path:
+        loop = asyncio.get_event_loop()
+        path = dbpath or Path(tempfile.mkdtemp(prefix='embedmongo-', dir=str(ram_dir()) if self._ram else None))
+        try:
+            path.mkdir(parents=True, exist_ok=True)
+            if snapshot is not None:
+                await loop.run_in_executor(None, clone_tree, snapshot, path)
+        except BaseException:
+            if dbpath is None:
+                await loop.run_in_executor(None, functools.partial(shutil.rmtree, str(path), ignore_errors=True))
+            raise
+
+        return path
+
+    async def _args(self, args: Sequence[str], snapshot: Optional[Path]) -> Sequence[str]:
+        if self._ram:
+            info = await asyncio.get_event_loop().run_in_executor(None, binary_info, self._bin_dir / 'mongod')
+            args = list(args) + ram_args(info, args, in_memory=snapshot is None)
+        if self._capabilities is not None:
+            args = self._capabilities.check(args, 'mongod')
+
+        return args
+
+
+class AsyncEmbedMongo:
+    """
+        asyncio front end of `EmbedMongo`, arguments other than `executor` are passed to it.
+
+        Packages are prepared in `executor` threads (own pool when it's not given). Downloads share connection pool
+        of one `Downloader` and per-version locks keep concurrent prepares of the same version safe, so many
+        versions can be prepared and started at once with `asyncio.gather()`.
+
+        Use `await aclose()` or `async with` to release it, preparations which are still running are waited for.
+    """
+    def __init__(self, *args: Any, executor: Optional[futures.Executor] = None, **kwargs: Any):
+        self._embed_mongo = EmbedMongo(*args, **kwargs)
+        self._own_executor = executor is None
+        self._executor = executor or futures.ThreadPoolExecutor()
+        # calls running in executor, they aren't stopped when awaiting task is cancelled
+        self._pending = set()  # type: Set[futures.Future[Any]]
+
+    @property
+    def download_stats(self) -> DownloadStats:
+        return self._embed_mongo.download_stats
+
+    async def resolve(self, spec: str) -> Release:
+        """See `EmbedMongo.resolve()`."""
+        return await self._run(self._embed_mongo.resolve, spec)
+
+    async def prepare(self, version: AnyVersion, components: Optional[Iterable[str]] = None) -> Path:
+        """See `EmbedMongo.prepare()`."""
+        return await self._run(self._embed_mongo.prepare, version, components)
+
+    async def prepare_many(self, versions: Iterable[AnyVersion], components: Optional[Iterable[str]] = None) -> List[PrepareResult]:
+        """Prepares `versions` concurrently. Errors don't stop other versions, see `EmbedMongo.prepare_many()`."""
+        components = set(components) if components is not None else None
+        versions = list(collections.OrderedDict.fromkeys(versions))
+        results = await asyncio.gather(*[self.prepare(version, components) for version in versions], return_exceptions=True)
+
+        prepared = []
+        for version, result in zip(versions, results):
+            if isinstance(result, BaseException):
+                logger.error("Preparing {version} failed: {error}".format(version=version.version, error=result))
+                prepared.append(PrepareResult(version=version, bin_dir=None, error=result))
+            else:
+                prepared.append(PrepareResult(version=version, bin_dir=result, error=None))
+
+        return prepared
+
+    async def start(self, version: AnyVersion, port: Optional[int] = None, dbpath: Optional[Path] = None, args: Sequence[str] = (),
+                    timeout: float = 30.0, snapshot: Optional[str] = None, seed: Optional[Seed] = None,
+                    components: Optional[Iterable[str]] = None, ram: bool = False) -> AsyncMongodProcess:
+        """
+            Prepares `version` and starts mongod from it, see `EmbedMongo.start()`. Golden snapshot is built in
+            executor, so `seed` is called from other thread with blocking `MongodProcess`.
+        """
+        bin_dir = await self.prepare(version, components)
+
+        golden = None
+        if snapshot is not None:
+            snapshots = self._embed_mongo.snapshots(version, bin_dir)
+            golden = await self._run(functools.partial(snapshots.golden, snapshot, seed=seed, args=args, timeout=timeout))
+
+        capabilities = await self.capabilities(version, components)
+        launcher = AsyncMongodLauncher(bin_dir, self._embed_mongo.registry, ram, capabilities)
+
+        return await launcher.start(port=port, dbpath=dbpath, args=args, timeout=timeout, snapshot=golden)
+
+    async def capabilities(self, version: AnyVersion, components: Optional[Iterable[str]] = None) -> Capabilities:
+        """See `EmbedMongo.capabilities()`."""
+        return await self._run(self._embed_mongo.capabilities, version, components)
+
+    async def snapshots(self, version: AnyVersion) -> DataSnapshots:
+        """See `EmbedMongo.snapshots()`."""
+        return await self._run(self._embed_mongo.snapshots, version)
+
+    async def aclose(self) -> None:
+        """Waits for pending preparations and shuts down own executor."""
+        if self._pending:
+            await asyncio.wait([asyncio.wrap_future(future) for future in list(self._pending)])
+        self.close()
+
+    def close(self) -> None:
+        """Shuts down own executor without waiting, preparations which are still running are left in background."""
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def __aenter__(self) -> 'AsyncEmbedMongo':
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.aclose()
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        future = self._executor.submit(func, *args)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+
+        return await asyncio.wrap_future(future)
+
+
+async def _register(process: AsyncMongodProcess, registry: InstanceRegistry, dbpath: Optional[Path]) -> None:
+    try:
+        await asyncio.get_event_loop().run_in_executor(None, registry.register, process.port, process.pid, dbpath)
+    except BaseException:
+        # lease was lost, e.g. it expired and port was given to other process
+        await process.stop()
+        raise
+
+
+async def _ensure_ready(process: AsyncMongodProcess, args: Sequence[str], timeout: float) -> None:
+    if output_redirected(args):
+        ready = await _wait_for_port(process, timeout)
+    else:
+        ready = await process.wait_for_output(READY_RE, timeout)
+
+    if not ready:
+        output = '\n'.join(process.output[-20:])
+        returncode = await _exit_code(process)
+        reason = 'exited with code {code}'.format(code=returncode) if returncode is not None else 'not ready in {timeout}s'.format(timeout=timeout)
+        await process.stop()
+        raise MongodStartException("mongod on port {port} {reason}. Output:\n{output}".format(port=process.port, reason=reason, output=output))
+
+
+async def _exit_code(process: AsyncMongodProcess) -> Optional[int]:
+    # closed output means that process is exiting, but it may be not reaped yet
+    if process.returncode is None and process._output_closed:
+        try:
+            await asyncio.wait_for(process._process.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+
+    return process.returncode
+
+
+async def _wait_for_port(process: AsyncMongodProcess, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while process.is_running() and time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(process.host, process.port), delay)
+        except (OSError, asyncio.TimeoutError):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        else:
+            writer.close()
+            return True
+
+    return False
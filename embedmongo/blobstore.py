@@ -0,0 +1,319 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import tarfile
+import tempfile
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1024*1024
+
+# linux ioctl for reflink (copy-on-write clone of whole file)
+_FICLONE = 0x40049409
+
+ManifestEntry = Dict[str, Any]
+
+
+class BlobStore:
+    """
+        Content-addressed store of extracted package files, shared between workspaces, versions and processes.
+
+        Every regular file is stored once under `blobs/<sha256>` and materialized in extracted trees as a hardlink,
+        or as a reflink/copy when hardlink is impossible (e.g. other filesystem). Manifest of every extracted archive
+        is kept too, so archive seen before is materialized again without decompressing it.
+
+        Blob linked from nowhere yet (just stored or listed in manifest) looks unused to `prune()`, so extraction
+        holds the store with `using()` from storing blobs until they're linked, and `prune()` doesn't run meanwhile.
+    """
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock_path = root / '.lock'
+        self._blobs_dir = root / 'blobs'
+        self._manifests_dir = root / 'manifests'
+        self._tmp_dir = root / 'tmp'
+        for directory in (self._blobs_dir, self._manifests_dir, self._tmp_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    @contextlib.contextmanager
+    def using(self) -> Iterator[None]:
+        """Shared hold of the store, any number of processes and threads may use it at once, only `prune()` waits."""
+        fd = os.open(str(self._lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            yield
+        finally:
+            # closing the descriptor releases the lock
+            os.close(fd)
+
+    def blob_path(self, digest: str) -> Path:
+        return self._blobs_dir / digest[:2] / digest
+
+    def put(self, fileobj: IO[bytes], mode: int) -> str:
+        """Stores content of `fileobj` and returns its SHA-256 digest. Blobs are read-only, so links can't modify them."""
+        sha256 = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=str(self._tmp_dir))
+        tmp_path = Path(tmp_name)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in iter(lambda: fileobj.read(_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+                    tmp_file.write(chunk)
+            tmp_path.chmod(_blob_mode(mode))
+
+            digest = sha256.hexdigest()
+            blob_path = self.blob_path(digest)
+            blob_path.parent.mkdir(exist_ok=True)
+            try:
+                # link doesn't replace blob which may be already linked by other process
+                os.link(str(tmp_path), str(blob_path))
+            except FileExistsError:
+                pass
+        finally:
+            tmp_path.unlink()
+
+        return digest
+
+    def materialize(self, digest: str, dst: Path, mode: int) -> None:
+        blob_path = self.blob_path(digest)
+        if dst.exists() or dst.is_symlink():
+            dst.unlink()
+
+        if (blob_path.stat().st_mode & 0o777) == _blob_mode(mode):
+            try:
+                os.link(str(blob_path), str(dst))
+                return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EACCES):
+                    raise
+
+        clone_file(blob_path, dst)
+        dst.chmod(mode)
+
+    def load_manifest(self, key: str) -> Optional[List[ManifestEntry]]:
+        """Returns manifest saved under `key`, only when all blobs it refers to are still present."""
+        manifest_path = self._manifests_dir / (key + '.json')
+        if not manifest_path.exists():
+            return None
+
+        entries = json.loads(manifest_path.read_text())  # type: List[ManifestEntry]
+        if not all(self.blob_path(entry['digest']).exists() for entry in entries if entry['type'] == 'file'):
+            return None
+
+        return entries
+
+    def save_manifest(self, key: str, entries: List[ManifestEntry]) -> None:
+        manifest_path = self._manifests_dir / (key + '.json')
+        tmp_path = manifest_path.with_name(manifest_path.name + '.{pid}.tmp'.format(pid=os.getpid()))
+        tmp_path.write_text(json.dumps(entries))
+        tmp_path.replace(manifest_path)
+
+    def prune(self) -> int:
+        """
+            Removes blobs which aren't linked from any extracted tree. Returns number of freed bytes. Store used by
+            extraction (see `using()`) isn't pruned, its unused blobs are removed next time.
+        """
+        fd = os.open(str(self._lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("Blob store {path} is in use, it's not pruned".format(path=self.root))
+                return 0
+
+            freed = 0
+            for blob_path in self._blobs_dir.glob('*/*'):
+                stat = blob_path.stat()
+                if stat.st_nlink == 1:
+                    blob_path.unlink()
+                    freed += stat.st_size
+
+            return freed
+        finally:
+            os.close(fd)
+
+
+def extract_to_store(tar: tarfile.TarFile, dst: Path, members: Iterable[tarfile.TarInfo], store: BlobStore) -> List[ManifestEntry]:
+    """Extracts already stripped `members` of opened `tar` through `store`. Returns manifest of extracted tree."""
+    entries = []  # type: List[ManifestEntry]
+    dst.mkdir(parents=True, exist_ok=True)
+
+    with store.using():
+        for member in members:
+            reason = unsafe_reason(dst, member.name, member_type(member), member.linkname)
+            if reason is not None:
+                logger.warning("Skipping {name}: {reason}".format(name=member.name, reason=reason))
+                continue
+
+            entry = {'path': member.name, 'mode': member.mode}  # type: ManifestEntry
+            if member.isdir():
+                entry['type'] = 'dir'
+            elif member.issym():
+                entry.update(type='symlink', target=member.linkname)
+            elif member.islnk():
+                entry.update(type='link', target=member.linkname)
+            elif member.isfile():
+                fileobj = tar.extractfile(member)
+                assert fileobj is not None
+                entry.update(type='file', digest=store.put(fileobj, member.mode))
+            else:
+                logger.debug("Skipping {name}: unsupported member type".format(name=member.name))
+                continue
+
+            materialize_entry(store, dst, entry)
+            entries.append(entry)
+
+    return entries
+
+
+def materialize(store: BlobStore, dst: Path, entries: List[ManifestEntry]) -> None:
+    dst.mkdir(parents=True, exist_ok=True)
+    with store.using():
+        for entry in entries:
+            materialize_entry(store, dst, entry)
+
+
+def materialize_entry(store: BlobStore, dst: Path, entry: ManifestEntry) -> None:
+    # manifests are shared by all workspaces using the store, they're checked like archive members
+    reason = unsafe_reason(dst, entry['path'], entry['type'], entry.get('target', ''))
+    if reason is not None:
+        logger.warning("Skipping {name}: {reason}".format(name=entry['path'], reason=reason))
+        return
+
+    path = dst / entry['path']
+    if entry['type'] == 'dir':
+        path.mkdir(parents=True, exist_ok=True)
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if entry['type'] == 'file':
+        store.materialize(entry['digest'], path, entry['mode'])
+    elif entry['type'] == 'symlink':
+        if path.exists() or path.is_symlink():
+            path.unlink()
+        os.symlink(entry['target'], str(path))
+    elif entry['type'] == 'link':
+        if path.exists():
+            path.unlink()
+        os.link(str(dst / entry['target']), str(path))
+
+
+def manifest_key(archive_digest: str, strip_level: int) -> str:
+    return '{digest}-{strip_level}'.format(digest=archive_digest, strip_level=strip_level)
+
+
+def file_digest(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def _blob_mode(mode: int) -> int:
+    return mode & 0o555 | 0o444
+
+
+def is_safe_path(name: str) -> bool:
+    return not os.path.isabs(name) and '..' not in Path(name).parts
+
+
+def member_type(member: tarfile.TarInfo) -> str:
+    """Type of archive `member` as recorded in manifest entries."""
+    if member.isdir():
+        return 'dir'
+    if member.issym():
+        return 'symlink'
+    if member.islnk():
+        return 'link'
+
+    return 'file'
+
+
+def unsafe_reason(dst: Path, name: str, type_: str, target: str = '') -> Optional[str]:
+    """
+        Why member `name` of `type_` (see `member_type()`) can't be extracted to `dst`, None when it can. Symbolic
+        and hard links are checked against their `target` too, so no path written later leads outside of `dst`.
+    """
+    if not is_safe_path(name):
+        return "path points outside of extracted directory"
+    if _through_symlink(dst, name):
+        return "path goes through symbolic link"
+    if type_ == 'symlink' and not _is_safe_symlink(dst, name, target):
+        return "symbolic link points outside of extracted directory"
+    if type_ == 'link' and (not is_safe_path(target) or _through_symlink(dst, target)):
+        return "hard link points outside of extracted directory"
+
+    return None
+
+
+def _through_symlink(dst: Path, name: str) -> bool:
+    parents = Path(name).parts[:-1]
+
+    return any(dst.joinpath(*parents[:idx]).is_symlink() for idx in range(1, len(parents) + 1))
+
+
+def _is_safe_symlink(dst: Path, name: str, target: str) -> bool:
+    if os.path.isabs(target):
+        return False
+
+    # `..` is resolved only against directories, which are extracted already or are created for the link itself,
+    # after symbolic link it would go elsewhere
+    parents = Path(name).parent.parts
+    parts = []  # type: List[str]
+    for part in Path(name).parent.joinpath(target).parts:
+        if part != '..':
+            parts.append(part)
+            continue
+        if not parts:
+            return False
+        current = dst.joinpath(*parts)
+        if current.is_symlink() or not (current.is_dir() or tuple(parts) == parents[:len(parts)]):
+            return False
+        parts.pop()
+
+    return True
+
+
+def clone_file(src: Path, dst: Path) -> None:
+    with src.open('rb') as src_file, dst.open('wb') as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            return
+        except OSError:
+            pass
+
+        shutil.copyfileobj(src_file, dst_file, _CHUNK_SIZE)
+
+
+def clone_tree(src: Path, dst: Path) -> None:
+    """Clones content of `src` directory into `dst`, file by file with reflink when possible."""
+    for dir_name, _, file_names in os.walk(str(src)):
+        target_dir = dst / os.path.relpath(dir_name, str(src))
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for file_name in file_names:
+            source = Path(dir_name) / file_name
+            target = target_dir / file_name
+            clone_file(source, target)
+            shutil.copymode(str(source), str(target))
@@ -0,0 +1,207 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Workspace garbage collection. Every prepared version takes space of its archive (not kept by streaming prepare
+    without `keep_archive`), extracted directory and data snapshots. `CacheManager` keeps workspace under byte
+    quota by evicting least recently used versions.
+"""
+
+import logging
+from pathlib import Path
+import re
+import shutil
+import time
+from typing import Iterable, List, NamedTuple, Optional
+
+from .blobstore import BlobStore
+from .catalog import Release
+from .package import _VersionDir, AnyVersion, Version
+from .utils import tree_size
+
+logger = logging.getLogger(__name__)
+
+# accessed_at - unix time of last prepare which used the version, sizes in bytes
+CacheEntry = NamedTuple('CacheEntry', [('version', AnyVersion), ('path', Path), ('accessed_at', float), ('archive_size', int), ('extracted_size', int),
+                                       ('snapshots_size', int)])
+
+DEFAULT_MIN_IDLE = 60.0
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$', re.IGNORECASE)
+
+
+class CacheManager:
+    """
+        Keeps size of workspace used by `PackageManager` under `quota` bytes. When it's exceeded, archives of
+        versions which are extracted are removed first, least recently used first, because prepare doesn't need them.
+        If that isn't enough, whole least recently used versions are removed.
+
+        It's safe to run it next to preparers in other threads and processes: versions whose lock is held are
+        skipped, and so are versions used in the last `min_idle` seconds, whose binaries may be about to start.
+        With `blob_store` blobs no longer linked from any extracted directory are pruned after eviction.
+    """
+    def __init__(self, workspace_dir: Path, quota: Optional[int] = None, min_idle: float = DEFAULT_MIN_IDLE, blob_store: Optional[BlobStore] = None):
+        self._workspace_dir = workspace_dir
+        self._quota = quota
+        self._min_idle = min_idle
+        self._blob_store = blob_store
+
+    def entries(self) -> List[CacheEntry]:
+        """Prepared versions, least recently used first."""
+        if not self._workspace_dir.is_dir():
+            return []
+
+        entries = []
+        for path in self._workspace_dir.iterdir():
+            version = _version(path)
+            if version is not None:
+                entry = self._entry(_VersionDir(self._workspace_dir, version, archive_filename=None))
+                if entry is not None:
+                    entries.append(entry)
+
+        return sorted(entries, key=lambda entry: entry.accessed_at)
+
+    def usage(self) -> int:
+        return sum(_size(entry) for entry in self.entries())
+
+    def collect(self, quota: Optional[int] = None, keep: Iterable[AnyVersion] = ()) -> int:
+        """
+            Evicts least recently used packages until workspace fits in `quota` (quota given to constructor by default).
+            Versions in `keep` are never evicted. Returns number of freed bytes.
+        """
+        quota = quota if quota is not None else self._quota
+        if quota is None:
+            raise ValueError("Cache quota is not set")
+
+        entries = self.entries()
+        usage = sum(_size(entry) for entry in entries)
+        if usage <= quota:
+            return 0
+
+        # predefined version and catalog release of the same number share version dir
+        kept = {version.version for version in keep}
+        idle_before = time.time() - self._min_idle
+        candidates = [entry for entry in entries if entry.version.version not in kept and entry.accessed_at <= idle_before]
+        logger.info("Workspace {path} takes {usage} bytes, quota is {quota} bytes".format(path=self._workspace_dir, usage=usage, quota=quota))
+
+        freed = 0
+        for entry in candidates:
+            if usage - freed <= quota:
+                break
+            if entry.archive_size and entry.extracted_size:
+                freed += self._drop_archive(entry.version)
+
+        for entry in candidates:
+            if usage - freed <= quota:
+                break
+            freed += self._remove(entry.version, idle_before)
+
+        if usage - freed > quota:
+            logger.warning("Workspace {path} still takes {usage} bytes, other versions are in use".format(path=self._workspace_dir, usage=usage - freed))
+        if freed and self._blob_store is not None:
+            logger.info("Pruned {size} bytes of unused blobs".format(size=self._blob_store.prune()))
+
+        return freed
+
+    def drop_archives(self, versions: Optional[Iterable[AnyVersion]] = None) -> int:
+        """Removes archives of extracted `versions` (all by default), regardless of quota. Returns number of freed bytes."""
+        selected = {version.version for version in versions} if versions is not None else None
+
+        return sum(self._drop_archive(entry.version) for entry in self.entries()
+                   if entry.archive_size and entry.extracted_size and (selected is None or entry.version.version in selected))
+
+    def _entry(self, version_dir: _VersionDir) -> Optional[CacheEntry]:
+        accessed_at = version_dir.accessed_at
+        if accessed_at is None:
+            return None
+
+        metadata = version_dir.read_metadata()
+        archive_path = version_dir.path / metadata.download_filename if metadata.download_filename else None
+        archive_size = archive_path.stat().st_size if archive_path and archive_path.is_file() else 0
+
+        extracted_dir = version_dir.path / metadata.install_dirname if metadata.install_dirname else None
+        if extracted_dir is None or not extracted_dir.is_dir():
+            extracted_size = 0
+        elif metadata.extract_size is not None:
+            extracted_size = metadata.extract_size
+        else:
+            # prepared before sizes were recorded
+            extracted_size = tree_size(extracted_dir)
+
+        return CacheEntry(version=version_dir.version, path=version_dir.path, accessed_at=accessed_at, archive_size=archive_size,
+                          extracted_size=extracted_size, snapshots_size=tree_size(version_dir.snapshots_dir))
+
+    def _drop_archive(self, version: AnyVersion) -> int:
+        version_dir = _VersionDir(self._workspace_dir, version, archive_filename=None)
+        with version_dir.try_lock() as held:
+            if not held:
+                return 0
+
+            # metadata isn't saved, it would count as access; next download sees that archive is missing
+            metadata = version_dir.read_metadata()
+            if not metadata.download_filename or not metadata.install_dirname:
+                return 0
+            archive_path = version_dir.path / metadata.download_filename
+            if not archive_path.is_file():
+                return 0
+
+            size = archive_path.stat().st_size
+            logger.info("Removing archive {path} ({size} bytes)".format(path=archive_path, size=size))
+            archive_path.unlink()
+
+            return size
+
+    def _remove(self, version: AnyVersion, idle_before: float) -> int:
+        version_dir = _VersionDir(self._workspace_dir, version, archive_filename=None)
+        with version_dir.try_lock() as held:
+            # used since entries were listed
+            if not held or (version_dir.accessed_at or 0.0) > idle_before:
+                return 0
+
+            entry = self._entry(version_dir)
+            size = _size(entry) if entry else 0
+            logger.info("Evicting {version} from workspace ({size} bytes)".format(version=version.version, size=size))
+            shutil.rmtree(str(version_dir.path), ignore_errors=True)
+
+            return size
+
+
+def parse_size(size: str) -> int:
+    """Parses size like `500M`, `2G` or `1.5GiB` (powers of 1024) or plain number of bytes."""
+    match = _SIZE_RE.match(size)
+    if not match:
+        raise ValueError("Invalid size: {size}".format(size=size))
+
+    number, unit = match.groups()
+
+    return int(float(number) * 1024 ** 'bkmgt'.index(unit.lower() or 'b'))
+
+
+def _size(entry: CacheEntry) -> int:
+    return entry.archive_size + entry.extracted_size + entry.snapshots_size
+
+
+def _version(path: Path) -> Optional[AnyVersion]:
+    if path.name.startswith('.') or not path.is_dir():
+        return None
+
+    try:
+        return Version(path.name)
+    except ValueError:
+        pass
+
+    try:
+        return Release(path.name)
+    except ValueError:
+        return None
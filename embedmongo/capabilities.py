@@ -0,0 +1,190 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Command line options supported by binaries of a package, parsed from their `--help` output. Index is built when
+    package is extracted and kept in version metadata (see `PackageManager.capabilities()`), so launchers check
+    options before the process is started instead of finding out from failed startup.
+"""
+
+from concurrent import futures
+import logging
+import os
+from pathlib import Path
+import re
+import subprocess
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple  # noqa: F401
+
+from .exceptions import UnsupportedOptionException
+
+logger = logging.getLogger(__name__)
+
+ARG_NONE = 'none'
+ARG_REQUIRED = 'required'
+ARG_OPTIONAL = 'optional'
+
+# executables of packages which aren't MongoDB tools
+EXCLUDED_BINARIES = {'install_compass'}
+
+# option lines of boost program_options help, e.g. `  -f [ --config ] arg`, `  --port arg`, `  -v [ --verbose ] [=arg(=v)]`
+_OPTION_RE = re.compile(r'^\s{1,8}(?:-\w+ \[ )?--(?P<name>[A-Za-z][\w.-]*)(?: \])?(?P<arg> arg| \[=arg[^\]]*\])?(?=\s|$)')
+
+# options renamed between releases (old name, new name, renamed values), binary gets the one it supports
+_RENAMED = [
+    ('sslMode', 'tlsMode', {'allowSSL': 'allowTLS', 'preferSSL': 'preferTLS', 'requireSSL': 'requireTLS'}),
+    ('sslPEMKeyFile', 'tlsCertificateKeyFile', {}),
+    ('sslPEMKeyPassword', 'tlsCertificateKeyFilePassword', {}),
+    ('sslCAFile', 'tlsCAFile', {}),
+    ('sslCRLFile', 'tlsCRLFile', {}),
+    ('sslAllowInvalidCertificates', 'tlsAllowInvalidCertificates', {}),
+    ('sslAllowInvalidHostnames', 'tlsAllowInvalidHostnames', {}),
+    ('sslDisabledProtocols', 'tlsDisabledProtocols', {}),
+]  # type: List[Tuple[str, str, Dict[str, str]]]
+
+# options removed with feature they turned off or tuned (journal is always on, MMAPv1 engine is gone), releases without them fail to start
+_OBSOLETE = {'nojournal', 'smallfiles', 'noprealloc'}
+
+
+class Capabilities:
+    """
+        Options of package `version` binaries: binary name -> option name (without `--`) -> kind of its argument
+        (`ARG_NONE`, `ARG_REQUIRED` or `ARG_OPTIONAL`). Binaries which couldn't be run are mapped to None and
+        arguments of them aren't checked.
+    """
+    def __init__(self, version: str, options: Dict[str, Optional[Dict[str, str]]]):
+        self.version = version
+        self._options = options
+
+    @staticmethod
+    def probe(version: str, bin_dir: Path, binaries: Optional[Iterable[str]] = None, max_workers: Optional[int] = None) -> 'Capabilities':
+        """Runs `--help` of `binaries` (all executables in `bin_dir` by default) in parallel and indexes their options."""
+        outputs = help_outputs(bin_dir, binaries, max_workers)
+
+        return Capabilities(version, {name: parse_help(output) if output is not None else None for name, output in outputs.items()})
+
+    @property
+    def binaries(self) -> List[str]:
+        return sorted(self._options)
+
+    def options(self, binary: str = 'mongod') -> Optional[Dict[str, str]]:
+        """Options of `binary` with kinds of their arguments, None when it wasn't indexed."""
+        options = self._options.get(binary, None)
+
+        return dict(options) if options is not None else None
+
+    def supports(self, option: str, binary: str = 'mongod') -> bool:
+        """Whether `binary` accepts `option` (`--port` or `port`). Options of binaries which weren't indexed are assumed to be supported."""
+        options = self._options.get(binary, None)
+
+        return options is None or option.lstrip('-') in options
+
+    def check(self, args: Sequence[str], binary: str = 'mongod') -> List[str]:
+        """
+            Returns `args` for `binary` of this version. Options renamed between releases (e.g. `--sslMode` and
+            `--tlsMode`) are translated to the name it supports. Raises `UnsupportedOptionException` for options
+            removed before this version (e.g. `--nojournal`). Other options missing from `--help` are passed as they
+            are with a warning, because some options are hidden from it.
+        """
+        options = self._options.get(binary, None)
+        if options is None:
+            return list(args)
+
+        checked = []  # type: List[str]
+        idx = 0
+        while idx < len(args):
+            arg = args[idx]
+            idx += 1
+            if not arg.startswith('--'):
+                checked.append(arg)
+                continue
+
+            name, sep, value = arg[2:].partition('=')
+            values = {}  # type: Dict[str, str]
+            if name not in options:
+                name, values = self._translate(binary, options, name)
+
+            checked.append('--' + name + sep + values.get(value, value))
+            # value given as separate argument isn't option
+            if not sep and options.get(name, None) == ARG_REQUIRED and idx < len(args):
+                checked.append(values.get(args[idx], args[idx]))
+                idx += 1
+
+        return checked
+
+    def to_dict(self) -> Dict[str, Optional[Dict[str, str]]]:
+        return {name: dict(options) if options is not None else None for name, options in self._options.items()}
+
+    def _translate(self, binary: str, options: Dict[str, str], name: str) -> Tuple[str, Dict[str, str]]:
+        for old, new, values in _RENAMED:
+            if name == old and new in options:
+                logger.debug("Option --{old} of {binary} {version} translated to --{new}".format(old=old, binary=binary, version=self.version, new=new))
+                return new, values
+            if name == new and old in options:
+                logger.debug("Option --{new} of {binary} {version} translated to --{old}".format(new=new, binary=binary, version=self.version, old=old))
+                return old, {new_value: old_value for old_value, new_value in values.items()}
+
+        if name in _OBSOLETE:
+            raise UnsupportedOptionException("Option --{name} isn't supported by {binary} {version}".format(name=name, binary=binary, version=self.version),
+                                             option=name)
+
+        logger.warning("Option --{name} isn't listed by {binary} {version} --help, it's passed as is".format(name=name, binary=binary, version=self.version))
+        return name, {}
+
+
+def parse_help(output: str) -> Dict[str, str]:
+    """Options listed in `--help` output of MongoDB binary with kinds of their arguments."""
+    options = {}
+    for line in output.splitlines():
+        match = _OPTION_RE.match(line)
+        if match is None:
+            continue
+
+        arg = match.group('arg')
+        options[match.group('name')] = ARG_NONE if arg is None else ARG_REQUIRED if arg == ' arg' else ARG_OPTIONAL
+
+    return options
+
+
+def executables(bin_dir: Path) -> List[str]:
+    """Names of MongoDB binaries in `bin_dir`."""
+    if not bin_dir.is_dir():
+        return []
+
+    return sorted(path.name for path in bin_dir.iterdir()
+                  if path.is_file() and os.access(str(path), os.X_OK) and path.name not in EXCLUDED_BINARIES)
+
+
+def help_outputs(bin_dir: Path, binaries: Optional[Iterable[str]] = None, max_workers: Optional[int] = None,
+                 timeout: float = 30.0) -> Dict[str, Optional[str]]:
+    """
+        Runs `--help` of `binaries` in `bin_dir` concurrently, returns output by binary name. It's None for binaries
+        which couldn't be run, e.g. built for other architecture.
+    """
+    names = sorted(binaries) if binaries is not None else executables(bin_dir)
+    if not names:
+        return {}
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers or min(len(names), 2 * (os.cpu_count() or 1))) as executor:
+        outputs = executor.map(lambda name: _help_output(bin_dir / name, timeout), names)
+
+        return dict(zip(names, outputs))
+
+
+def _help_output(binary: Path, timeout: float) -> Optional[str]:
+    try:
+        return subprocess.run([str(binary), '--help'], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              universal_newlines=True, timeout=timeout).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning("Can't run {binary} --help: {error}".format(binary=binary, error=e))
+        return None
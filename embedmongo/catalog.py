@@ -0,0 +1,317 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Catalog of MongoDB releases built from `full.json` feed published by MongoDB, or from its local copy. It covers
+    releases which predefined `Version` doesn't know. Feed is parsed once into compact index, which is cached on
+    disk with ETag of the feed, so later processes load the index and revalidate it only when it's older than TTL.
+"""
+
+import functools
+import json
+import logging
+from pathlib import Path
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple  # noqa: F401
+from urllib.parse import unquote, urlparse
+
+import requests
+
+from .exceptions import DownloadFileException, PackageNotFoundException
+from .locks import FileLock
+from .mirrors import Location
+from .system import normalize_architecture
+from .utils import download_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_URL = 'https://downloads.mongodb.org/full.json'
+DEFAULT_CATALOG_TTL = 24 * 60 * 60.0
+
+_VERSION_RE = re.compile(r'^(\d+)\.(\d+)\.(\d+)(?:-([0-9A-Za-z.-]+))?$')
+_PATTERN_RE = re.compile(r'^(\d+)(?:\.(\d+|[xX*]))?(?:\.(\d+|[xX*]))?$')
+_OPERATOR_RE = re.compile(r'^(>=|<=|==|!=|>|<|=)?(.+)$')
+
+_INDEX_FORMAT = 1
+
+
+@functools.total_ordering
+class Release:
+    """
+        MongoDB release, e.g. `Release('5.0.3')`. It can be used wherever `Version` is, but any release published in
+        catalog can be prepared. Releases are ordered by semantic version, release candidates before final release.
+    """
+    # releases are immutable, unlike `*_LATEST` builds of `Version`
+    is_latest = False
+
+    def __init__(self, version: str):
+        match = _VERSION_RE.match(version)
+        if not match:
+            raise ValueError("Invalid release version: {version}".format(version=version))
+
+        major, minor, patch, prerelease = match.groups()
+        self.version = version
+        self.numbers = (int(major), int(minor), int(patch))
+        self.prerelease = prerelease  # type: Optional[str]
+        self._key = self.numbers + ((0, _natural_key(prerelease)) if prerelease else (1, ()),)  # type: Tuple[Any, ...]
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Release) and self._key == other._key
+
+    def __lt__(self, other: object) -> bool:
+        if not isinstance(other, Release):
+            return NotImplemented
+        return self._key < other._key
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __repr__(self) -> str:
+        return 'Release({version!r})'.format(version=self.version)
+
+
+# os_type and filename follow upstream repository layout `<repo_url>/<os_type>/<filename>`, target is build
+# platform from feed (e.g. `ubuntu1804`, `osx`), edition one of `base`, `targeted`, `enterprise`
+CatalogEntry = NamedTuple('CatalogEntry', [('release', Release), ('os_type', str), ('arch', str), ('edition', str), ('target', str), ('url', str),
+                                           ('filename', str), ('sha256', Optional[str])])
+
+# download as it's kept in cached index: os_type, arch, edition, target, url, sha256
+_Row = List[Any]
+
+
+class _Index:
+    """Releases newest first. Downloads of a release are turned into entries on its first lookup."""
+    def __init__(self, releases: List[Dict[str, Any]]):
+        self.releases = []  # type: List[Tuple[Release, bool]]
+        self._rows = {}  # type: Dict[Release, List[_Row]]
+        self._entries = {}  # type: Dict[Release, Dict[Tuple[str, str, str], List[CatalogEntry]]]
+        self._lock = threading.Lock()
+
+        for data in releases:
+            try:
+                release = Release(data['version'])
+            except ValueError:
+                continue
+            self.releases.append((release, bool(data['production'])))
+            self._rows[release] = data['downloads']
+        self.releases.sort(reverse=True)
+
+    def downloads(self, release: Release, os_type: str, arch: str, edition: str) -> List[CatalogEntry]:
+        entries = self._entries.get(release, None)
+        if entries is None:
+            entries = {}
+            for os_name, arch_name, edition_name, target, url, sha256 in self._rows.get(release, []):
+                # feed calls 64-bit ARM `aarch64` for Linux and `arm64` for macOS
+                arch_name = normalize_architecture(arch_name)
+                entry = CatalogEntry(release=release, os_type=os_name, arch=arch_name, edition=edition_name, target=target, url=url,
+                                     filename=url.rsplit('/', 1)[-1], sha256=sha256)
+                entries.setdefault((os_name, arch_name, edition_name), []).append(entry)
+            with self._lock:
+                entries = self._entries.setdefault(release, entries)
+
+        return entries.get((os_type, arch, edition), [])
+
+
+class ReleaseCatalog:
+    """
+        Index of releases published in MongoDB `full.json` feed, keyed by release, OS, architecture and edition.
+        Nothing is loaded until first lookup, later lookups don't touch network or disk.
+    """
+    def __init__(self, source: Location = DEFAULT_CATALOG_URL, cache_dir: Optional[Path] = None, ttl: float = DEFAULT_CATALOG_TTL):
+        """
+            `source` - URL of the feed, or path (or `file://` URL) of its local copy, which is read as it is.
+            Index of feed downloaded from URL is cached in `cache_dir` and feed is revalidated with its ETag when
+            cached index is older than `ttl` seconds. Without `cache_dir` feed is downloaded by every process.
+        """
+        self._source = source
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self._index = None  # type: Optional[_Index]
+        self._lock = threading.Lock()
+
+    def releases(self, production_only: bool = False) -> List[Release]:
+        """Releases in catalog, newest first. `production_only` skips release candidates and development releases."""
+        return [release for release, production in self._loaded().releases if production or not production_only]
+
+    def lookup(self, release: Release, os_type: str, arch: str, edition: str = 'base', target: Optional[str] = None) -> Optional[CatalogEntry]:
+        """Archive of `release` built for given platform, any `target` of it when it's not given."""
+        for entry in self._loaded().downloads(release, os_type, arch, edition):
+            if target is None or entry.target == target:
+                return entry
+
+        return None
+
+    def find(self, release: Release, os_type: str, arch: str, targets: Sequence[str] = ()) -> Optional[CatalogEntry]:
+        """
+            Best archive of `release` for a system. Builds for distribution `targets` (see `OSInfo.targets()`) are
+            preferred in their order, generic build of `os_type` is used when there's none of them.
+        """
+        for target in targets:
+            entry = self.lookup(release, os_type, arch, edition='targeted', target=target)
+            if entry is not None:
+                return entry
+
+        return self.lookup(release, os_type, arch)
+
+    def resolve(self, spec: str, os_type: Optional[str] = None, arch: Optional[str] = None, targets: Sequence[str] = ()) -> Release:
+        """
+            Newest release matching `spec`, which has archive for `os_type` and `arch` when they're given (see `find()`).
+            Spec is exact release (`4.0.5`, `5.0.0-rc1`), wildcard (`4.4.x`, `4.x`, `4.4`) or comparisons like `>=4.2,<5`.
+            Only exact spec matches release candidates and development releases.
+        """
+        matches, exact = parse_spec(spec)
+        for release, production in self._loaded().releases:
+            if not (production or exact) or not matches(release):
+                continue
+            if os_type is None or arch is None or self.find(release, os_type, arch, targets) is not None:
+                return release
+
+        raise PackageNotFoundException("No release matching {spec} found in catalog".format(spec=spec))
+
+    def refresh(self) -> None:
+        """Revalidates cached index with the feed regardless of TTL."""
+        index = self._load(force=True)
+        with self._lock:
+            self._index = index
+
+    def _loaded(self) -> _Index:
+        with self._lock:
+            if self._index is None:
+                self._index = self._load(force=False)
+
+            return self._index
+
+    def _load(self, force: bool) -> _Index:
+        source = self._source
+        if isinstance(source, Path) or '://' not in source or source.startswith('file://'):
+            path = Path(unquote(urlparse(source).path)) if isinstance(source, str) and source.startswith('file://') else Path(source)
+            return _Index(_feed_releases(json.loads(path.read_text())))
+
+        if self._cache_dir is None:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                download_file(source, Path(tmp_dir) / 'full.json')
+                return _Index(_feed_releases(json.loads((Path(tmp_dir) / 'full.json').read_text())))
+
+        with FileLock.get(self._cache_dir / '.lock').hold():
+            return _Index(self._cached_releases(source, self._cache_dir, force))
+
+    def _cached_releases(self, url: str, cache_dir: Path, force: bool) -> List[Dict[str, Any]]:
+        index_path = cache_dir / 'index.json'
+        cached = json.loads(index_path.read_text()) if index_path.exists() else None
+        if cached is not None and (cached.get('format') != _INDEX_FORMAT or cached.get('url') != url):
+            cached = None
+        if cached is not None and not force and time.time() - cached['checked_at'] < self._ttl:
+            return cached['releases']
+
+        feed_path = cache_dir / 'full.json'
+        try:
+            result = download_file(url, feed_path, etag=cached['etag'] if cached else None)
+        except (requests.RequestException, DownloadFileException) as e:
+            if cached is None:
+                raise
+            logger.warning("Release catalog couldn't be revalidated, cached one is used: {error}".format(error=e))
+            return cached['releases']
+
+        if result.saved or cached is None:
+            logger.info("Indexing release catalog {url}".format(url=url))
+            releases = _feed_releases(json.loads(feed_path.read_text()))
+            feed_path.unlink()
+        else:
+            releases = cached['releases']
+
+        tmp_path = index_path.with_name(index_path.name + '.tmp')
+        tmp_path.write_text(json.dumps({'format': _INDEX_FORMAT, 'url': url, 'etag': result.etag, 'checked_at': time.time(), 'releases': releases}))
+        tmp_path.replace(index_path)
+
+        return releases
+
+
+def parse_spec(spec: str) -> Tuple[Callable[[Release], bool], bool]:
+    """Returns predicate of releases matching `spec` (see `ReleaseCatalog.resolve()`) and whether spec is exact release."""
+    clauses = re.sub(r'(>=|<=|==|!=|>|<|=)\s+', r'\1', spec.strip()).replace(',', ' ').split()
+    if not clauses:
+        raise ValueError("Empty release spec")
+    if clauses in (['latest'], ['*'], ['x']):
+        return (lambda release: True), False
+
+    predicates = []
+    exact = False
+    for clause in clauses:
+        predicate, clause_exact = _parse_clause(clause)
+        predicates.append(predicate)
+        exact = exact or clause_exact
+
+    return (lambda release: all(predicate(release) for predicate in predicates)), exact
+
+
+def _parse_clause(clause: str) -> Tuple[Callable[[Release], bool], bool]:
+    match = _OPERATOR_RE.match(clause)
+    assert match is not None
+    operator, version = match.groups()
+
+    if operator in (None, '=', '==') and _VERSION_RE.match(version):
+        exact_release = Release(version)
+        return (lambda release: release == exact_release), True
+
+    pattern = _PATTERN_RE.match(version)
+    if not pattern:
+        raise ValueError("Invalid release spec: {clause}".format(clause=clause))
+    prefix = tuple(int(part) for part in pattern.groups() if part is not None and part.isdigit())
+    if any(part is not None and not part.isdigit() for part in pattern.groups()[:len(prefix)]):
+        raise ValueError("Invalid release spec: {clause}".format(clause=clause))
+
+    if operator in (None, '=', '=='):
+        return (lambda release: release.numbers[:len(prefix)] == prefix), False
+
+    bound = (prefix + (0, 0, 0))[:3]
+    compare = {
+        '!=': lambda numbers: numbers[:len(prefix)] != prefix,
+        '>': lambda numbers: numbers[:len(prefix)] > prefix,
+        '>=': lambda numbers: numbers >= bound,
+        '<': lambda numbers: numbers < bound,
+        '<=': lambda numbers: numbers[:len(prefix)] <= prefix,
+    }[operator]  # type: Callable[[Tuple[int, ...]], bool]
+
+    return (lambda release: compare(release.numbers)), False
+
+
+def _feed_releases(feed: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Compacts feed to archives of every release, which is all that's kept in cached index."""
+    releases = []
+    for data in feed.get('versions', []):
+        downloads = []
+        for download in data.get('downloads', []):
+            url = (download.get('archive') or {}).get('url', None)
+            if not url:
+                continue
+            downloads.append([_os_type(url), download.get('arch', ''), download.get('edition', ''), download.get('target', ''), url,
+                              download['archive'].get('sha256', None)])
+        releases.append({'version': data['version'], 'production': bool(data.get('production_release', False)), 'downloads': downloads})
+
+    return releases
+
+
+def _os_type(url: str) -> str:
+    # e.g. https://fastdl.mongodb.org/linux/mongodb-linux-x86_64-ubuntu1804-4.2.8.tgz
+    parts = urlparse(url).path.strip('/').split('/')
+
+    return parts[-2] if len(parts) > 1 else ''
+
+
+def _natural_key(value: str) -> Tuple[Tuple[int, Any], ...]:
+    # rc10 comes after rc9
+    return tuple((0, int(part)) if part.isdigit() else (1, part) for part in re.findall(r'\d+|\D+', value))
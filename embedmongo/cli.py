@@ -0,0 +1,124 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Command line interface.
+
+    Usage:
+    embedmongo mirror DEST_DIR [--os linux] [--version 4.0.5] [--repo-url URL] [--workers N]
+    embedmongo cache WORKSPACE_DIR [--quota 2G] [--drop-archives]
+"""
+
+import argparse
+from concurrent import futures
+import logging
+from pathlib import Path
+import time
+from typing import List, Optional, Sequence  # noqa: F401
+
+from .cache import CacheManager, parse_size
+from .downloader import Downloader
+from .package import ExternalPackage, PackageDiscovery, Version
+
+logger = logging.getLogger(__name__)
+
+
+def mirror(dst_dir: Path, os_types: Optional[Sequence[str]] = None, versions: Optional[Sequence[Version]] = None,
+           repo_url: str = "http://downloads.mongodb.org", workers: int = 4, downloader: Optional[Downloader] = None) -> List[ExternalPackage]:
+    """
+        Populates local repository `dst_dir` (usable as `mirrors` entry or served over HTTP) with predefined packages.
+        Files already mirrored are downloaded again only when they changed upstream. Downloads are verified against
+        upstream `.sha256` files and every mirrored file gets its own `.sha256`, so mirror clients verify them too.
+        Returns packages which failed.
+    """
+    packages = [pkg for pkg in PackageDiscovery(repo_url).known_packages(os_types) if versions is None or pkg.version in versions]
+    downloader = downloader or Downloader(pool_size=workers)
+
+    def download(pkg: ExternalPackage) -> None:
+        dst = dst_dir / pkg.os_type / pkg.filename
+        etag_path = dst.with_name(dst.name + '.etag')
+
+        checksum_path = dst.with_name(dst.name + '.sha256')
+        dst.parent.mkdir(parents=True, exist_ok=True)
+
+        etag = etag_path.read_text() if dst.exists() and etag_path.exists() and checksum_path.exists() else None
+        result = downloader.download(pkg.url, dst, etag, expected_sha256=downloader.checksum(pkg.url))
+        if result.sha256:
+            checksum_path.write_text('{digest}  {filename}\n'.format(digest=result.sha256, filename=pkg.filename))
+        if result.etag:
+            etag_path.write_text(result.etag)
+        logger.info("{filename}: {status}".format(filename=pkg.filename, status='downloaded' if result.saved else 'up to date'))
+
+    failed = []  # type: List[ExternalPackage]
+    with futures.ThreadPoolExecutor(workers) as pool:
+        jobs = {pool.submit(download, pkg): pkg for pkg in packages}
+        for job in futures.as_completed(jobs):
+            if job.exception():
+                logger.error("{filename}: {error}".format(filename=jobs[job].filename, error=job.exception()))
+                failed.append(jobs[job])
+
+    return failed
+
+
+def cache(workspace_dir: Path, quota: Optional[int] = None, drop_archives: bool = False) -> List[str]:
+    """Evicts packages from workspace according to options and returns lines describing what's left in it."""
+    manager = CacheManager(workspace_dir, quota)
+    if drop_archives:
+        manager.drop_archives()
+    if quota is not None:
+        manager.collect()
+
+    lines = []
+    for entry in manager.entries():
+        lines.append('{version:16} {archive:>12} {extracted:>12} {snapshots:>12}  used {ago:.0f}s ago'.format(
+            version=entry.version.version,
+            archive=entry.archive_size,
+            extracted=entry.extracted_size,
+            snapshots=entry.snapshots_size,
+            ago=time.time() - entry.accessed_at
+        ))
+    lines.append('total: {usage} bytes'.format(usage=manager.usage()))
+
+    return lines
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='embedmongo')
+    commands = parser.add_subparsers(dest='command')
+
+    mirror_parser = commands.add_parser('mirror', help='populate local package repository')
+    mirror_parser.add_argument('dst_dir', type=Path, help='repository directory')
+    mirror_parser.add_argument('--os', dest='os_types', action='append', help='OS type (linux, osx), may be repeated, default: all')
+    mirror_parser.add_argument('--version', dest='versions', action='append', type=Version, help='version (e.g. 4.0.5), may be repeated, default: all')
+    mirror_parser.add_argument('--repo-url', default="http://downloads.mongodb.org", help='upstream repository')
+    mirror_parser.add_argument('--workers', type=int, default=4, help='parallel downloads')
+
+    cache_parser = commands.add_parser('cache', help='show and limit size of workspace')
+    cache_parser.add_argument('workspace_dir', type=Path, help='workspace directory')
+    cache_parser.add_argument('--quota', type=parse_size, help='evict least recently used packages above this size, e.g. 2G')
+    cache_parser.add_argument('--drop-archives', action='store_true', help='remove archives of extracted packages')
+
+    args = parser.parse_args(argv)
+    if args.command not in ('mirror', 'cache'):
+        parser.print_help()
+        return 2
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.command == 'cache':
+        print('\n'.join(cache(args.workspace_dir, args.quota, args.drop_archives)))
+        return 0
+
+    failed = mirror(args.dst_dir, args.os_types, args.versions, args.repo_url, args.workers)
+
+    return 1 if failed else 0
@@ -12,23 +12,257 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+from concurrent import futures
+import logging
+import os
 import pathlib
+import threading
 import typing
 
 
-from .package import PackageDiscovery, PackageManager, Version
+from .blobstore import BlobStore
+from .cache import CacheManager
+from .capabilities import Capabilities
+from .catalog import DEFAULT_CATALOG_URL, Release, ReleaseCatalog
+from .downloader import Downloader, DownloadStats
+from .mirrors import Location
+from .package import AnyVersion, DEFAULT_REVALIDATE_TTL, LocalPackage, PackageDiscovery, PackageManager, Revalidate
+from .process import MongodLauncher, MongodProcess
+from .registry import InstanceRegistry
+from .snapshot import DataSnapshots, Seed
+
+logger = logging.getLogger(__name__)
+
+PrepareResult = typing.NamedTuple('PrepareResult', [('version', AnyVersion), ('bin_dir', typing.Optional[pathlib.Path]),
+                                                    ('error', typing.Optional[BaseException])])
 
 
 class EmbedMongo:
-    def __init__(self, workspace_dir: typing.Union[str, pathlib.Path] = pathlib.Path.home() / ".pyembedmongo"):
+    _DEFAULT_DOWNLOAD_WORKERS = 4
+
+    def __init__(self, workspace_dir: typing.Union[str, pathlib.Path] = pathlib.Path.home() / ".pyembedmongo", streaming: bool = False,
+                 keep_archive: bool = False, downloader: typing.Optional[Downloader] = None, blob_store: typing.Optional[BlobStore] = None,
+                 revalidate: Revalidate = Revalidate.TTL, revalidate_ttl: float = DEFAULT_REVALIDATE_TTL, mirrors: typing.Sequence[Location] = (),
+                 checksums: typing.Optional[typing.Mapping[str, str]] = None, verify_checksums: bool = True, cache_quota: typing.Optional[int] = None,
+                 catalog: Location = DEFAULT_CATALOG_URL):
+        """
+            With `streaming` packages are extracted while they're downloaded. Archives are then kept in workspace
+            only with `keep_archive`.
+
+            All downloads share one `downloader` and its connection pool. With `blob_store` identical files of all
+            versions (and of all workspaces using the same store) are kept on disk once.
+
+            Prepared versions are reused without network round trip according to `revalidate` policy: by default
+            pinned releases are never checked again and `*_LATEST` builds once per `revalidate_ttl` seconds.
+
+            Packages are downloaded from the fastest of `mirrors` (local directories, `file://` or HTTP URLs) which
+            has them, with failover to other mirrors and upstream repository.
+
+            Archives are verified against SHA-256 from pinned `checksums` (filename to digest, see `utils.parse_checksums`)
+            or from `.sha256` files published next to them, unless `verify_checksums` is False.
+
+            With `cache_quota` (bytes) least recently used versions are evicted from workspace after every prepare
+            which changed it, until it fits in quota (see `CacheManager`).
+
+            Releases other than predefined `Version` are prepared as `Release` found in `catalog`, MongoDB release feed
+            or its local copy. Feed is fetched on first use and revalidated like `*_LATEST` packages.
+
+            Ports of started instances are leased from instance registry (`registry` property), which lives in workspace
+            and is shared by all processes using it. Pass it to `MongodPool`, `ReplicaSet` or `ShardedCluster` to do the
+            same for them.
+
+            Nothing is checked or created on disk here, package manager, registry and cache are set up on first use.
+        """
         if isinstance(workspace_dir, str):
             workspace_dir = pathlib.Path(workspace_dir)
 
         self._workspace_dir = workspace_dir
+        self._streaming = streaming
+        self._keep_archive = keep_archive
+        self._revalidate = revalidate
+        self._revalidate_ttl = revalidate_ttl
+        self._downloader = downloader or Downloader()
+        self._blob_store = blob_store
+        self._mirrors = mirrors
+        self._checksums = checksums
+        self._verify_checksums = verify_checksums
+        self._cache_quota = cache_quota
+        self._catalog = catalog
+
+        self._lock = threading.Lock()
+        self._lazy_discovery = None  # type: typing.Optional[PackageDiscovery]
+        self._lazy_manager = None  # type: typing.Optional[PackageManager]
+        self._lazy_registry = None  # type: typing.Optional[InstanceRegistry]
+        self._lazy_cache = None  # type: typing.Optional[CacheManager]
+
+    @property
+    def download_stats(self) -> DownloadStats:
+        return self._downloader.stats
+
+    @property
+    def registry(self) -> InstanceRegistry:
+        with self._lock:
+            if self._lazy_registry is None:
+                self._lazy_registry = InstanceRegistry(self._workspace_dir / '.instances')
+
+            return self._lazy_registry
+
+    @property
+    def _discovery(self) -> PackageDiscovery:
+        with self._lock:
+            if self._lazy_discovery is None:
+                catalog_ttl = {Revalidate.ALWAYS: 0.0, Revalidate.NEVER: float('inf')}.get(self._revalidate, self._revalidate_ttl)
+                release_catalog = ReleaseCatalog(self._catalog, cache_dir=self._workspace_dir / '.catalog', ttl=catalog_ttl)
+                self._lazy_discovery = PackageDiscovery(mirrors=self._mirrors, catalog=release_catalog, downloader=self._downloader)
+
+            return self._lazy_discovery
+
+    @property
+    def _manager(self) -> PackageManager:
+        with self._lock:
+            if self._lazy_manager is None:
+                self._lazy_manager = PackageManager(self._workspace_dir, downloader=self._downloader, blob_store=self._blob_store,
+                                                    checksums=self._checksums, verify_checksums=self._verify_checksums)
+
+            return self._lazy_manager
+
+    @property
+    def _cache(self) -> typing.Optional[CacheManager]:
+        if self._cache_quota is None:
+            return None
+
+        with self._lock:
+            if self._lazy_cache is None:
+                self._lazy_cache = CacheManager(self._workspace_dir, self._cache_quota, blob_store=self._blob_store)
+
+            return self._lazy_cache
+
+    def resolve(self, spec: str) -> Release:
+        """Newest release matching `spec`, e.g. `4.4.x` or `>=5.0,<6`, which can be prepared on this system."""
+        return self._discovery.resolve(spec)
+
+    def prepare(self, version: AnyVersion, components: typing.Optional[typing.Iterable[str]] = None) -> pathlib.Path:
+        """
+            Returns `bin` directory of `version`, downloading and extracting it when needed. With `components`
+            (e.g. `{'mongod'}`) only these binaries are installed, which is much faster than whole package.
+        """
+        components = set(components) if components is not None else None
+
+        manager = self._manager
+        bin_dir = manager.installed(version, self._revalidate, self._revalidate_ttl, components=components)
+        if bin_dir is not None:
+            return bin_dir
+
+        package = self._discovery.create(version)
+        if self._streaming:
+            bin_dir = manager.download_and_extract(package, keep_archive=self._keep_archive, components=components)
+        else:
+            bin_dir = manager.extract(manager.download(package), components=components)
+
+        self._collect_garbage([version])
+
+        return bin_dir
+
+    def capabilities(self, version: AnyVersion, components: typing.Optional[typing.Iterable[str]] = None) -> Capabilities:
+        """Prepares `version` and returns options supported by its binaries, see `Capabilities`."""
+        self.prepare(version, components)
+
+        return self._manager.capabilities(version) or Capabilities(version.version, {})
+
+    def start(self, version: AnyVersion, port: typing.Optional[int] = None, dbpath: typing.Optional[pathlib.Path] = None,
+              args: typing.Sequence[str] = (), timeout: float = 30.0, snapshot: typing.Optional[str] = None,
+              seed: typing.Optional[Seed] = None, components: typing.Optional[typing.Iterable[str]] = None, ram: bool = False) -> MongodProcess:
+        """
+            Prepares `version` and starts mongod from it. See `MongodLauncher.start()` for arguments, `ram` starts
+            RAM backed instance (see `MongodLauncher`). `args` are checked against capabilities of the version.
+
+            With `snapshot` name, dbpath is cloned from golden data directory initialized once per version and name,
+            optionally with fixture data loaded by `seed` (see `DataSnapshots.golden()`). It skips storage engine bootstrap.
+            `components` are passed to `prepare()`.
+        """
+        bin_dir = self.prepare(version, components)
+
+        golden = None
+        if snapshot is not None:
+            golden = self.snapshots(version, bin_dir).golden(snapshot, seed=seed, args=args, timeout=timeout)
+
+        launcher = MongodLauncher(bin_dir, self.registry, ram, self._manager.capabilities(version))
+
+        return launcher.start(port=port, dbpath=dbpath, args=args, timeout=timeout, snapshot=golden)
+
+    def snapshots(self, version: AnyVersion, bin_dir: typing.Optional[pathlib.Path] = None) -> DataSnapshots:
+        """Golden data directories of `version`, it's prepared first unless its `bin_dir` is given."""
+        return self._manager.snapshots(version, bin_dir or self.prepare(version, components={'mongod'}))
+
+    def prepare_many(self, versions: typing.Iterable[AnyVersion], max_workers: typing.Optional[int] = None,
+                     components: typing.Optional[typing.Iterable[str]] = None) -> typing.List[PrepareResult]:
+        """
+            Prepare several versions at once. Downloads run in a pool of `max_workers` threads and every finished
+            download is handed over to a separate extraction pool, so network and disk work overlap.
+
+            Errors don't stop other versions. Result for each version is returned in the order of `versions`.
+            `components` are installed for every version, see `prepare()`.
+        """
+        components = set(components) if components is not None else None
+        versions = list(collections.OrderedDict.fromkeys(versions))
+        if not versions:
+            return []
+
+        download_workers = max_workers or min(len(versions), self._DEFAULT_DOWNLOAD_WORKERS)
+        extract_workers = min(download_workers, os.cpu_count() or 1)
+
+        manager = self._manager
+        results = {}  # type: typing.Dict[AnyVersion, PrepareResult]
+
+        def download(version: AnyVersion) -> typing.Union[LocalPackage, pathlib.Path]:
+            bin_dir = manager.installed(version, self._revalidate, self._revalidate_ttl, components=components)
+            if bin_dir is not None:
+                return bin_dir
+
+            package = self._discovery.create(version)
+            if self._streaming:
+                return manager.download_and_extract(package, keep_archive=self._keep_archive, components=components)
+
+            return manager.download(package)
+
+        with futures.ThreadPoolExecutor(download_workers) as download_pool, futures.ThreadPoolExecutor(extract_workers) as extract_pool:
+            downloads = {download_pool.submit(download, version): version for version in versions}
+            extracts = {}  # type: typing.Dict[futures.Future[pathlib.Path], AnyVersion]
+
+            for download_future in futures.as_completed(downloads):
+                version = downloads[download_future]
+                error = download_future.exception()
+                result = None if error else download_future.result()
+                if error:
+                    logger.error("Preparing {version} failed on download: {error}".format(version=version.version, error=error))
+                    results[version] = PrepareResult(version=version, bin_dir=None, error=error)
+                elif isinstance(result, LocalPackage):
+                    extracts[extract_pool.submit(manager.extract, result, components)] = version
+                else:
+                    # streaming mode or prepared before, package is already extracted
+                    results[version] = PrepareResult(version=version, bin_dir=result, error=None)
+
+            for extract_future in futures.as_completed(extracts):
+                version = extracts[extract_future]
+                error = extract_future.exception()
+                if error:
+                    logger.error("Preparing {version} failed on extract: {error}".format(version=version.version, error=error))
+                    results[version] = PrepareResult(version=version, bin_dir=None, error=error)
+                else:
+                    results[version] = PrepareResult(version=version, bin_dir=extract_future.result(), error=None)
+
+        self._collect_garbage(versions)
+
+        return [results[version] for version in versions]
 
-    def prepare(self, version: Version) -> None:
-        package = PackageDiscovery().create(version)
+    def _collect_garbage(self, keep: typing.Iterable[AnyVersion]) -> None:
+        cache = self._cache
+        if cache is None:
+            return
 
-        manager = PackageManager(self._workspace_dir)
-        local_pkg = manager.download(package)
-        manager.extract(local_pkg)
+        try:
+            cache.collect(keep=keep)
+        except OSError as e:
+            # prepared packages are fine, eviction is retried after next prepare
+            logger.warning("Workspace garbage collection failed: {error}".format(error=e))
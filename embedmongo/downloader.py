@@ -0,0 +1,153 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http import HTTPStatus
+import io
+import logging
+from pathlib import Path
+import threading
+from typing import Any, NamedTuple, Optional, Tuple, Union
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter, Retry
+from requests.structures import CaseInsensitiveDict
+
+from .blobstore import BlobStore
+from .extract import Include
+from .utils import download_and_extract, download_file, DownloadResult, fetch_checksum
+
+logger = logging.getLogger(__name__)
+
+DownloadStats = NamedTuple('DownloadStats', [('requests', int), ('not_modified', int), ('bytes_downloaded', int), ('bytes_saved', int)])
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    def __init__(self, timeout: Timeout, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._timeout = timeout
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:  # type: ignore
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self._timeout
+
+        return super().send(request, **kwargs)
+
+
+class _FileAdapter(BaseAdapter):
+    """Serves `file://` URLs, so local directory can be used as package mirror. ETag is derived from file size and mtime."""
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:  # type: ignore
+        response = requests.Response()
+        response.url = request.url or ''
+        response.request = request
+
+        path = Path(unquote(urlparse(response.url).path))
+        if not path.is_file():
+            return self._respond(response, HTTPStatus.NOT_FOUND, io.BytesIO(b'File not found'))
+
+        stat = path.stat()
+        etag = '"{mtime:x}-{size:x}"'.format(mtime=int(stat.st_mtime), size=stat.st_size)
+        response.headers = CaseInsensitiveDict({'ETag': etag})
+        if request.headers.get('If-None-Match') == etag:
+            return self._respond(response, HTTPStatus.NOT_MODIFIED, io.BytesIO())
+
+        response.headers['Content-Length'] = str(stat.st_size)
+        if request.method == 'HEAD':
+            return self._respond(response, HTTPStatus.OK, io.BytesIO())
+
+        return self._respond(response, HTTPStatus.OK, path.open('rb'))
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def _respond(response: requests.Response, status: HTTPStatus, body: Any) -> requests.Response:
+        response.status_code = status.value
+        response.reason = status.phrase
+        response.raw = body
+
+        return response
+
+
+class Downloader:
+    """
+        Downloads files over one shared `requests.Session`, so keep-alive connections are reused between packages.
+        It's safe to use one instance from many threads at once. `file://` URLs are read from local filesystem.
+
+        `pool_size` - max number of kept connections per host,
+        `retries`, `backoff_factor` - retry policy for failed connections and 5xx responses,
+        `timeout` - connect and read timeout in seconds.
+    """
+    def __init__(self, pool_size: int = 10, retries: int = 3, backoff_factor: float = 0.5, timeout: Timeout = (10.0, 60.0)):
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(500, 502, 503, 504), raise_on_status=False)
+        adapter = _TimeoutHTTPAdapter(timeout, pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.mount('file://', _FileAdapter())
+
+        self._stats_lock = threading.Lock()
+        self._stats = DownloadStats(requests=0, not_modified=0, bytes_downloaded=0, bytes_saved=0)
+
+    @property
+    def stats(self) -> DownloadStats:
+        return self._stats
+
+    def download(self, url: str, dst: Path, etag: Optional[str] = None, part_etag: Optional[str] = None, segments: int = 1,
+                 expected_sha256: Optional[str] = None) -> DownloadResult:
+        result = download_file(url, dst, etag, part_etag=part_etag, segments=segments, session=self._session, expected_sha256=expected_sha256)
+        self._record(result, dst.stat().st_size if not result.saved and dst.exists() else 0)
+
+        return result
+
+    def download_and_extract(self, url: str, dst: Path, strip_level: int = 0, etag: Optional[str] = None, archive_copy: Optional[Path] = None,
+                             cached_size: int = 0, blob_store: Optional[BlobStore] = None, include: Include = None,
+                             expected_sha256: Optional[str] = None) -> DownloadResult:
+        """`cached_size` - size of archive already extracted to `dst`, reported as saved when server responds with 304."""
+        result = download_and_extract(url, dst, strip_level, etag, archive_copy=archive_copy, session=self._session, blob_store=blob_store,
+                                      include=include, expected_sha256=expected_sha256)
+        self._record(result, cached_size if not result.saved else 0)
+
+        return result
+
+    def exists(self, url: str, timeout: Optional[Timeout] = None) -> bool:
+        """Whether file at `url` is available, by HEAD request. Unreachable server is reported as missing file."""
+        try:
+            with self._session.head(url, timeout=timeout, allow_redirects=True) as response:
+                return response.ok
+        except requests.RequestException as e:
+            logger.debug("{url} unreachable: {error}".format(url=url, error=e))
+            return False
+
+    def checksum(self, url: str) -> Optional[str]:
+        """SHA-256 published for `url` in `<url>.sha256` sidecar, None when there's none."""
+        return fetch_checksum(url, self._session)
+
+    def close(self) -> None:
+        self._session.close()
+
+    def _record(self, result: DownloadResult, bytes_saved: int) -> None:
+        with self._stats_lock:
+            self._stats = DownloadStats(
+                requests=self._stats.requests + 1,
+                not_modified=self._stats.not_modified + (0 if result.saved else 1),
+                bytes_downloaded=self._stats.bytes_downloaded + result.size,
+                bytes_saved=self._stats.bytes_saved + bytes_saved
+            )
+
+        if not result.saved:
+            logger.debug('Not modified, {size} bytes saved'.format(size=bytes_saved))
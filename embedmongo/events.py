@@ -0,0 +1,186 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Structured events of downloads, extraction and mongod startup. Listeners subscribed to `hooks` are called
+    synchronously, in thread which emitted event, so they should be quick. Events aren't even created when nobody
+    listens. `PrometheusMetrics` and `OpenTelemetrySpans` adapt them to metrics and tracing.
+
+        metrics = PrometheusMetrics()
+        hooks.subscribe(metrics)
+        ...
+        print(metrics.exposition())
+"""
+
+import logging
+from pathlib import Path
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# total - size from Content-Length (None when unknown), resumed_from - bytes of interrupted download kept on disk
+DownloadStarted = NamedTuple('DownloadStarted', [('url', str), ('filename', str), ('total', Optional[int]), ('resumed_from', int)])
+# emitted at most every `Hooks.progress_interval` seconds, received - bytes received so far, rate - bytes per second
+DownloadProgress = NamedTuple('DownloadProgress', [('url', str), ('filename', str), ('received', int), ('total', Optional[int]), ('rate', float)])
+# size - bytes received, not_modified - server responded with 304, then there is no DownloadStarted
+DownloadFinished = NamedTuple('DownloadFinished', [('url', str), ('filename', str), ('size', int), ('duration', float), ('rate', float),
+                                                   ('not_modified', bool)])
+# received - bytes of the file received so far, they're kept when error is IncompleteDownloadException
+DownloadFailed = NamedTuple('DownloadFailed', [('url', str), ('filename', str), ('received', int), ('error', str)])
+# source - archive path or url of streamed archive, files - number of regular files written, archive_size - bytes of archive read
+ExtractFinished = NamedTuple('ExtractFinished', [('source', str), ('dst', Path), ('files', int), ('archive_size', int), ('duration', float)])
+# binary - mongod or mongos, startup_time - from process start until it accepted connections
+MongodStarted = NamedTuple('MongodStarted', [('binary', str), ('address', str), ('pid', int), ('startup_time', float)])
+
+Listener = Callable[[Any], None]
+
+
+class Hooks:
+    """
+        Registry of event listeners. Listener may be limited to some event types, e.g.
+        `hooks.subscribe(print, DownloadFinished)`. Errors raised by listeners are logged and don't stop the pipeline.
+
+        `progress_interval` - min number of seconds between DownloadProgress events of one download.
+    """
+    def __init__(self, progress_interval: float = 1.0):
+        self.progress_interval = progress_interval
+        self._lock = threading.Lock()
+        # replaced on every change, so `emit()` reads it without lock
+        self._listeners = ()  # type: Tuple[Tuple[Listener, Tuple[type, ...]], ...]
+
+    @property
+    def active(self) -> bool:
+        """True when there is any listener. Check it before building event in hot code."""
+        return bool(self._listeners)
+
+    def subscribe(self, listener: Listener, *event_types: type) -> Listener:
+        """Calls `listener` with every event of `event_types` (all events when none given). Returns `listener`."""
+        with self._lock:
+            self._listeners += ((listener, event_types),)
+
+        return listener
+
+    def unsubscribe(self, listener: Listener) -> None:
+        with self._lock:
+            self._listeners = tuple((subscribed, types) for subscribed, types in self._listeners if subscribed != listener)
+
+    def emit(self, event: Any) -> None:
+        for listener, event_types in self._listeners:
+            if event_types and not isinstance(event, event_types):
+                continue
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Event listener {listener} failed on {event}".format(listener=listener, event=type(event).__name__))
+
+
+hooks = Hooks()
+
+
+class PrometheusMetrics:
+    """
+        Listener keeping Prometheus-style counters of all events. `counters` returns their current values,
+        `exposition()` renders them in Prometheus text format, e.g. for textfile collector or push gateway.
+    """
+    _HELP = {
+        'embedmongo_downloads_total': 'Package downloads, not_modified="true" when cached package was up to date.',
+        'embedmongo_download_bytes_total': 'Bytes received from package servers.',
+        'embedmongo_download_seconds_total': 'Time spent downloading packages.',
+        'embedmongo_extractions_total': 'Extracted archives.',
+        'embedmongo_extracted_files_total': 'Files written by extraction.',
+        'embedmongo_extract_seconds_total': 'Time spent extracting archives.',
+        'embedmongo_process_starts_total': 'Started mongod and mongos processes.',
+        'embedmongo_process_startup_seconds_total': 'Time from process start until it accepted connections.',
+    }
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = {}  # type: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]
+
+    @property
+    def counters(self) -> Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]:
+        """Counter values by (name, labels)."""
+        with self._lock:
+            return dict(self._counters)
+
+    def value(self, name: str, **labels: str) -> float:
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0.0)
+
+    def __call__(self, event: Any) -> None:
+        if isinstance(event, DownloadFinished):
+            self._inc('embedmongo_downloads_total', 1, not_modified='true' if event.not_modified else 'false')
+            self._inc('embedmongo_download_bytes_total', event.size)
+            self._inc('embedmongo_download_seconds_total', event.duration)
+        elif isinstance(event, ExtractFinished):
+            self._inc('embedmongo_extractions_total', 1)
+            self._inc('embedmongo_extracted_files_total', event.files)
+            self._inc('embedmongo_extract_seconds_total', event.duration)
+        elif isinstance(event, MongodStarted):
+            self._inc('embedmongo_process_starts_total', 1, binary=event.binary)
+            self._inc('embedmongo_process_startup_seconds_total', event.startup_time, binary=event.binary)
+
+    def exposition(self) -> str:
+        lines = []
+        counters = self.counters
+        for name in sorted({name for name, _ in counters}):
+            lines.append('# HELP {name} {help}'.format(name=name, help=self._HELP[name]))
+            lines.append('# TYPE {name} counter'.format(name=name))
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    label_text = ','.join('{key}="{label}"'.format(key=key, label=label) for key, label in labels)
+                    lines.append('{name}{labels} {value!r}'.format(name=name, labels='{' + label_text + '}' if labels else '', value=float(value)))
+
+        return '\n'.join(lines) + '\n'
+
+    def _inc(self, name: str, amount: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+
+class OpenTelemetrySpans:
+    """
+        Listener recording finished downloads, extractions and process starts as spans of OpenTelemetry `tracer`
+        (e.g. `opentelemetry.trace.get_tracer(__name__)`). Spans are created when operation ends, with start time
+        moved back by its duration. Any object with the same `start_span()`/`end()` API works as tracer.
+    """
+    def __init__(self, tracer: Any):
+        self._tracer = tracer
+
+    def __call__(self, event: Any) -> None:
+        if isinstance(event, DownloadFinished):
+            self._record('embedmongo.download', event.duration, {
+                'http.url': event.url,
+                'embedmongo.filename': event.filename,
+                'embedmongo.bytes': event.size,
+                'embedmongo.not_modified': event.not_modified,
+            })
+        elif isinstance(event, ExtractFinished):
+            self._record('embedmongo.extract', event.duration, {
+                'embedmongo.source': event.source,
+                'embedmongo.files': event.files,
+                'embedmongo.archive_bytes': event.archive_size,
+            })
+        elif isinstance(event, MongodStarted):
+            self._record('embedmongo.{binary}.start'.format(binary=event.binary), event.startup_time, {
+                'net.peer.name': event.address,
+                'process.pid': event.pid,
+            })
+
+    def _record(self, name: str, duration: float, attributes: Dict[str, Any]) -> None:
+        end_time = int(time.time() * 1e9)
+        span = self._tracer.start_span(name, start_time=end_time - int(duration * 1e9), attributes=attributes)
+        span.end(end_time=end_time)
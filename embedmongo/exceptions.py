@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import typing
+
 
 class EmbedMongoException(Exception):
     """General module exception."""
@@ -31,3 +33,44 @@ class InvalidOSException(EmbedMongoException):
 
 class DownloadFileException(EmbedMongoException):
     """Errors when file couldn't be downloaded."""
+
+
+class IncompleteDownloadException(DownloadFileException):
+    """Download was interrupted. Partial file is kept, so download can be resumed."""
+    def __init__(self, msg: str, etag: typing.Optional[str] = None):
+        super().__init__(msg)
+        self.etag = etag
+
+
+class ChecksumMismatchException(DownloadFileException):
+    """Downloaded or cached package doesn't match its published or pinned SHA-256 checksum."""
+
+
+class MongodStartException(EmbedMongoException):
+    """mongod process couldn't be started or didn't become ready."""
+
+
+class UnsupportedOptionException(MongodStartException):
+    """Option passed to mongod or mongos isn't supported by binary of its version."""
+    def __init__(self, msg: str, option: str):
+        super().__init__(msg)
+        self.option = option
+
+
+class MongoCommandException(EmbedMongoException):
+    """Command sent to mongod failed."""
+    def __init__(self, msg: str, code: typing.Optional[int] = None):
+        super().__init__(msg)
+        self.code = code
+
+
+class MongodPoolException(EmbedMongoException):
+    """Errors of mongod instances pool, e.g. lease timeout."""
+
+
+class TopologyException(EmbedMongoException):
+    """Replica set or sharded cluster couldn't be brought up."""
+
+
+class InstanceRegistryException(EmbedMongoException):
+    """Port couldn't be allocated or registry doesn't know instance."""
@@ -0,0 +1,213 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Single pass tar extraction. Archive is read sequentially (gzip can't be inflated in parallel), while extracted
+    files are written by thread pool, so decompression and disk writes overlap.
+"""
+
+from concurrent import futures
+import fnmatch
+import logging
+import os
+from pathlib import Path
+import shutil
+import tarfile
+import threading
+from typing import IO, Iterable, List, Optional, Sequence  # noqa: F401
+
+from .blobstore import member_type, unsafe_reason
+
+logger = logging.getLogger(__name__)
+
+# files bigger than this are written while they're read, smaller ones are handed over to writer threads
+_MAX_PENDING_BYTES = 64 * 1024 * 1024
+_MAX_WORKERS = 4
+_CHUNK_SIZE = 1024 * 1024
+
+Include = Optional[Sequence[str]]
+
+
+class MemberFilter:
+    """
+        Selects archive members by `include` glob patterns, e.g. `['bin/mongod', 'bin/mongo']`. Pattern matches
+        member path (after stripping) or any of its parent directories. Everything is selected without `include`.
+    """
+    def __init__(self, include: Include = None):
+        self._patterns = list(include) if include is not None else None
+        # literal paths of files, when all of them are found rest of archive doesn't have to be read
+        self._missing = {pattern for pattern in self._patterns or () if not any(char in pattern for char in '*?[')}
+        self._complete = self._patterns is not None and len(self._missing) == len(self._patterns)
+
+    def __call__(self, name: str) -> bool:
+        if self._patterns is None:
+            return True
+
+        parts = name.split('/')
+        candidates = ['/'.join(parts[:idx]) for idx in range(1, len(parts) + 1)]
+
+        return any(fnmatch.fnmatchcase(candidate, pattern) for pattern in self._patterns for candidate in candidates)
+
+    def found(self, member: tarfile.TarInfo) -> None:
+        if not member.isdir():
+            self._missing.discard(member.name)
+
+    @property
+    def done(self) -> bool:
+        """True when every file named literally in `include` has been found."""
+        return self._complete and not self._missing
+
+
+class _ByteBudget:
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int) -> None:
+        with self._condition:
+            while self._used and self._used + size > self._limit:
+                self._condition.wait()
+            self._used += size
+
+    def release(self, size: int) -> None:
+        with self._condition:
+            self._used -= size
+            self._condition.notify_all()
+
+
+class _FileWriter:
+    """Writes file contents in thread `pool`. Failed write is raised from next call."""
+    def __init__(self, pool: futures.ThreadPoolExecutor, max_pending: int):
+        self._pool = pool
+        self._max_pending = max_pending
+        self._budget = _ByteBudget(max_pending)
+        self._pending = []  # type: List[futures.Future[None]]
+
+    def write(self, path: Path, fileobj: IO[bytes], member: tarfile.TarInfo) -> None:
+        self._pending = [future for future in self._pending if not _finished(future)]
+        if member.size > self._max_pending:
+            _write_stream(path, fileobj, member)
+            return
+
+        data = fileobj.read()
+        self._budget.acquire(len(data))
+        self._pending.append(self._pool.submit(_write_data, path, data, member, self._budget))
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+
+def extract_members(tar: tarfile.TarFile, dst: Path, members: Iterable[tarfile.TarInfo], include: Include = None,
+                    workers: Optional[int] = None, max_pending: int = _MAX_PENDING_BYTES) -> List[tarfile.TarInfo]:
+    """
+        Extracts already stripped `members` of `tar` (opened in stream mode, e.g. 'r|gz') to `dst` in one pass.
+        Only members selected by `include` are written (see `MemberFilter`) and reading stops as soon as all files
+        named in `include` are found. File contents up to `max_pending` bytes in total wait in memory for writers.
+
+        Returns extracted members.
+    """
+    selected = MemberFilter(include)
+    extracted = []  # type: List[tarfile.TarInfo]
+    dst.mkdir(parents=True, exist_ok=True)
+
+    with futures.ThreadPoolExecutor(workers or min(_MAX_WORKERS, os.cpu_count() or 1)) as pool:
+        writer = _FileWriter(pool, max_pending)
+        for member in members:
+            if not selected(member.name):
+                continue
+
+            reason = unsafe_reason(dst, member.name, member_type(member), member.linkname)
+            if reason is not None:
+                logger.warning("Skipping {name}: {reason}".format(name=member.name, reason=reason))
+                continue
+
+            if _extract_member(tar, dst, member, writer):
+                extracted.append(member)
+                selected.found(member)
+                if selected.done:
+                    logger.debug("All included members found. Skipping rest of archive.")
+                    break
+
+        writer.flush()
+
+    # directories are updated last, writing files would change their mtime
+    for member in reversed(extracted):
+        if member.isdir():
+            _set_attributes(dst / member.name, member)
+
+    return extracted
+
+
+def _extract_member(tar: tarfile.TarFile, dst: Path, member: tarfile.TarInfo, writer: _FileWriter) -> bool:
+    path = dst / member.name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if member.isfile():
+        fileobj = tar.extractfile(member)
+        assert fileobj is not None
+        writer.write(path, fileobj, member)
+    elif member.isdir():
+        path.mkdir(exist_ok=True)
+    elif member.issym():
+        _remove(path)
+        os.symlink(member.linkname, str(path))
+    elif member.islnk():
+        # link target may be still waiting for writer
+        writer.flush()
+        _remove(path)
+        os.link(str(dst / member.linkname), str(path))
+    else:
+        logger.debug("Skipping {name}: unsupported member type".format(name=member.name))
+        return False
+
+    return True
+
+
+def _finished(future: 'futures.Future[None]') -> bool:
+    if not future.done():
+        return False
+
+    # failed write stops extraction
+    future.result()
+
+    return True
+
+
+def _write_data(path: Path, data: bytes, member: tarfile.TarInfo, budget: _ByteBudget) -> None:
+    try:
+        _remove(path)
+        with path.open('wb') as f:
+            f.write(data)
+        _set_attributes(path, member)
+    finally:
+        budget.release(len(data))
+
+
+def _write_stream(path: Path, fileobj: IO[bytes], member: tarfile.TarInfo) -> None:
+    _remove(path)
+    with path.open('wb') as f:
+        shutil.copyfileobj(fileobj, f, _CHUNK_SIZE)
+    _set_attributes(path, member)
+
+
+def _set_attributes(path: Path, member: tarfile.TarInfo) -> None:
+    os.chmod(str(path), member.mode)
+    os.utime(str(path), (member.mtime, member.mtime))
+
+
+def _remove(path: Path) -> None:
+    if path.is_symlink() or path.is_file():
+        path.unlink()
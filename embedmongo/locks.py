@@ -0,0 +1,137 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import fcntl
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Dict, Iterator, Optional  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """
+        Reentrant lock shared by threads of this process and, through advisory `flock` on `path`, by other processes.
+        Use `FileLock.get()`, so all threads of a process share one instance per file.
+
+        Lock file is never removed, because process which opened removed file would lock other inode than the rest.
+    """
+    _instances = {}  # type: Dict[Path, FileLock]
+    _instances_guard = threading.Lock()
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None  # type: Optional[int]
+
+    @classmethod
+    def get(cls, path: Path) -> 'FileLock':
+        path.parent.mkdir(parents=True, exist_ok=True)
+        key = path.resolve()
+        with cls._instances_guard:
+            return cls._instances.setdefault(key, FileLock(key))
+
+    def acquire(self) -> bool:
+        """Blocks until lock is held. Returns True when it had to wait for other thread or process."""
+        waited = not self._thread_lock.acquire(blocking=False)
+        if waited:
+            self._thread_lock.acquire()
+
+        try:
+            if self._depth == 0:
+                waited = self._lock_file() or waited
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+        self._depth += 1
+
+        return waited
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    @contextlib.contextmanager
+    def hold(self) -> Iterator[bool]:
+        """Context manager variant of `acquire()`/`release()`, yields whether it had to wait."""
+        waited = self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    @contextlib.contextmanager
+    def try_hold(self) -> Iterator[bool]:
+        """Holds lock only if it's free (or held by this thread already), yields whether it's held. Never waits."""
+        if not self._thread_lock.acquire(blocking=False):
+            yield False
+            return
+
+        try:
+            held = self._depth > 0 or self._try_lock_file()
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        if not held:
+            self._thread_lock.release()
+            yield False
+            return
+
+        self._depth += 1
+        try:
+            yield True
+        finally:
+            self.release()
+
+    def _lock_file(self) -> bool:
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                waited = False
+            except BlockingIOError:
+                logger.info("Waiting for lock {path} held by other process".format(path=self.path))
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                waited = True
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self._fd = fd
+
+        return waited
+
+    def _try_lock_file(self) -> bool:
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self._fd = fd
+
+        return True
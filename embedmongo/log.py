@@ -1,37 +0,0 @@
-# Copyright 2018 Karol Horowski
-#
-# Licensed under the Apache License, Version 2.0 (the "License");
-# you may not use this file except in compliance with the License.
-# You may obtain a copy of the License at
-#
-#   http://www.apache.org/licenses/LICENSE-2.0
-#
-# Unless required by applicable law or agreed to in writing, software
-# distributed under the License is distributed on an "AS IS" BASIS,
-# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
-# See the License for the specific language governing permissions and
-# limitations under the License.
-
-import io
-import logging
-import typing
-
-
-class TqdmToLogger(io.StringIO):
-    """
-        Output stream for TQDM which will output to logger module instead of
-        the StdOut.
-    """
-    def __init__(self, logger: 'logging.Logger', level: typing.Optional[int] = None):
-        super().__init__()
-        self.logger = logger
-        self.level = level or logging.INFO
-        self.buf = ''
-
-    def write(self, buf: str) -> int:
-        self.buf = buf.strip('\r\n\t ')
-
-        return len(buf)
-
-    def flush(self) -> None:
-        self.logger.log(self.level, self.buf)
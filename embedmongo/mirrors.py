@@ -0,0 +1,106 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Package sources: upstream repository, HTTP mirrors and local directories (`file://`). All of them share
+    upstream layout, `<repo_url>/<os_type>/<filename>`, so mirror can be served by any static HTTP server.
+"""
+
+from concurrent import futures
+import logging
+from pathlib import Path
+import time
+from typing import Dict, List, Optional, Sequence, Union  # noqa: F401
+
+from .downloader import Downloader
+
+logger = logging.getLogger(__name__)
+
+Location = Union[str, Path]
+
+
+class PackageSource:
+    """Repository of packages at `url` (http://, https:// or file://)."""
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+
+    @staticmethod
+    def create(location: Location) -> 'PackageSource':
+        """Source from URL or local directory path."""
+        if isinstance(location, Path) or '://' not in location:
+            return PackageSource(Path(location).resolve().as_uri())
+
+        return PackageSource(location)
+
+    @property
+    def is_local(self) -> bool:
+        return self.url.startswith('file://')
+
+    def package_url(self, os_type: str, filename: str) -> str:
+        return '{url}/{os_type}/{filename}'.format(url=self.url, os_type=os_type, filename=filename)
+
+    def probe(self, os_type: str, filename: str, downloader: Downloader, timeout: float) -> Optional[float]:
+        """Returns response time in seconds when package is available in this source, None otherwise."""
+        start_time = time.monotonic()
+        if not downloader.exists(self.package_url(os_type, filename), timeout):
+            return None
+
+        return time.monotonic() - start_time
+
+    def __repr__(self) -> str:
+        return 'PackageSource({url!r})'.format(url=self.url)
+
+
+class SourceChain:
+    """
+        Orders sources for one package. Sources which have the package are sorted by response time, local ones
+        come first in practice. Unavailable sources are kept at the end, so download can still fail over to them.
+        Single source isn't probed at all.
+
+        Probes go through `downloader` session and their results are kept for lifetime of the chain, so every
+        package is probed once.
+    """
+    def __init__(self, sources: Sequence[PackageSource], probe_timeout: float = 2.0, downloader: Optional[Downloader] = None):
+        if not sources:
+            raise ValueError("At least one package source is required")
+
+        self.sources = list(sources)
+        self._probe_timeout = probe_timeout
+        self._downloader = downloader or Downloader()
+        # package URL to response time of its source, None when package isn't there
+        self._latencies = {}  # type: Dict[str, Optional[float]]
+
+    def urls(self, os_type: str, filename: str) -> List[str]:
+        if len(self.sources) == 1:
+            return [self.sources[0].package_url(os_type, filename)]
+
+        latencies = self._probe(os_type, filename)
+
+        available = sorted((latency, idx) for idx, latency in enumerate(latencies) if latency is not None)
+        unavailable = [idx for idx, latency in enumerate(latencies) if latency is None]
+        for latency, idx in available:
+            logger.debug("Source {url} responded in {time:.3f}s".format(url=self.sources[idx].url, time=latency))
+
+        return [self.sources[idx].package_url(os_type, filename) for idx in [idx for _, idx in available] + unavailable]
+
+    def _probe(self, os_type: str, filename: str) -> List[Optional[float]]:
+        urls = [source.package_url(os_type, filename) for source in self.sources]
+        not_probed = [source for source, url in zip(self.sources, urls) if url not in self._latencies]
+        if not_probed:
+            with futures.ThreadPoolExecutor(len(not_probed)) as pool:
+                latencies = pool.map(lambda source: source.probe(os_type, filename, self._downloader, self._probe_timeout), not_probed)
+                for source, latency in zip(not_probed, latencies):
+                    self._latencies[source.package_url(os_type, filename)] = latency
+
+        return [self._latencies[url] for url in urls]
@@ -12,16 +12,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import enum
 import json
 import logging
+import os
 from pathlib import Path
 import shutil
-from typing import Any, Dict, NamedTuple, Optional
-
-from .exceptions import PackageNotFoundException
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Set, Tuple, TypeVar, Union
+
+import requests
+
+from .blobstore import BlobStore
+from .capabilities import Capabilities, executables
+from .catalog import Release, ReleaseCatalog
+from .downloader import Downloader
+from .exceptions import ChecksumMismatchException, DownloadFileException, IncompleteDownloadException, PackageManagerException, PackageNotFoundException
+from .locks import FileLock
+from .mirrors import Location, PackageSource, SourceChain
+from .process import MongodLauncher
+from .snapshot import DataSnapshots
 from .system import OSInfo, WorkingOSGuard
-from .utils import download_file, extract_file
+from .utils import DownloadResult, extract_file, merge_dir, publish_dir, tree_size
 
 logger = logging.getLogger(__name__)
 
@@ -53,9 +66,38 @@ class Version(enum.Enum):
     def __init__(self, version: str):
         self.version = version
 
+    @property
+    def is_latest(self) -> bool:
+        """Latest builds of release series change over time, pinned releases are immutable."""
+        return self.version.endswith('-latest')
+
+
+# predefined version or any release from `ReleaseCatalog`
+AnyVersion = Union[Version, Release]
+
+
+class Revalidate(enum.Enum):
+    """
+        When prepared package is checked against server again. `ALWAYS` - on every prepare, `TTL` - pinned
+        releases never and `*_LATEST` builds when last check is older than TTL, `NEVER` - offline use.
+    """
+    ALWAYS = 'always'
+    TTL = 'ttl'
+    NEVER = 'never'
 
-ExternalPackage = NamedTuple('ExternalPackage', [('version', Version), ('url', str), ('os_type', str), ('filename', str)])
-LocalPackage = NamedTuple('LocalPackage', [('version', Version), ('path', Path), ('new_file', bool)])
+
+DEFAULT_REVALIDATE_TTL = 24 * 60 * 60.0
+
+# names of binaries from package `bin` directory, None stands for whole package
+Components = Optional[Set[str]]
+
+
+# fallback_urls - other sources of the same package, tried in order when download from `url` fails,
+# sha256 - checksum of archive known in advance, e.g. from release catalog
+ExternalPackage = NamedTuple('ExternalPackage', [('version', AnyVersion), ('url', str), ('os_type', str), ('filename', str),
+                                                 ('fallback_urls', Tuple[str, ...]), ('sha256', Optional[str])])
+ExternalPackage.__new__.__defaults__ = ((), None)  # type: ignore
+LocalPackage = NamedTuple('LocalPackage', [('version', AnyVersion), ('path', Path), ('new_file', bool)])
 
 
 class _PkgMetadata:
@@ -68,32 +110,103 @@ class _PkgMetadata:
         self.download_etag = download_data.get('etag', None)
         self.download_url = download_data.get('url', None)
         self.download_filename = download_data.get('filename', None)
+        self.download_part_etag = download_data.get('part_etag', None)
+        self.download_size = download_data.get('size', None)
+        # SHA-256 of archive computed while it was received
+        self.download_sha256 = download_data.get('sha256', None)
+        extract_data = raw_data.get('extract', {})
+        # etag of archive which extracted directory comes from, size of extracted directory in bytes
+        self.extract_etag = extract_data.get('etag', None)
+        self.extract_size = extract_data.get('size', None)
+        # names of binaries extracted to bin directory, None when whole package is extracted
+        components = extract_data.get('components', None)
+        self.installed_components = set(components) if components is not None else None  # type: Components
+        # options of extracted binaries parsed from their --help output (see `Capabilities`)
+        self.extract_capabilities = extract_data.get('capabilities', None)  # type: Optional[Dict[str, Optional[Dict[str, str]]]]
+
+        install_data = raw_data.get('install', {})
+        # unix time of last successful check against server, name of extracted directory ready to use
+        self.install_verified_at = install_data.get('verified_at', None)
+        self.install_dirname = install_data.get('dirname', None)
 
     def to_json(self) -> str:
         return json.dumps({
             'download': {
                 'etag': self.download_etag,
                 'url': self.download_url,
-                'filename': self.download_filename
+                'filename': self.download_filename,
+                'part_etag': self.download_part_etag,
+                'size': self.download_size,
+                'sha256': self.download_sha256
+            },
+            'extract': {
+                'etag': self.extract_etag,
+                'size': self.extract_size,
+                'components': sorted(self.installed_components) if self.installed_components is not None else None,
+                'capabilities': self.extract_capabilities
+            },
+            'install': {
+                'verified_at': self.install_verified_at,
+                'dirname': self.install_dirname
             }
         })
 
 
 class _VersionDir:
     _METADATA_FILENAME = 'metadata.json'
+    _LOCKS_DIRNAME = '.locks'
 
-    def __init__(self, workspace_dir: Path, version: Version, archive_filename: Optional[str]):
+    def __init__(self, workspace_dir: Path, version: AnyVersion, archive_filename: Optional[str]):
         self.version = version
         self.path = workspace_dir / self.version.version
         self.path.mkdir(parents=True, exist_ok=True)
+        # lock file is kept outside of version dir, so it survives `PackageManager.clean()`
+        self.lock_path = workspace_dir / self._LOCKS_DIRNAME / (self.version.version + '.lock')
+        self.snapshots_dir = self.path / 'snapshots'
+        self.metadata_path = self.path / self._METADATA_FILENAME
 
         if archive_filename:
             self.archive_path = self.path / archive_filename
             self.extracted_dir = self.path / self.archive_path.stem
-            self.metadata_path = self.path / self._METADATA_FILENAME
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[bool]:
+        """
+            Serializes access to version dir between threads and processes (e.g. parallel CI jobs sharing workspace).
+            Yields True when lock was held by someone else, so caller may reuse result published meanwhile.
+        """
+        with FileLock.get(self.lock_path).hold() as waited:
+            yield waited
+
+    @contextlib.contextmanager
+    def try_lock(self) -> Iterator[bool]:
+        """Like `lock()`, but doesn't wait when version dir is in use. Yields whether lock is held."""
+        with FileLock.get(self.lock_path).try_hold() as held:
+            yield held
+
+    @property
+    def accessed_at(self) -> Optional[float]:
+        """Last time prepared package was used. It's mtime of metadata file, which is touched by lock-free readers."""
+        try:
+            return self.metadata_path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def touch(self) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(str(self.metadata_path))
+
+    def remove_snapshots(self) -> None:
+        # data files initialized by other build of mongod are outdated
+        if self.snapshots_dir.exists():
+            logger.info("Removing outdated data snapshots {dst}".format(dst=self.snapshots_dir))
+            shutil.rmtree(str(self.snapshots_dir))
 
     def save_metadata(self, metadata: _PkgMetadata) -> None:
-        self.metadata_path.write_text(metadata.to_json())
+        # readers without lock never see partially written file
+        tmp_path = self.metadata_path.with_name(self.metadata_path.name + '.tmp')
+        tmp_path.write_text(metadata.to_json())
+        tmp_path.replace(self.metadata_path)
 
     def read_metadata(self) -> _PkgMetadata:
         if not self.metadata_path.exists():
@@ -112,51 +225,349 @@ class _VersionDir:
         return _VersionDir(workspace_dir, pkg.version, pkg.path.name)
 
 
+def _components(components: Optional[Iterable[str]]) -> Components:
+    if components is None:
+        return None
+
+    wanted = set(components)
+    invalid = sorted(name for name in wanted if not name or '/' in name or name.startswith('.'))
+    if invalid:
+        raise ValueError("Invalid component names: {names}".format(names=', '.join(invalid)))
+
+    return wanted
+
+
+def _union(first: Components, second: Components) -> Components:
+    return None if first is None or second is None else first | second
+
+
+def _covers(installed: Components, wanted: Components) -> bool:
+    return installed is None or (wanted is not None and wanted <= installed)
+
+
+def _include(components: Components) -> Optional[List[str]]:
+    return None if components is None else ['bin/' + name for name in sorted(components)]
+
+
+def _indexed(extracted_dir: Path, metadata: _PkgMetadata) -> bool:
+    return set(executables(extracted_dir / 'bin')) <= set(metadata.extract_capabilities or ())
+
+
+def _index_capabilities(extracted_dir: Path, metadata: _PkgMetadata) -> None:
+    # only binaries added since last extract are run
+    indexed = metadata.extract_capabilities or {}
+    missing = [name for name in executables(extracted_dir / 'bin') if name not in indexed]
+    if missing:
+        probed = Capabilities.probe(extracted_dir.name, extracted_dir / 'bin', missing)
+        metadata.extract_capabilities = dict(indexed, **probed.to_dict())
+
+
+T = TypeVar('T')
+
+
+def _from_any_source(pkg: ExternalPackage, fetch: Callable[[str], T]) -> Tuple[str, T]:
+    """Calls `fetch` with package URLs in order until one succeeds. Returns used URL and its result."""
+    urls = (pkg.url,) + pkg.fallback_urls
+    for idx, url in enumerate(urls):
+        try:
+            return url, fetch(url)
+        except IncompleteDownloadException:
+            # received part is kept and resumed from the same source next time
+            raise
+        except (DownloadFileException, requests.RequestException) as e:
+            if idx == len(urls) - 1:
+                raise
+            logger.warning("Download from {url} failed, trying {next_url}: {error}".format(url=url, next_url=urls[idx + 1], error=e))
+
+    raise AssertionError("unreachable")
+
+
 class PackageManager:
-    def __init__(self, workspace_dir: Path):
+    def __init__(self, workspace_dir: Path, download_segments: int = 1, downloader: Optional[Downloader] = None,
+                 blob_store: Optional[BlobStore] = None, checksums: Optional[Mapping[str, str]] = None, verify_checksums: bool = True):
+        """
+            `download_segments` - number of parallel byte ranges used for downloading large archives,
+            `downloader` - shared HTTP client, new one is created when it's not given,
+            `blob_store` - content-addressed store shared between workspaces, extracted files are linked from it,
+            `checksums` - pinned SHA-256 of archives by filename (see `parse_checksums`), used instead of `.sha256` sidecars,
+            `verify_checksums` - verify archives against pinned or published checksums.
+
+            Checksum is computed while archive is received. Cached archive is verified again only when it's extracted,
+            which reads it anyway. Directories returned by `installed()` are trusted.
+        """
         WorkingOSGuard.ensure_valid_type()
 
         self._workspace_dir = workspace_dir
+        self._download_segments = download_segments
+        self._downloader = downloader or Downloader()
+        self._blob_store = blob_store
+        self._checksums = {filename: digest.lower() for filename, digest in (checksums or {}).items()}
+        self._verify_checksums = verify_checksums
         self._workspace_dir.mkdir(parents=True, exist_ok=True)
 
     def download(self, pkg: ExternalPackage) -> LocalPackage:
         logger.info("Downloading {version} package from {url}".format(version=pkg.version.version, url=pkg.url))
 
         version_dir = _VersionDir.from_ext_package(self._workspace_dir, pkg)
-        metadata = version_dir.read_metadata()
-        if not metadata.download_etag or not version_dir.archive_path.exists():
-            etag = None
-        else:
-            etag = metadata.download_etag
-
-        download_result = download_file(pkg.url, version_dir.archive_path, etag)
-        metadata.download_etag = download_result.etag
-        metadata.download_url = pkg.url
-        metadata.download_filename = pkg.filename
-        version_dir.save_metadata(metadata)
+        with version_dir.lock() as waited:
+            metadata = version_dir.read_metadata()
+            if not metadata.download_etag or not version_dir.archive_path.exists():
+                etag = None
+            elif waited and not metadata.download_part_etag:
+                logger.info("Package {version} was downloaded while waiting for lock. Reusing it.".format(version=pkg.version.version))
+                return LocalPackage(version=pkg.version, path=version_dir.archive_path, new_file=False)
+            else:
+                etag = metadata.download_etag
+
+            def fetch(url: str) -> DownloadResult:
+                expected = self._expected_sha256(pkg, url)
+                return self._downloader.download(url, version_dir.archive_path, self._cached_etag(etag, metadata, expected),
+                                                 part_etag=metadata.download_part_etag, segments=self._download_segments, expected_sha256=expected)
+
+            try:
+                url, download_result = _from_any_source(pkg, fetch)
+            except IncompleteDownloadException as e:
+                # remember what partial file belongs to, so next download can resume it
+                metadata.download_part_etag = e.etag
+                version_dir.save_metadata(metadata)
+                raise
+
+            metadata.download_part_etag = None
+            metadata.download_size = version_dir.archive_path.stat().st_size
+            metadata.download_etag = download_result.etag
+            metadata.install_verified_at = time.time()
+            if download_result.saved:
+                # extracted directory doesn't match new archive until it's extracted
+                metadata.install_dirname = None
+                metadata.download_sha256 = download_result.sha256
+            metadata.download_url = url
+            metadata.download_filename = pkg.filename
+            version_dir.save_metadata(metadata)
 
         return LocalPackage(version=pkg.version, path=version_dir.archive_path, new_file=download_result.saved)
 
-    def extract(self, pkg: LocalPackage) -> Path:
+    def extract(self, pkg: LocalPackage, components: Optional[Iterable[str]] = None) -> Path:
+        """
+            Extracts `pkg` to version dir and returns its `bin` directory. With `components` (binary names, e.g.
+            `{'mongod'}`) only these binaries are extracted, components asked for later are added to the same directory.
+        """
+        wanted = _components(components)
         version_dir = _VersionDir.from_local_package(self._workspace_dir, pkg)
 
-        # we don't want to ignore errors on rmtree, so it's important to call this when extracted directory exists
-        if pkg.new_file and version_dir.extracted_dir.exists():
-            logger.info("New version of archive {pkg}. Removing old extracted directory {dst}.".format(pkg=pkg.path.name, dst=version_dir.extracted_dir))
-            shutil.rmtree(str(version_dir.extracted_dir))
-            logger.info(version_dir.extracted_dir.exists())
+        with version_dir.lock():
+            metadata = version_dir.read_metadata()
+            installed = metadata.installed_components
+            if self._needs_extract(pkg, version_dir, metadata):
+                if version_dir.extracted_dir.exists():
+                    logger.info("New version of archive {pkg}. Replacing extracted directory {dst}.".format(pkg=pkg.path.name, dst=version_dir.extracted_dir))
+                    # components used so far are still expected to be there
+                    wanted = _union(installed, wanted)
+
+                logger.info("Extracting {pkg} to {dst}".format(pkg=pkg.path.name, dst=version_dir.extracted_dir))
+                # tree is extracted aside and swapped in at once, old one may be still used by running mongod
+                partial_dir = self._extract_partial(pkg, version_dir, wanted, metadata)
+                publish_dir(partial_dir, version_dir.extracted_dir)
+                version_dir.remove_snapshots()
+                metadata.extract_etag = metadata.download_etag
+                metadata.installed_components = wanted
+                metadata.extract_size = tree_size(version_dir.extracted_dir)
+                metadata.extract_capabilities = None
+            elif not _covers(installed, wanted):
+                assert installed is not None
+                missing = None if wanted is None else wanted - installed
+                logger.info("Adding {components} of {pkg} to {dst}".format(components=', '.join(sorted(missing)) if missing else 'all components',
+                                                                           pkg=pkg.path.name, dst=version_dir.extracted_dir))
+                partial_dir = self._extract_partial(pkg, version_dir, missing, metadata)
+                merge_dir(partial_dir, version_dir.extracted_dir)
+                metadata.installed_components = _union(installed, wanted)
+                metadata.extract_size = tree_size(version_dir.extracted_dir)
+            else:
+                logger.info("No changes of archive detected. Skipping pkg extraction.".format(pkg=pkg.path.name, dst=version_dir.extracted_dir))
+
+            _index_capabilities(version_dir.extracted_dir, metadata)
+            metadata.install_dirname = version_dir.extracted_dir.name
+            version_dir.save_metadata(metadata)
 
-        if not version_dir.extracted_dir.exists():
-            logger.info("Extracting {pkg} to {dst}".format(pkg=pkg.path.name, dst=version_dir.extracted_dir))
-            extract_file(pkg.path, version_dir.extracted_dir, strip_level=1)
-        else:
-            logger.info("No changes of archive detected. Skipping pkg extraction.".format(pkg=pkg.path.name, dst=version_dir.extracted_dir))
+        return version_dir.extracted_dir / 'bin'
+
+    def download_and_extract(self, pkg: ExternalPackage, keep_archive: bool = False, components: Optional[Iterable[str]] = None) -> Path:
+        """
+            Streaming variant of `download` followed by `extract`. Archive is extracted while it's downloaded and
+            is stored in version dir only with `keep_archive`. Components missing in extracted directory are added
+            by downloading archive again.
+        """
+        logger.info("Downloading and extracting {version} package from {url}".format(version=pkg.version.version, url=pkg.url))
+
+        wanted = _components(components)
+        version_dir = _VersionDir.from_ext_package(self._workspace_dir, pkg)
+        with version_dir.lock() as waited:
+            metadata = version_dir.read_metadata()
+            installed = metadata.installed_components if version_dir.extracted_dir.exists() else set()  # type: Components
+            if not metadata.download_etag or not _covers(installed, wanted):
+                etag = None
+            elif waited and metadata.extract_etag == metadata.download_etag:
+                logger.info("Package {version} was extracted while waiting for lock. Reusing it.".format(version=pkg.version.version))
+                return version_dir.extracted_dir / 'bin'
+            else:
+                etag = metadata.download_etag
+
+            wanted = _union(installed, wanted)
+            archive_copy = version_dir.archive_path if keep_archive else None
+
+            def fetch(url: str) -> DownloadResult:
+                expected = self._expected_sha256(pkg, url)
+                return self._downloader.download_and_extract(
+                    url, version_dir.extracted_dir, strip_level=1, etag=self._cached_etag(etag, metadata, expected), archive_copy=archive_copy,
+                    cached_size=metadata.download_size or 0, blob_store=self._blob_store, include=_include(wanted), expected_sha256=expected
+                )
+
+            url, download_result = _from_any_source(pkg, fetch)
+            if download_result.saved:
+                metadata.download_size = download_result.size
+                metadata.download_sha256 = download_result.sha256
+                metadata.installed_components = wanted
+                metadata.extract_size = tree_size(version_dir.extracted_dir)
+                metadata.extract_capabilities = None
+                version_dir.remove_snapshots()
+                if not keep_archive and version_dir.archive_path.exists():
+                    # archive left by non-streaming download is outdated now
+                    version_dir.archive_path.unlink()
+
+            _index_capabilities(version_dir.extracted_dir, metadata)
+            metadata.download_etag = download_result.etag
+            metadata.extract_etag = download_result.etag
+            metadata.install_verified_at = time.time()
+            metadata.install_dirname = version_dir.extracted_dir.name
+            metadata.download_url = url
+            metadata.download_filename = pkg.filename
+            version_dir.save_metadata(metadata)
 
         return version_dir.extracted_dir / 'bin'
 
-    def clean(self, version: Version, ignore_errors: bool = False) -> None:
+    def installed(self, version: AnyVersion, revalidate: Revalidate = Revalidate.TTL, ttl: float = DEFAULT_REVALIDATE_TTL,
+                  components: Optional[Iterable[str]] = None) -> Optional[Path]:
+        """
+            Returns `bin` directory of `version` prepared before with all `components`, when local state can be used
+            without asking server according to `revalidate` policy and `ttl` in seconds. Only metadata file is read,
+            no lock is taken.
+        """
+        if revalidate is Revalidate.ALWAYS:
+            return None
+
         version_dir = _VersionDir(self._workspace_dir, version, archive_filename=None)
-        shutil.rmtree(str(version_dir.path), ignore_errors=ignore_errors)
+        metadata = version_dir.read_metadata()
+        if not metadata.install_dirname or not _covers(metadata.installed_components, _components(components)):
+            return None
+
+        if revalidate is Revalidate.TTL and version.is_latest:
+            verified_at = metadata.install_verified_at
+            if verified_at is None or not 0 <= time.time() - verified_at < ttl:
+                return None
+
+        bin_dir = version_dir.path / metadata.install_dirname / 'bin'
+        if not bin_dir.is_dir():
+            return None
+
+        # recently used packages are the last ones evicted by `CacheManager`
+        version_dir.touch()
+
+        return bin_dir
+
+    def capabilities(self, version: AnyVersion) -> Optional[Capabilities]:
+        """
+            Options supported by binaries of prepared `version` (see `Capabilities`), None when it isn't prepared.
+            Index is built at extract time, binaries extracted by older releases of embedmongo are indexed now.
+        """
+        version_dir = _VersionDir(self._workspace_dir, version, archive_filename=None)
+        metadata = version_dir.read_metadata()
+        if not metadata.install_dirname:
+            return None
+
+        extracted_dir = version_dir.path / metadata.install_dirname
+        if not _indexed(extracted_dir, metadata):
+            with version_dir.lock():
+                metadata = version_dir.read_metadata()
+                if metadata.install_dirname != extracted_dir.name:
+                    return None
+                _index_capabilities(extracted_dir, metadata)
+                version_dir.save_metadata(metadata)
+
+        return Capabilities(version.version, metadata.extract_capabilities or {})
+
+    @property
+    def downloader(self) -> Downloader:
+        return self._downloader
+
+    def snapshots(self, version: AnyVersion, bin_dir: Path) -> DataSnapshots:
+        """Golden data directories of `version` extracted to `bin_dir`. They're removed when package is updated or cleaned."""
+        version_dir = _VersionDir(self._workspace_dir, version, archive_filename=None)
+
+        return DataSnapshots(version_dir.snapshots_dir, MongodLauncher(bin_dir))
+
+    def _expected_sha256(self, pkg: ExternalPackage, url: str) -> Optional[str]:
+        if not self._verify_checksums:
+            return None
+
+        pinned = self._checksums.get(pkg.filename, None) or pkg.sha256
+        if pinned is not None:
+            return pinned.lower()
+
+        published = self._downloader.checksum(url)
+        if published is None:
+            logger.warning("No checksum published for {url}, package won't be verified".format(url=url))
+
+        return published
+
+    @staticmethod
+    def _cached_etag(etag: Optional[str], metadata: _PkgMetadata, expected_sha256: Optional[str]) -> Optional[str]:
+        # cached archive known to differ from expected one has to be downloaded again, even if server says it's not modified
+        if etag and expected_sha256 and metadata.download_sha256 and metadata.download_sha256 != expected_sha256:
+            logger.warning("Cached package {filename} doesn't match expected checksum".format(filename=metadata.download_filename))
+            return None
+
+        return etag
+
+    def _extract_partial(self, pkg: LocalPackage, version_dir: _VersionDir, wanted: Components, metadata: _PkgMetadata) -> Path:
+        partial_dir = version_dir.path / (version_dir.extracted_dir.name + '.partial')
+        if partial_dir.exists():
+            shutil.rmtree(str(partial_dir))
+
+        expected = (self._checksums.get(pkg.path.name, None) or metadata.download_sha256) if self._verify_checksums else None
+        try:
+            extract_file(pkg.path, partial_dir, strip_level=1, blob_store=self._blob_store, include=_include(wanted), expected_sha256=expected)
+            missing = sorted(name for name in wanted or () if not (partial_dir / 'bin' / name).exists())
+            if missing:
+                raise PackageManagerException("Components {names} not found in {pkg}".format(names=', '.join(missing), pkg=pkg.path.name))
+        except ChecksumMismatchException:
+            shutil.rmtree(str(partial_dir), ignore_errors=True)
+            # archive got corrupted on disk, next download fetches it again instead of revalidating it
+            logger.error("Removing corrupted archive {pkg}".format(pkg=pkg.path))
+            pkg.path.unlink()
+            metadata.download_etag = None
+            metadata.download_sha256 = None
+            version_dir.save_metadata(metadata)
+            raise
+        except BaseException:
+            shutil.rmtree(str(partial_dir), ignore_errors=True)
+            raise
+
+        return partial_dir
+
+    @staticmethod
+    def _needs_extract(pkg: LocalPackage, version_dir: _VersionDir, metadata: _PkgMetadata) -> bool:
+        if not version_dir.extracted_dir.exists():
+            return True
+
+        # metadata tells whether other worker has already extracted this archive, `new_file` only covers this one
+        if metadata.extract_etag is not None and metadata.download_etag is not None:
+            return bool(metadata.extract_etag != metadata.download_etag)
+
+        return pkg.new_file
+
+    def clean(self, version: AnyVersion, ignore_errors: bool = False) -> None:
+        version_dir = _VersionDir(self._workspace_dir, version, archive_filename=None)
+        with version_dir.lock():
+            shutil.rmtree(str(version_dir.path), ignore_errors=ignore_errors)
 
 
 class PackageDiscovery:
@@ -196,23 +607,81 @@ class PackageDiscovery:
         }
     }
 
-    def __init__(self, repo_url: str = "http://downloads.mongodb.org"):
+    def __init__(self, repo_url: str = "http://downloads.mongodb.org", mirrors: Sequence[Location] = (), probe_timeout: float = 2.0,
+                 catalog: Optional[ReleaseCatalog] = None, downloader: Optional[Downloader] = None):
+        """
+            `mirrors` - local directories, `file://` or HTTP URLs with the same layout as `repo_url` (see `embedmongo mirror`
+            command). Package is downloaded from the fastest source which has it and other sources are used on failure.
+
+            `catalog` - releases other than predefined ones, which are created as `Release` (see `resolve()`).
+
+            `downloader` - HTTP client used to probe mirrors, pass the one used for downloads to share its connections.
+        """
         self._repo_url = repo_url
+        sources = [PackageSource.create(mirror) for mirror in mirrors] + [PackageSource(repo_url)]
+        self._sources = SourceChain(sources, probe_timeout, downloader)
+        self._catalog = catalog
 
-    def create(self, version: Version) -> ExternalPackage:
+    def create(self, version: AnyVersion) -> ExternalPackage:
         WorkingOSGuard.ensure_valid_type()
         WorkingOSGuard.ensure_valid_architecture()
 
         os_type = OSInfo.type()
+        if isinstance(version, Release):
+            return self._create_release(version, version, os_type)
+        arch = OSInfo.architecture()
+        if arch != 'x86_64':
+            # predefined packages are x86_64 builds, native build of the same release can come only from catalog
+            if version.is_latest or self._catalog is None:
+                raise PackageNotFoundException("No {arch} package of {version} for {os_type}, native builds are found in release catalog only".format(
+                    arch=arch, version=version.version, os_type=os_type))
+            return self._create_release(version, Release(version.version), os_type)
+
         package_path = self._package_paths_map[os_type].get(version, None)
 
         if not package_path:
             raise PackageNotFoundException("Predefined package for given OS and version not found.")
 
-        package_url = "{repo_url}/{os_type}/{package_path}".format(
-            repo_url=self._repo_url,
-            os_type=os_type,
-            package_path=package_path
-        )
+        urls = self._sources.urls(os_type, package_path)
+
+        return ExternalPackage(version=version, os_type=os_type, filename=package_path, url=urls[0], fallback_urls=tuple(urls[1:]),
+                               sha256=None)
+
+    def resolve(self, spec: str) -> Release:
+        """Newest release from catalog matching `spec` (e.g. `4.4.x`, `>=5.0`), which has package for this system."""
+        WorkingOSGuard.ensure_valid_type()
+        WorkingOSGuard.ensure_valid_architecture()
+
+        return self._release_catalog().resolve(spec, OSInfo.type(), OSInfo.architecture(), OSInfo.targets())
+
+    def _create_release(self, version: AnyVersion, release: Release, os_type: str) -> ExternalPackage:
+        arch = OSInfo.architecture()
+        entry = self._release_catalog().find(release, os_type, arch, OSInfo.targets())
+        if entry is None:
+            message = "Package of {version} for {os_type} {arch} not found in catalog".format(version=release.version, os_type=os_type, arch=arch)
+            raise PackageNotFoundException(message)
+        logger.debug("Using {target} {edition} build of {version}".format(target=entry.target, edition=entry.edition, version=release.version))
+
+        # mirrors keep upstream layout, so they're asked for the same os_type/filename
+        urls = self._sources.urls(entry.os_type, entry.filename)
+
+        return ExternalPackage(version=version, os_type=entry.os_type, filename=entry.filename, url=urls[0], fallback_urls=tuple(urls[1:]),
+                               sha256=entry.sha256)
+
+    def _release_catalog(self) -> ReleaseCatalog:
+        if self._catalog is None:
+            raise PackageNotFoundException("Release catalog isn't configured")
+
+        return self._catalog
+
+    def known_packages(self, os_types: Optional[Iterable[str]] = None) -> List[ExternalPackage]:
+        """All predefined packages of `os_types` (every supported OS by default) in upstream repository."""
+        packages = []
+        for os_type in os_types or sorted(self._package_paths_map):
+            if os_type not in self._package_paths_map:
+                raise PackageNotFoundException("No predefined packages for {os_type}".format(os_type=os_type))
+            for version, filename in self._package_paths_map[os_type].items():
+                url = PackageSource(self._repo_url).package_url(os_type, filename)
+                packages.append(ExternalPackage(version=version, os_type=os_type, filename=filename, url=url, fallback_urls=(), sha256=None))
 
-        return ExternalPackage(version=version, os_type=os_type, filename=package_path, url=package_url)
+        return packages
@@ -0,0 +1,228 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent import futures
+import contextlib
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Sequence, Set  # noqa: F401
+
+from .exceptions import MongodPoolException
+from .process import MongodLauncher, MongodProcess
+from .registry import InstanceRegistry
+from .wire import drop_databases
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats(NamedTuple('PoolStats', [('leases', int), ('hits', int), ('misses', int), ('total_lease_time', float),
+                                         ('max_lease_time', float)])):
+    """
+        `hits` - leases served with already running idle instance, `misses` - leases which waited for start of new
+        instance or for release of other lease. Lease times are in seconds.
+    """
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.leases if self.leases else 0.0
+
+    @property
+    def average_lease_time(self) -> float:
+        return self.total_lease_time / self.leases if self.leases else 0.0
+
+
+def reset_databases(process: MongodProcess) -> None:
+    """Default reset of released instance: drops every non-system database."""
+    drop_databases(process.host, process.port)
+
+
+class MongodPool:
+    """
+        Keeps `size` mongod instances started from `bin_dir` (see `PackageManager.extract()`) on free ports and leases
+        them with `acquire()`/`release()`. Released instance is reset with `reset` callable, by default all user
+        databases are dropped, which is much faster than restarting the process.
+
+        Pool grows on demand up to `max_size` instances. Both values default to number of CPUs. With `snapshot`
+        (see `DataSnapshots.golden()`) every instance starts from clone of golden data directory. Ports are leased from
+        `registry` when it's given (see `InstanceRegistry`), `ram` makes instances RAM backed (see `MongodLauncher`).
+    """
+    def __init__(self, bin_dir: Path, size: Optional[int] = None, max_size: Optional[int] = None, args: Sequence[str] = (),
+                 reset: Callable[[MongodProcess], Any] = reset_databases, start_timeout: float = 30.0, snapshot: Optional[Path] = None,
+                 registry: Optional[InstanceRegistry] = None, ram: bool = False):
+        self._size = size if size is not None else (os.cpu_count() or 1)
+        self._max_size = max(max_size or self._size, self._size)
+        self._launcher = MongodLauncher(bin_dir, registry, ram)
+        self._args = args
+        self._reset = reset
+        self._start_timeout = start_timeout
+        self._snapshot = snapshot
+
+        self._condition = threading.Condition()
+        self._idle = []  # type: List[MongodProcess]
+        self._leased = set()  # type: Set[MongodProcess]
+        # leased instances being reset by release(), they're returned only once
+        self._releasing = set()  # type: Set[MongodProcess]
+        self._starting = 0
+        self._closed = False
+        self._stats = PoolStats(leases=0, hits=0, misses=0, total_lease_time=0.0, max_lease_time=0.0)
+
+    @property
+    def stats(self) -> PoolStats:
+        return self._stats
+
+    @property
+    def size(self) -> int:
+        """Number of running instances, idle and leased."""
+        with self._condition:
+            return len(self._idle) + len(self._leased)
+
+    def start(self) -> 'MongodPool':
+        """Starts `size` instances in parallel."""
+        missing = self._size - self.size
+        if missing > 0:
+            with futures.ThreadPoolExecutor(missing) as pool:
+                jobs = [pool.submit(self._launcher.start, args=self._args, timeout=self._start_timeout, snapshot=self._snapshot) for _ in range(missing)]
+            processes = [job.result() for job in jobs if not job.exception()]
+
+            errors = [job.exception() for job in jobs if job.exception()]
+            if errors:
+                for process in processes:
+                    process.stop()
+                raise MongodPoolException("{count} of {total} mongod instances couldn't be started: {error}".format(
+                    count=len(errors),
+                    total=missing,
+                    error=errors[0]
+                ))
+
+            with self._condition:
+                self._idle.extend(processes)
+                self._condition.notify_all()
+
+        return self
+
+    def acquire(self, timeout: Optional[float] = None) -> MongodProcess:
+        """Leases instance. Blocks when all `max_size` instances are leased. Raises MongodPoolException on timeout."""
+        start_time = time.monotonic()
+        deadline = None if timeout is None else start_time + timeout
+        hit = True
+        process = None  # type: Optional[MongodProcess]
+
+        with self._condition:
+            while True:
+                self._ensure_open()
+                if self._idle:
+                    process = self._idle.pop()
+                    self._leased.add(process)
+                    break
+
+                hit = False
+                if len(self._leased) + self._starting < self._max_size:
+                    self._starting += 1
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise MongodPoolException("No mongod instance available in {timeout}s".format(timeout=timeout))
+                self._condition.wait(remaining)
+
+        if process is None:
+            process = self._start_leased()
+
+        self._record(hit, time.monotonic() - start_time)
+
+        return process
+
+    def release(self, process: MongodProcess) -> None:
+        """
+            Returns leased instance to the pool. Instance is reset first and replaced when reset fails. Raises
+            MongodPoolException for instance which isn't leased from this pool, e.g. released already.
+        """
+        with self._condition:
+            if process not in self._leased or process in self._releasing:
+                raise MongodPoolException("mongod {address} isn't leased from this pool".format(address=process.address))
+            self._releasing.add(process)
+
+        healthy = process.is_running()
+        if healthy:
+            try:
+                self._reset(process)
+            except Exception as e:
+                logger.warning("Reset of mongod {address} failed, instance is dropped: {error}".format(address=process.address, error=e))
+                healthy = False
+
+        with self._condition:
+            self._leased.discard(process)
+            self._releasing.discard(process)
+            keep = healthy and not self._closed
+            if keep:
+                self._idle.append(process)
+            self._condition.notify_all()
+
+        if not keep:
+            process.stop()
+
+    @contextlib.contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[MongodProcess]:
+        process = self.acquire(timeout)
+        try:
+            yield process
+        finally:
+            self.release(process)
+
+    def close(self) -> None:
+        """Stops idle instances. Leased instances are stopped when they're released."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+
+        for process in idle:
+            process.stop()
+
+    def __enter__(self) -> 'MongodPool':
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _start_leased(self) -> MongodProcess:
+        try:
+            process = self._launcher.start(args=self._args, timeout=self._start_timeout, snapshot=self._snapshot)
+        except BaseException:
+            with self._condition:
+                self._starting -= 1
+                self._condition.notify_all()
+            raise
+
+        with self._condition:
+            self._starting -= 1
+            self._leased.add(process)
+
+        return process
+
+    def _ensure_open(self) -> None:
+        if self._closed:
+            raise MongodPoolException("Pool is closed")
+
+    def _record(self, hit: bool, lease_time: float) -> None:
+        with self._condition:
+            self._stats = PoolStats(
+                leases=self._stats.leases + 1,
+                hits=self._stats.hits + (1 if hit else 0),
+                misses=self._stats.misses + (0 if hit else 1),
+                total_lease_time=self._stats.total_lease_time + lease_time,
+                max_lease_time=max(self._stats.max_lease_time, lease_time)
+            )
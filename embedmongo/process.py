@@ -0,0 +1,298 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+from pathlib import Path
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Any, Deque, List, Optional, Pattern, Sequence  # noqa: F401
+
+from .blobstore import clone_tree
+from .capabilities import Capabilities
+from .events import hooks, MongodStarted
+from .exceptions import MongodStartException
+from .registry import InstanceRegistry
+from .storage import binary_info, has_arg, ram_args, ram_dir
+
+logger = logging.getLogger(__name__)
+
+# 3.x/4.x text logs: "waiting for connections on port 27017", 4.4+ JSON logs: "msg":"Waiting for connections"
+READY_RE = re.compile(r'waiting for connections', re.IGNORECASE)
+
+
+class MongodProcess:
+    """Handle of running mongod (or mongos, which has no `dbpath`). Use `stop()` or context manager to shut it down."""
+    _OUTPUT_LINES = 200
+
+    def __init__(self, popen: 'subprocess.Popen[bytes]', host: str, port: int, dbpath: Optional[Path], remove_dbpath: bool,
+                 registry: Optional[InstanceRegistry] = None):
+        self.host = host
+        self.port = port
+        self.dbpath = dbpath
+        self.startup_time = None  # type: Optional[float]
+
+        self._popen = popen
+        self._remove_dbpath = remove_dbpath
+        self._registry = registry
+        self._output = collections.deque(maxlen=self._OUTPUT_LINES)  # type: Deque[str]
+        self._output_changed = threading.Condition()
+        self._output_closed = False
+        self._lines_read = 0
+        self._reader = threading.Thread(target=self._read_output, name='mongod-{port}-output'.format(port=port), daemon=True)
+        self._reader.start()
+
+    @property
+    def pid(self) -> int:
+        return self._popen.pid
+
+    @property
+    def address(self) -> str:
+        return '{host}:{port}'.format(host=self.host, port=self.port)
+
+    @property
+    def uri(self) -> str:
+        return 'mongodb://{address}'.format(address=self.address)
+
+    @property
+    def output(self) -> List[str]:
+        """Last lines of mongod output."""
+        with self._output_changed:
+            return list(self._output)
+
+    @property
+    def lines_read(self) -> int:
+        """Number of mongod output lines read so far."""
+        with self._output_changed:
+            return self._lines_read
+
+    def is_running(self) -> bool:
+        return self._popen.poll() is None
+
+    def wait_for_output(self, pattern: Pattern[str], timeout: float, after: int = 0) -> bool:
+        """
+            Blocks until mongod prints line matching `pattern`, ignoring the first `after` lines (see `lines_read`).
+            Returns False on timeout or when process exited.
+        """
+        deadline = time.monotonic() + timeout
+        with self._output_changed:
+            while True:
+                new_lines = list(self._output)[max(0, len(self._output) - (self._lines_read - after)):]
+                if any(pattern.search(line) for line in new_lines):
+                    return True
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._output_closed:
+                    return False
+                self._output_changed.wait(remaining)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Asks mongod for clean shutdown (SIGTERM) and kills it if it doesn't stop within `timeout`."""
+        if self.is_running():
+            logger.info("Stopping mongod {address} (pid {pid})".format(address=self.address, pid=self.pid))
+            self._popen.terminate()
+            try:
+                self._popen.wait(timeout)
+            except subprocess.TimeoutExpired:
+                logger.warning("mongod {address} didn't stop in {timeout}s. Killing it.".format(address=self.address, timeout=timeout))
+                self._popen.kill()
+                self._popen.wait()
+
+        self._reader.join()
+        if self._remove_dbpath and self.dbpath is not None:
+            shutil.rmtree(str(self.dbpath), ignore_errors=True)
+        if self._registry is not None:
+            self._registry.release(self.port)
+
+    def __enter__(self) -> 'MongodProcess':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def _read_output(self) -> None:
+        assert self._popen.stdout is not None
+        for raw_line in iter(self._popen.stdout.readline, b''):
+            line = raw_line.decode('utf-8', errors='replace').rstrip()
+            logger.debug("mongod {port}: {line}".format(port=self.port, line=line))
+            with self._output_changed:
+                self._output.append(line)
+                self._lines_read += 1
+                self._output_changed.notify_all()
+
+        self._popen.stdout.close()
+        with self._output_changed:
+            self._output_closed = True
+            self._output_changed.notify_all()
+
+
+class MongodLauncher:
+    """
+        Starts mongod from extracted package `bin` directory (see `PackageManager.extract()`). With `registry` free
+        ports are leased from it and started instances are recorded there (see `InstanceRegistry`).
+
+        With `ram` instances are RAM backed: temporary dbpath is on `/dev/shm`, journal is off and storage engine is
+        tuned for small datasets, with flags matching release of the binary (see `storage` module).
+
+        With `capabilities` of the package (see `PackageManager.capabilities()`) arguments are checked before mongod
+        is started: renamed options are translated and removed ones raise `UnsupportedOptionException`.
+    """
+    def __init__(self, bin_dir: Path, registry: Optional[InstanceRegistry] = None, ram: bool = False, capabilities: Optional[Capabilities] = None):
+        self._bin_dir = bin_dir
+        self._registry = registry
+        self._ram = ram
+        self._capabilities = capabilities
+
+    def start(self, port: Optional[int] = None, host: str = '127.0.0.1', dbpath: Optional[Path] = None, args: Sequence[str] = (),
+              timeout: float = 30.0, snapshot: Optional[Path] = None) -> MongodProcess:
+        """
+            Starts mongod and blocks until it accepts connections. Readiness is detected from mongod output, or by
+            connecting to its port when output is redirected with `--logpath`.
+
+            Free port is chosen when `port` is not given. Without `dbpath` temporary directory is used and removed on stop.
+            With `snapshot` (see `DataSnapshots.golden()`) dbpath starts as its clone instead of empty directory.
+        """
+        if self._ram:
+            args = list(args) + ram_args(binary_info(self._bin_dir / 'mongod'), args, in_memory=snapshot is None)
+        if self._capabilities is not None:
+            args = self._capabilities.check(args, 'mongod')
+        remove_dbpath = dbpath is None
+        if dbpath is None:
+            dbpath = Path(tempfile.mkdtemp(prefix='embedmongo-', dir=str(ram_dir()) if self._ram else None))
+        registry = self._registry if port is None else None
+        try:
+            dbpath.mkdir(parents=True, exist_ok=True)
+            if snapshot is not None:
+                clone_tree(snapshot, dbpath)
+            # leased right before mongod is spawned, copying snapshot may take longer than the lease lasts
+            port = port or (registry.allocate(host) if registry is not None else free_port(host))
+        except BaseException:
+            if remove_dbpath:
+                shutil.rmtree(str(dbpath), ignore_errors=True)
+            raise
+
+        cmd = [str(self._bin_dir / 'mongod'), '--bind_ip', host, '--port', str(port), '--dbpath', str(dbpath)] + list(args)
+
+        return _launch(cmd, host, port, dbpath, remove_dbpath, args, timeout, registry)
+
+
+class MongosLauncher:
+    """
+        Starts mongos router from extracted package `bin` directory, ports are leased from `registry` and arguments
+        are checked against `capabilities` like by `MongodLauncher`.
+    """
+    def __init__(self, bin_dir: Path, registry: Optional[InstanceRegistry] = None, capabilities: Optional[Capabilities] = None):
+        self._bin_dir = bin_dir
+        self._registry = registry
+        self._capabilities = capabilities
+
+    def start(self, configdb: str, port: Optional[int] = None, host: str = '127.0.0.1', args: Sequence[str] = (), timeout: float = 30.0) -> MongodProcess:
+        """Starts mongos using config server replica set `configdb` (`<name>/<host:port>,...`) and blocks until it accepts connections."""
+        if self._capabilities is not None:
+            args = self._capabilities.check(args, 'mongos')
+        registry = self._registry if port is None else None
+        port = port or (registry.allocate(host) if registry is not None else free_port(host))
+        cmd = [str(self._bin_dir / 'mongos'), '--bind_ip', host, '--port', str(port), '--configdb', configdb] + list(args)
+
+        return _launch(cmd, host, port, None, False, args, timeout, registry)
+
+
+def _launch(cmd: List[str], host: str, port: int, dbpath: Optional[Path], remove_dbpath: bool, args: Sequence[str], timeout: float,
+            registry: Optional[InstanceRegistry]) -> MongodProcess:
+    logger.info("Starting {cmd}".format(cmd=' '.join(cmd)))
+
+    start_time = time.monotonic()
+    try:
+        popen = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except BaseException:
+        if registry is not None:
+            registry.release(port)
+        raise
+    process = MongodProcess(popen, host, port, dbpath, remove_dbpath, registry)
+    if registry is not None:
+        # recorded before waiting for readiness, so instance is reaped even if this process dies during startup
+        try:
+            registry.register(port, popen.pid, dbpath if remove_dbpath else None)
+        except BaseException:
+            process.stop()
+            raise
+
+    if output_redirected(args):
+        ready = _wait_for_port(process, timeout)
+    else:
+        ready = process.wait_for_output(READY_RE, timeout)
+
+    if not ready:
+        output = '\n'.join(process.output[-20:])
+        returncode = _exit_code(popen, wait=process._output_closed)
+        reason = 'exited with code {code}'.format(code=returncode) if returncode is not None else 'not ready in {timeout}s'.format(timeout=timeout)
+        process.stop()
+        raise MongodStartException("{name} on port {port} {reason}. Output:\n{output}".format(
+            name=Path(cmd[0]).name,
+            port=port,
+            reason=reason,
+            output=output
+        ))
+
+    process.startup_time = time.monotonic() - start_time
+    logger.info("{name} {address} (pid {pid}) started in {time:.3f}s".format(
+        name=Path(cmd[0]).name,
+        address=process.address,
+        pid=process.pid,
+        time=process.startup_time
+    ))
+    if hooks.active:
+        hooks.emit(MongodStarted(binary=Path(cmd[0]).name, address=process.address, pid=process.pid, startup_time=process.startup_time))
+
+    return process
+
+
+def free_port(host: str = '127.0.0.1') -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        port = sock.getsockname()[1]  # type: int
+
+        return port
+
+
+def output_redirected(args: Sequence[str]) -> bool:
+    """Whether mongod `args` send log to file or syslog, so readiness can't be read from its output."""
+    return has_arg(args, '--logpath') or has_arg(args, '--syslog')
+
+
+def _exit_code(popen: 'subprocess.Popen[bytes]', wait: bool) -> Optional[int]:
+    # closed output means that process is exiting, but it may be not reaped yet
+    try:
+        return popen.wait(1.0) if wait else popen.poll()
+    except subprocess.TimeoutExpired:
+        return None
+
+
+def _wait_for_port(process: MongodProcess, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while process.is_running() and time.monotonic() < deadline:
+        try:
+            with socket.create_connection((process.host, process.port), timeout=delay):
+                return True
+        except OSError:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    return False
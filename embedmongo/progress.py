@@ -0,0 +1,150 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Download progress reporting. Reporter is a listener of download events, which are emitted at most every
+    `hooks.progress_interval` seconds, so it never runs for every received chunk. Progress is logged by default,
+    `set_progress_reporter(TqdmReporter())` shows progress bars in terminal and `set_progress_reporter(None)` turns
+    reporting off.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, IO, Optional, Tuple  # noqa: F401
+
+from .events import DownloadFailed, DownloadFinished, DownloadProgress, DownloadStarted, hooks, Listener
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressReporter:
+    """
+        Base of reporters, override callbacks you need. They're called from downloading threads, possibly for many
+        downloads at once. Downloads answered with 304 Not Modified aren't reported.
+    """
+    def __call__(self, event: Any) -> None:
+        if isinstance(event, DownloadStarted):
+            self.started(event)
+        elif isinstance(event, DownloadProgress):
+            self.progress(event)
+        elif isinstance(event, DownloadFinished) and not event.not_modified:
+            self.finished(event)
+        elif isinstance(event, DownloadFailed):
+            self.failed(event)
+
+    def started(self, event: DownloadStarted) -> None:
+        pass
+
+    def progress(self, event: DownloadProgress) -> None:
+        pass
+
+    def finished(self, event: DownloadFinished) -> None:
+        pass
+
+    def failed(self, event: DownloadFailed) -> None:
+        pass
+
+
+class LoggingReporter(ProgressReporter):
+    """Logs progress of downloads with `level`, e.g. `mongodb-linux-x86_64-4.0.5.tgz:  42% | 35.1MB/83.6MB [12.4MB/s]`."""
+    def __init__(self, level: int = logging.INFO):
+        self._level = level
+
+    def progress(self, event: DownloadProgress) -> None:
+        if not logger.isEnabledFor(self._level):
+            return
+
+        if event.total:
+            done = '{percentage:3.0f}% | {received}/{total}'.format(percentage=100.0 * event.received / event.total, received=_size(event.received),
+                                                                    total=_size(event.total))
+        else:
+            done = _size(event.received)
+        logger.log(self._level, "{filename}: {done} [{rate}/s]".format(filename=event.filename, done=done, rate=_size(event.rate)))
+
+    def finished(self, event: DownloadFinished) -> None:
+        logger.log(self._level, "{filename}: {size} downloaded in {duration:.1f}s [{rate}/s]".format(
+            filename=event.filename,
+            size=_size(event.size),
+            duration=event.duration,
+            rate=_size(event.rate)
+        ))
+
+
+class TqdmReporter(ProgressReporter):
+    """
+        Progress bars in terminal drawn by tqdm, which is optional dependency (`python-embed-mongo[progress]` extra).
+        Bars are written to `file`, stderr by default.
+    """
+    def __init__(self, file: Optional[IO[str]] = None):
+        try:
+            import tqdm
+        except ImportError as e:
+            raise ImportError("TqdmReporter requires tqdm package, install python-embed-mongo[progress]") from e
+
+        self._tqdm = tqdm.tqdm
+        self._file = file
+        self._lock = threading.Lock()
+        # url -> (progress bar, bytes it started with)
+        self._bars = {}  # type: Dict[str, Tuple[Any, int]]
+
+    def started(self, event: DownloadStarted) -> None:
+        pgbar = self._tqdm(total=event.total, initial=event.resumed_from, desc=event.filename, unit='B', unit_scale=True, file=self._file)
+        with self._lock:
+            self._bars[event.url] = (pgbar, event.resumed_from)
+
+    def progress(self, event: DownloadProgress) -> None:
+        with self._lock:
+            pgbar, _ = self._bars.get(event.url, (None, 0))
+        if pgbar is not None:
+            pgbar.update(event.received - pgbar.n)
+
+    def finished(self, event: DownloadFinished) -> None:
+        with self._lock:
+            pgbar, initial = self._bars.pop(event.url, (None, 0))
+        if pgbar is not None:
+            pgbar.update(initial + event.size - pgbar.n)
+            pgbar.close()
+
+    def failed(self, event: DownloadFailed) -> None:
+        with self._lock:
+            pgbar, _ = self._bars.pop(event.url, (None, 0))
+        if pgbar is not None:
+            pgbar.close()
+
+
+_reporter = None  # type: Optional[Listener]
+_reporter_lock = threading.Lock()
+
+
+def set_progress_reporter(reporter: Optional[Listener]) -> None:
+    """Replaces reporter of download progress (`LoggingReporter` by default). None disables progress reporting."""
+    global _reporter
+    with _reporter_lock:
+        if _reporter is not None:
+            hooks.unsubscribe(_reporter)
+        _reporter = reporter
+        if reporter is not None:
+            hooks.subscribe(reporter, DownloadStarted, DownloadProgress, DownloadFinished, DownloadFailed)
+
+
+def _size(size: float) -> str:
+    for unit in ('B', 'kB', 'MB'):
+        if size < 1000:
+            return '{size:.1f}{unit}'.format(size=size, unit=unit)
+        size /= 1000
+
+    return '{size:.1f}GB'.format(size=size)
+
+
+set_progress_reporter(LoggingReporter())
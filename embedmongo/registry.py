@@ -0,0 +1,224 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Host-wide registry of mongod instances. Processes sharing registry directory (e.g. pytest-xdist workers using one
+    workspace) get ports from it instead of asking OS for an ephemeral one, so two launchers never pick the same port
+    and ports aren't taken by outgoing connections between choosing them and mongod binding them.
+
+    Every instance is recorded with PID and start time of its process and of the process which launched it. When
+    launcher died without stopping its instances (crashed or killed test run), they're stopped and their temporary
+    data directories removed by the next process using the registry.
+"""
+
+import contextlib
+import json
+import logging
+import os
+from pathlib import Path
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple  # noqa: F401
+
+from .exceptions import InstanceRegistryException
+from .locks import FileLock
+
+logger = logging.getLogger(__name__)
+
+# below ephemeral ranges of Linux (32768-60999) and macOS (49152-65535)
+DEFAULT_PORT_RANGE = (20000, 32768)
+DEFAULT_LEASE_TTL = 60.0
+
+# owner - PID of process which leased the port, pid - mongod process, None until it's started,
+# dbpath - data directory removed with reaped instance
+Instance = NamedTuple('Instance', [('port', int), ('host', str), ('owner', int), ('pid', Optional[int]), ('dbpath', Optional[Path])])
+
+
+class InstanceRegistry:
+    """
+        Ports and mongod instances of all processes using `path` directory, guarded by `FileLock`. Launchers call
+        `allocate()` for a port, `register()` when mongod process is spawned and `release()` when it's stopped.
+
+        Ports are chosen from `port_range`. Lease which isn't followed by `register()` within `lease_ttl` seconds is
+        dropped, e.g. when launch failed before process started.
+    """
+    _STATE_FILENAME = 'instances.json'
+
+    def __init__(self, path: Path, port_range: Tuple[int, int] = DEFAULT_PORT_RANGE, lease_ttl: float = DEFAULT_LEASE_TTL):
+        if port_range[0] >= port_range[1]:
+            raise ValueError("Invalid port range {port_range}".format(port_range=port_range))
+
+        self.path = path
+        self._port_range = port_range
+        self._lease_ttl = lease_ttl
+        self._lock_path = path / '.lock'
+        self._state_path = path / self._STATE_FILENAME
+
+    def allocate(self, host: str = '127.0.0.1') -> int:
+        """Leases port free on `host` to this process. Orphaned instances are reaped first."""
+        with self._state() as records:
+            orphans = self._pop_orphans(records)
+            port = self._free_port(host, {int(port) for port in records})
+            records[str(port)] = {'host': host, 'owner': os.getpid(), 'owner_start': _process_start(os.getpid()), 'leased_at': time.time(),
+                                  'pid': None, 'pid_start': None, 'dbpath': None}
+        _stop_orphans(orphans)
+
+        logger.debug("Port {port} allocated".format(port=port))
+
+        return port
+
+    def register(self, port: int, pid: int, dbpath: Optional[Path] = None) -> None:
+        """Records mongod `pid` started on leased `port`. `dbpath` is removed when orphaned instance is reaped."""
+        with self._state() as records:
+            record = records.get(str(port), None)
+            if record is None or record['owner'] != os.getpid():
+                raise InstanceRegistryException("Port {port} isn't leased by this process".format(port=port))
+
+            record.update(pid=pid, pid_start=_process_start(pid), dbpath=str(dbpath) if dbpath is not None else None)
+
+    def release(self, port: int) -> None:
+        """Returns `port` leased by this process, its instance is expected to be stopped."""
+        with self._state() as records:
+            record = records.get(str(port), None)
+            if record is not None and record['owner'] == os.getpid():
+                del records[str(port)]
+
+    def instances(self) -> List[Instance]:
+        """Leased ports and their instances, including orphaned ones which weren't reaped yet."""
+        with self._state() as records:
+            return sorted(_instance(port, record) for port, record in records.items())
+
+    def reap(self) -> List[Instance]:
+        """Stops instances of dead launchers and drops their leases. Returns reaped instances."""
+        with self._state() as records:
+            orphans = self._pop_orphans(records)
+
+        return _stop_orphans(orphans)
+
+    @contextlib.contextmanager
+    def _state(self) -> Iterator[Dict[str, Dict[str, Any]]]:
+        with FileLock.get(self._lock_path).hold():
+            try:
+                records = json.loads(self._state_path.read_text())  # type: Dict[str, Dict[str, Any]]
+            except FileNotFoundError:
+                records = {}
+            except ValueError:
+                logger.warning("Registry {path} is corrupted, it's reset".format(path=self._state_path))
+                records = {}
+
+            yield records
+
+            # readers without lock never see partially written file
+            tmp_path = self._state_path.with_name(self._state_path.name + '.tmp')
+            tmp_path.write_text(json.dumps(records, sort_keys=True))
+            tmp_path.replace(self._state_path)
+
+    def _pop_orphans(self, records: Dict[str, Dict[str, Any]]) -> List[Tuple[Instance, Optional[str]]]:
+        """Drops expired leases and records of dead launchers. Returns orphaned instances with start time of their process."""
+        orphans = []
+        for port, record in list(records.items()):
+            if _is_running(record['owner'], record['owner_start']):
+                if record['pid'] is None and time.time() - record['leased_at'] > self._lease_ttl:
+                    logger.debug("Lease of port {port} expired".format(port=port))
+                    del records[port]
+                continue
+
+            orphans.append((_instance(port, record), record['pid_start']))
+            del records[port]
+
+        return orphans
+
+    def _free_port(self, host: str, taken: Set[int]) -> int:
+        low, high = self._port_range
+        start = random.randrange(low, high)
+        for offset in range(high - low):
+            port = low + (start - low + offset) % (high - low)
+            if port not in taken and _is_bindable(host, port):
+                return port
+
+        raise InstanceRegistryException("No free port in range {low}-{high}".format(low=low, high=high - 1))
+
+
+def _stop_orphans(orphans: List[Tuple[Instance, Optional[str]]]) -> List[Instance]:
+    # called without registry lock, stopping mongod may take a while
+    for instance, pid_start in orphans:
+        if instance.pid is not None and _is_running(instance.pid, pid_start):
+            logger.warning("Stopping orphaned mongod {host}:{port} (pid {pid}) of dead process {owner}".format(
+                host=instance.host, port=instance.port, pid=instance.pid, owner=instance.owner))
+            _terminate(instance.pid, pid_start)
+        if instance.dbpath is not None:
+            shutil.rmtree(str(instance.dbpath), ignore_errors=True)
+
+    return [instance for instance, _ in orphans]
+
+
+def _instance(port: str, record: Dict[str, Any]) -> Instance:
+    return Instance(port=int(port), host=record['host'], owner=record['owner'], pid=record['pid'],
+                    dbpath=Path(record['dbpath']) if record['dbpath'] else None)
+
+
+def _is_bindable(host: str, port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+
+    return True
+
+
+def _is_running(pid: int, start: Optional[str]) -> bool:
+    # start time tells process from other one which got the same PID later
+    current = _process_start(pid)
+
+    return current is not None and (start is None or current == start)
+
+
+def _process_start(pid: int) -> Optional[str]:
+    """Start time of process `pid`, None when there's no such process or it's a zombie."""
+    if Path('/proc/self/stat').exists():
+        try:
+            fields = Path('/proc/{pid}/stat'.format(pid=pid)).read_text().rsplit(')', 1)[1].split()
+        except OSError:
+            return None
+        # state and starttime fields of proc(5)
+        return None if fields[0] in ('Z', 'X') else fields[19]
+
+    try:
+        output = subprocess.check_output(['ps', '-o', 'stat=,lstart=', '-p', str(pid)], stderr=subprocess.DEVNULL, universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    state, _, started = output.strip().partition(' ')
+
+    return None if not state or state.startswith('Z') else started.strip()
+
+
+def _terminate(pid: int, start: Optional[str], timeout: float = 10.0) -> None:
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        if sig == signal.SIGKILL:
+            logger.warning("Orphaned mongod (pid {pid}) didn't stop in {timeout}s. Killing it.".format(pid=pid, timeout=timeout))
+        try:
+            os.kill(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            return
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not _is_running(pid, start):
+                return
+            time.sleep(0.05)
@@ -0,0 +1,83 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from pathlib import Path
+import re
+import shutil
+import tempfile
+import time
+from typing import Any, Callable, Optional, Sequence
+
+from .process import MongodLauncher, MongodProcess
+
+logger = logging.getLogger(__name__)
+
+_NAME_RE = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+Seed = Callable[[MongodProcess], Any]
+
+
+class DataSnapshots:
+    """
+        Golden data directories of one version, kept in `root` (see `_VersionDir.snapshots_dir`).
+
+        Golden directory is initialized once by real mongod (storage engine bootstrap, optional `seed` data) and
+        cleanly shut down. New instances start from its clone, which is reflink (copy-on-write) where filesystem
+        supports it and plain copy otherwise. Hardlinks aren't used, because WiredTiger modifies files in place.
+    """
+    def __init__(self, root: Path, launcher: MongodLauncher):
+        self.root = root
+        self._launcher = launcher
+
+    def path(self, name: str = 'default') -> Path:
+        if not _NAME_RE.match(name):
+            raise ValueError("Invalid snapshot name: {name}".format(name=name))
+
+        return self.root / name
+
+    def golden(self, name: str = 'default', seed: Optional[Seed] = None, args: Sequence[str] = (), timeout: float = 30.0) -> Path:
+        """
+            Returns golden directory `name`, initializing it first when it doesn't exist. `seed` is called with running
+            mongod to load fixture data. Snapshot is bound to storage options in `args`, so use other `name` for other ones.
+        """
+        golden = self.path(name)
+        if golden.exists():
+            return golden
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(prefix='.{name}.'.format(name=name), dir=str(self.root)))
+        try:
+            start_time = time.monotonic()
+            with self._launcher.start(dbpath=tmp_dir, args=args, timeout=timeout) as process:
+                if seed is not None:
+                    seed(process)
+
+            # directory is published atomically, concurrent builder (other thread or process) which lost the race drops its copy
+            try:
+                tmp_dir.rename(golden)
+            except OSError:
+                if not golden.exists():
+                    raise
+                logger.debug("Snapshot {path} was created concurrently".format(path=golden))
+            else:
+                logger.info("Snapshot {path} created in {time:.3f}s".format(path=golden, time=time.monotonic() - start_time))
+        finally:
+            if tmp_dir.exists():
+                shutil.rmtree(str(tmp_dir), ignore_errors=True)
+
+        return golden
+
+    def remove(self, name: str = 'default') -> None:
+        shutil.rmtree(str(self.path(name)), ignore_errors=True)
@@ -0,0 +1,134 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    RAM backed storage of test instances. Data directory is placed on tmpfs (`/dev/shm`) and mongod is started without
+    durability it doesn't need there: journal is disabled and WiredTiger cache is sized for small datasets. Enterprise
+    builds use `inMemory` storage engine instead.
+
+    Flags depend on mongod release, it's read from `mongod --version` of the binary, so launchers don't need `Version`:
+    - < 3.2: MMAPv1 (default engine) with `--nojournal` and `--smallfiles`
+    - 3.2: WiredTiger cache takes whole GBs only, 1 GB is the minimum
+    - >= 3.4: fractional cache size, 0.25 GB
+    - >= 4.0: replica set members with WiredTiger refuse to run without journal, it's kept for them
+    - >= 6.1: `--nojournal` was removed, journal is always on
+    Full-time diagnostic data capture (writes to dbpath every second) is disabled from 3.2, when it was introduced.
+"""
+
+import functools
+import logging
+import os
+from pathlib import Path
+import re
+import subprocess
+import tempfile
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from .exceptions import MongodStartException
+
+logger = logging.getLogger(__name__)
+
+RAM_DIR = Path('/dev/shm')
+
+# in GB, WiredTiger minimum (3.4+), enough for datasets of tests
+SMALL_CACHE_SIZE = '0.25'
+# in GB, limit of data kept by inMemory engine
+IN_MEMORY_SIZE = '1'
+
+_VERSION_RE = re.compile(r'db version v(\d+)\.(\d+)\.(\d+)')
+# 'modules: enterprise' up to 4.2, JSON build info ('"modules": [ "enterprise" ]') later
+_ENTERPRISE_RE = re.compile(r'modules"?\s*:\s*(\[[^\]]*|[^\n]*)\benterprise\b')
+_REPLICA_SET_ARGS = ('--replSet', '--configsvr', '--shardsvr')
+
+# release numbers of mongod binary and whether it's enterprise build (has inMemory engine)
+BinaryInfo = NamedTuple('BinaryInfo', [('version', Tuple[int, int, int]), ('enterprise', bool)])
+
+
+def binary_info(mongod: Path) -> BinaryInfo:
+    """Release of `mongod` binary, `mongod --version` is run once per binary (again when it's replaced)."""
+    return _binary_info(str(mongod), mongod.stat().st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=None)
+def _binary_info(mongod: str, _mtime: int) -> BinaryInfo:
+    try:
+        output = subprocess.check_output([mongod, '--version'], stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT, universal_newlines=True,
+                                         timeout=30)
+    except (OSError, subprocess.SubprocessError) as e:
+        raise MongodStartException("Can't run {mongod} --version: {error}".format(mongod=mongod, error=e)) from e
+
+    return parse_version_output(output, mongod)
+
+
+def parse_version_output(output: str, mongod: str = 'mongod') -> BinaryInfo:
+    match = _VERSION_RE.search(output)
+    if match is None:
+        raise MongodStartException("Unknown version of {mongod}:\n{output}".format(mongod=mongod, output=output))
+
+    major, minor, patch = (int(number) for number in match.groups())
+
+    return BinaryInfo(version=(major, minor, patch), enterprise=_ENTERPRISE_RE.search(output) is not None)
+
+
+def ram_args(info: BinaryInfo, args: Sequence[str] = (), in_memory: bool = True) -> List[str]:
+    """
+        mongod flags of RAM backed instance of `info` release, started with user `args` (flags given there aren't
+        overridden). `in_memory=False` keeps on-disk format engine, e.g. for dbpath cloned from snapshot.
+    """
+    version = info.version
+    engine = _arg_value(args, '--storageEngine')
+    options = []  # type: List[Tuple[str, Optional[str]]]
+    if engine == 'inMemory' or (engine is None and in_memory and info.enterprise and version >= (3, 2, 6)):
+        options.extend([('--storageEngine', 'inMemory'), ('--inMemorySizeGB', IN_MEMORY_SIZE)])
+    elif version < (3, 2):
+        options.extend([('--nojournal', None), ('--smallfiles', None)])
+    else:
+        options.append(('--wiredTigerCacheSizeGB', SMALL_CACHE_SIZE if version >= (3, 4) else '1'))
+        replica_set_member = any(has_arg(args, option) for option in _REPLICA_SET_ARGS)
+        if version < (6, 1) and not (replica_set_member and version >= (4, 0)):
+            options.append(('--nojournal', None))
+
+    flags = []  # type: List[str]
+    for option, value in options:
+        if not has_arg(args, option):
+            flags.extend([option] if value is None else [option, value])
+    if version >= (3, 2) and 'diagnosticDataCollectionEnabled' not in ' '.join(args):
+        flags.extend(['--setParameter', 'diagnosticDataCollectionEnabled=false'])
+
+    return flags
+
+
+@functools.lru_cache(maxsize=None)
+def ram_dir() -> Path:
+    """Parent of RAM backed data directories. It's default temporary directory on systems without `/dev/shm`."""
+    if RAM_DIR.is_dir() and os.access(str(RAM_DIR), os.W_OK | os.X_OK):
+        return RAM_DIR
+
+    logger.warning("{path} isn't available, data directories of RAM backed instances are on disk".format(path=RAM_DIR))
+
+    return Path(tempfile.gettempdir())
+
+
+def _arg_value(args: Sequence[str], option: str) -> Optional[str]:
+    for idx, arg in enumerate(args):
+        if arg == option and idx + 1 < len(args):
+            return args[idx + 1]
+        if arg.startswith(option + '='):
+            return arg[len(option) + 1:]
+
+    return None
+
+
+def has_arg(args: Sequence[str], option: str) -> bool:
+    return any(arg == option or arg.startswith(option + '=') for arg in args)
@@ -12,10 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+from pathlib import Path
 import platform
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 from .exceptions import InvalidOSException
 
+SUPPORTED_ARCHITECTURES = ('x86_64', 'aarch64')
+
+_ARCH_ALIASES = {
+    'amd64': 'x86_64',
+    'x64': 'x86_64',
+    'arm64': 'aarch64',
+}
+
+_OS_RELEASE_PATHS = (Path('/etc/os-release'), Path('/usr/lib/os-release'))
+
+# id and version_id of Linux distribution from os-release, id_like - distributions it's derived from
+Distro = NamedTuple('Distro', [('id', str), ('version_id', str), ('id_like', Tuple[str, ...])])
+
 
 class OSInfo:
     @staticmethod
@@ -28,7 +44,34 @@ class OSInfo:
 
     @staticmethod
     def architecture() -> str:
-        return platform.machine()
+        """Machine architecture, `x86_64` or `aarch64` on supported systems (`amd64`/`arm64` are reported as them)."""
+        return normalize_architecture(platform.machine())
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def distro() -> Optional[Distro]:
+        """Linux distribution from os-release, read once per process. None on other systems or when it's unknown."""
+        for path in _OS_RELEASE_PATHS:
+            try:
+                content = path.read_text()
+            except OSError:
+                continue
+
+            fields = parse_os_release(content)
+            return Distro(id=fields.get('ID', 'linux').lower(), version_id=fields.get('VERSION_ID', ''),
+                          id_like=tuple(fields.get('ID_LIKE', '').lower().split()))
+
+        return None
+
+    @staticmethod
+    def targets() -> List[str]:
+        """Build targets of distribution specific MongoDB packages which run on this system, best match first."""
+        if OSInfo.type() != 'linux':
+            return []
+
+        distro = OSInfo.distro()
+
+        return distro_targets(distro) if distro is not None else []
 
 
 class WorkingOSGuard:
@@ -41,5 +84,47 @@ class WorkingOSGuard:
     @staticmethod
     def ensure_valid_architecture() -> None:
         os_arch = OSInfo.architecture()
-        if os_arch != 'x86_64':
+        if os_arch not in SUPPORTED_ARCHITECTURES:
             raise InvalidOSException('System architecture {os_arch} is unsupported.'.format(os_arch=os_arch))
+
+
+def normalize_architecture(arch: str) -> str:
+    arch = arch.lower()
+
+    return _ARCH_ALIASES.get(arch, arch)
+
+
+def parse_os_release(content: str) -> Dict[str, str]:
+    fields = {}
+    for line in content.splitlines():
+        key, sep, value = line.strip().partition('=')
+        if sep and not key.startswith('#'):
+            fields[key] = value.strip().strip('"\'')
+
+    return fields
+
+
+def distro_targets(distro: Distro) -> List[str]:
+    """
+        Targets of MongoDB packages built for `distro`, e.g. `ubuntu2004` or `rhel80`. Packages for older minor
+        release of RHEL compatible distributions run on newer ones too, so `rhel84` is followed by `rhel83` ... `rhel80`.
+    """
+    numbers = [int(part) for part in distro.version_id.split('.') if part.isdigit()]
+    if not numbers:
+        return []
+    family = {distro.id} | set(distro.id_like)
+    major, minor = numbers[0], numbers[1] if len(numbers) > 1 else 0
+
+    if distro.id == 'ubuntu':
+        return ['ubuntu{major}{minor:02d}'.format(major=major, minor=minor)]
+    if distro.id == 'debian':
+        return ['debian{major}'.format(major=major)]
+    if distro.id == 'amzn':
+        # Amazon Linux 1 has versions like 2018.03
+        return ['amazon{major}'.format(major=major) if major < 2000 else 'amazon']
+    if 'suse' in family or 'sles' in family:
+        return ['suse{major}'.format(major=major)]
+    if 'rhel' in family:
+        return ['rhel{major}{minor}'.format(major=major, minor=release) for release in range(min(minor, 9), -1, -1)]
+
+    return []
@@ -0,0 +1,260 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Replica sets and sharded clusters started from extracted package `bin` directory (see `PackageManager.extract()`).
+    Transactions and change streams aren't available on standalone mongod.
+"""
+
+from concurrent import futures
+import functools
+import logging
+from pathlib import Path
+import re
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, TypeVar  # noqa: F401
+
+from .exceptions import TopologyException
+from .process import MongodLauncher, MongodProcess, MongosLauncher
+from .registry import InstanceRegistry
+from .wire import WireClient
+
+logger = logging.getLogger(__name__)
+
+# 3.x/4.0: "transition to PRIMARY from SECONDARY", "transition to primary complete", 4.4+: "newState":"PRIMARY"
+_STATE_CHANGE_RE = re.compile(r'transition to|"newState"', re.IGNORECASE)
+# state is probed again after this many seconds even without log line, e.g. when output goes to --logpath
+_PROBE_INTERVAL = 0.5
+
+# process_time - from process start until it accepted connections, total_time - from topology start until member reached its role
+MemberStartup = NamedTuple('MemberStartup', [('address', str), ('role', str), ('process_time', float), ('total_time', float)])
+
+T = TypeVar('T')
+
+
+class ReplicaSet:
+    """
+        Replica set of `members` mongod instances started from `bin_dir` on free ports. Members start in parallel,
+        replica set is initiated on the first one and `start()` returns when there is primary and all other members
+        are secondaries. Bring-up time of every member is reported in `startup`.
+
+        `args` are passed to every member, `configsvr` makes it config server replica set of sharded cluster.
+        Ports are leased from `registry` when it's given, `ram` makes members RAM backed (see `MongodLauncher`).
+    """
+    def __init__(self, bin_dir: Path, members: int = 3, name: str = 'rs0', host: str = '127.0.0.1', args: Sequence[str] = (),
+                 timeout: float = 60.0, configsvr: bool = False, registry: Optional[InstanceRegistry] = None, ram: bool = False):
+        if members < 1:
+            raise ValueError("Replica set needs at least one member")
+
+        self.name = name
+        self.startup = []  # type: List[MemberStartup]
+        self._launcher = MongodLauncher(bin_dir, registry, ram)
+        self._size = members
+        self._host = host
+        self._args = list(args) + (['--configsvr'] if configsvr else [])
+        self._timeout = timeout
+        self._configsvr = configsvr
+        self._members = []  # type: List[MongodProcess]
+
+    @property
+    def members(self) -> List[MongodProcess]:
+        return list(self._members)
+
+    @property
+    def primary(self) -> MongodProcess:
+        for process in self._members:
+            if _member_state(process) == 'PRIMARY':
+                return process
+
+        raise TopologyException("Replica set {name} has no primary".format(name=self.name))
+
+    @property
+    def connection_string(self) -> str:
+        """`<name>/<host:port>,...` form used by `addShard` and `mongos --configdb`."""
+        return '{name}/{hosts}'.format(name=self.name, hosts=','.join(process.address for process in self._members))
+
+    @property
+    def uri(self) -> str:
+        return 'mongodb://{hosts}/?replicaSet={name}'.format(hosts=','.join(process.address for process in self._members), name=self.name)
+
+    def start(self) -> 'ReplicaSet':
+        start_time = time.monotonic()
+        self._members = _start_all([lambda: self._launcher.start(host=self._host, args=['--replSet', self.name] + self._args, timeout=self._timeout)
+                                    for _ in range(self._size)])
+        try:
+            self._initiate()
+            deadline = start_time + self._timeout
+            roles = ['PRIMARY'] + ['SECONDARY'] * (len(self._members) - 1)
+            reached = _parallel([functools.partial(_wait_for_state, process, role, deadline) for process, role in zip(self._members, roles)])
+        except BaseException:
+            self.stop()
+            raise
+
+        self.startup = [MemberStartup(address=process.address, role=role, process_time=process.startup_time or 0.0, total_time=reached_at - start_time)
+                        for process, role, reached_at in zip(self._members, roles, reached)]
+        logger.info("Replica set {name} started in {time:.3f}s".format(name=self.name, time=time.monotonic() - start_time))
+
+        return self
+
+    def stop(self) -> None:
+        members, self._members = self._members, []
+        _parallel([process.stop for process in members])
+
+    def __enter__(self) -> 'ReplicaSet':
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def _initiate(self) -> None:
+        # higher priority makes the first member primary, so there's no need to find out which one won the election
+        config = {'_id': self.name, 'members': [{'_id': idx, 'host': process.address, 'priority': 2 if idx == 0 else 1}
+                                                for idx, process in enumerate(self._members)]}  # type: Dict[str, Any]
+        if self._configsvr:
+            config['configsvr'] = True
+
+        with WireClient(self._members[0].host, self._members[0].port) as client:
+            client.command('admin', 'replSetInitiate', config)
+
+
+class ShardedCluster:
+    """
+        Sharded cluster started from `bin_dir`: config server replica set of `config_members`, `shards` replica sets
+        of `shard_members` each and `routers` mongos instances. Replica sets start in parallel, then mongos routers
+        start and shards are added. Connect to `uri`, bring-up time of every member is reported in `startup`.
+        Ports of all members are leased from `registry` when it's given, `ram` makes replica set members RAM backed.
+    """
+    def __init__(self, bin_dir: Path, shards: int = 2, shard_members: int = 1, config_members: int = 1, routers: int = 1, host: str = '127.0.0.1',
+                 args: Sequence[str] = (), timeout: float = 120.0, registry: Optional[InstanceRegistry] = None, ram: bool = False):
+        if shards < 1 or routers < 1:
+            raise ValueError("Sharded cluster needs at least one shard and one router")
+
+        self.startup = []  # type: List[MemberStartup]
+        self.config_servers = ReplicaSet(bin_dir, config_members, name='configRS', host=host, args=args, timeout=timeout, configsvr=True,
+                                         registry=registry, ram=ram)
+        self.shards = [ReplicaSet(bin_dir, shard_members, name='shard{idx}'.format(idx=idx), host=host, args=list(args) + ['--shardsvr'],
+                                  timeout=timeout, registry=registry, ram=ram)
+                       for idx in range(shards)]
+        self._mongos_launcher = MongosLauncher(bin_dir, registry)
+        self._routers_count = routers
+        self._host = host
+        self._timeout = timeout
+        self._routers = []  # type: List[MongodProcess]
+
+    @property
+    def routers(self) -> List[MongodProcess]:
+        return list(self._routers)
+
+    @property
+    def uri(self) -> str:
+        return 'mongodb://{hosts}'.format(hosts=','.join(process.address for process in self._routers))
+
+    def start(self) -> 'ShardedCluster':
+        start_time = time.monotonic()
+        try:
+            _parallel([replica_set.start for replica_set in [self.config_servers] + self.shards])
+            configdb = self.config_servers.connection_string
+            self._routers = _start_all([lambda: self._mongos_launcher.start(configdb, host=self._host, timeout=self._timeout)
+                                        for _ in range(self._routers_count)])
+            with WireClient(self._routers[0].host, self._routers[0].port) as client:
+                for shard in self.shards:
+                    client.command('admin', 'addShard', shard.connection_string)
+        except BaseException:
+            self.stop()
+            raise
+
+        routers_time = time.monotonic() - start_time
+        self.startup = [member._replace(role='CONFIG_' + member.role) for member in self.config_servers.startup]
+        for shard in self.shards:
+            self.startup.extend(member._replace(role='SHARD_' + member.role) for member in shard.startup)
+        self.startup.extend(MemberStartup(address=process.address, role='MONGOS', process_time=process.startup_time or 0.0, total_time=routers_time)
+                            for process in self._routers)
+        logger.info("Sharded cluster with {count} shards started in {time:.3f}s".format(count=len(self.shards), time=routers_time))
+
+        return self
+
+    def stop(self) -> None:
+        routers, self._routers = self._routers, []
+        _parallel([process.stop for process in routers])
+        _parallel([replica_set.stop for replica_set in self.shards + [self.config_servers]])
+
+    def __enter__(self) -> 'ShardedCluster':
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def _member_state(process: MongodProcess) -> Optional[str]:
+    with WireClient(process.host, process.port) as client:
+        return _state(client.command('admin', 'isMaster'))
+
+
+def _state(reply: Dict[str, Any]) -> Optional[str]:
+    if reply.get('ismaster') and reply.get('setName'):
+        return 'PRIMARY'
+    if reply.get('secondary'):
+        return 'SECONDARY'
+
+    return None
+
+
+def _wait_for_state(process: MongodProcess, state: str, deadline: float) -> float:
+    """
+        Waits until member reaches `state` and returns time.monotonic() when it did. Member is probed with isMaster
+        whenever it logs replica set state transition, so there is no polling delay.
+    """
+    with WireClient(process.host, process.port) as client:
+        while True:
+            lines_read = process.lines_read
+            if _state(client.command('admin', 'isMaster')) == state:
+                logger.debug("Member {address} is {state}".format(address=process.address, state=state))
+                return time.monotonic()
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not process.is_running():
+                raise TopologyException("Member {address} didn't become {state}. Output:\n{output}".format(
+                    address=process.address,
+                    state=state,
+                    output='\n'.join(process.output[-20:])
+                ))
+            process.wait_for_output(_STATE_CHANGE_RE, min(remaining, _PROBE_INTERVAL), after=lines_read)
+
+
+def _parallel(calls: Sequence[Callable[[], T]]) -> List[T]:
+    """Runs `calls` in threads and returns their results. First error is raised after all calls finished."""
+    if not calls:
+        return []
+
+    with futures.ThreadPoolExecutor(len(calls)) as pool:
+        jobs = [pool.submit(call) for call in calls]
+    errors = [job.exception() for job in jobs if job.exception()]
+    if errors:
+        raise errors[0]  # type: ignore
+
+    return [job.result() for job in jobs]
+
+
+def _start_all(starts: Sequence[Callable[[], MongodProcess]]) -> List[MongodProcess]:
+    """Starts processes in parallel. When any of them fails, the others are stopped."""
+    with futures.ThreadPoolExecutor(len(starts)) as pool:
+        jobs = [pool.submit(start) for start in starts]
+    processes = [job.result() for job in jobs if not job.exception()]
+
+    errors = [job.exception() for job in jobs if job.exception()]
+    if errors:
+        _parallel([process.stop for process in processes])
+        raise TopologyException("{count} of {total} processes couldn't be started: {error}".format(count=len(errors), total=len(starts), error=errors[0]))
+
+    return processes
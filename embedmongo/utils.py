@@ -12,39 +12,483 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent import futures
+import contextlib
+import hashlib
 from http import HTTPStatus
+import io
 import logging
+import os
 from pathlib import Path
+import shutil
+import stat
 import tarfile
-from typing import NamedTuple, Optional
+import tempfile
+import threading
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 import requests
-import tqdm
 
-from .exceptions import DownloadFileException
-from .log import TqdmToLogger
+from .blobstore import BlobStore, extract_to_store, file_digest, manifest_key, ManifestEntry, materialize
+from .events import DownloadFailed, DownloadFinished, DownloadProgress, DownloadStarted, ExtractFinished, hooks
+from .exceptions import ChecksumMismatchException, DownloadFileException, IncompleteDownloadException
+from .extract import extract_members, Include, MemberFilter
 
 logger = logging.getLogger(__name__)
 
 
-DownloadResult = NamedTuple('DownloadResult', [('etag', Optional[str]), ('saved', bool)])
+# size - number of bytes received from server during this call, sha256 - hex digest of saved file (None when not modified)
+DownloadResult = NamedTuple('DownloadResult', [('etag', Optional[str]), ('saved', bool), ('size', int), ('sha256', Optional[str])])
+DownloadResult.__new__.__defaults__ = (None,)  # type: ignore
 
+_CHUNK_SIZE = 1024*1024
+_MIN_SEGMENT_SIZE = 4*1024*1024
 
-def download_file(url: str, dst: Path, etag: Optional[str] = None) -> DownloadResult:
-    headers = None
-    if etag:
-        headers = {'If-None-Match': etag}
 
+def download_file(url: str, dst: Path, etag: Optional[str] = None, part_etag: Optional[str] = None, segments: int = 1,
+                  session: Optional[requests.Session] = None, expected_sha256: Optional[str] = None) -> DownloadResult:
+    """
+        Downloads `url` to `dst`. Data goes to `<dst>.part` file, which is renamed to `dst` only when it's complete.
+
+        Interrupted download raises IncompleteDownloadException carrying ETag of received data and keeps `.part` file.
+        Passing that ETag back as `part_etag` resumes download with `Range`/`If-Range` request. With `segments` > 1
+        large files are fetched as that many byte ranges in parallel.
+
+        Requests are sent with `session` if it's given, so its connection pool is reused.
+
+        SHA-256 of the file is computed from received chunks. When it differs from `expected_sha256`,
+        ChecksumMismatchException is raised and neither `dst` nor `.part` file is kept.
+    """
     filename = dst.name
+    part_path = _part_path(dst)
 
-    with requests.get(url, headers=headers, stream=True) as req:
-        content_length = req.headers.get('content-length')
+    headers = {}  # type: Dict[str, str]
+    if etag:
+        headers['If-None-Match'] = etag
+
+    resume_from = part_path.stat().st_size if part_etag and part_path.exists() else 0
+    if resume_from and part_etag:
+        headers['Range'] = 'bytes={start}-'.format(start=resume_from)
+        headers['If-Range'] = part_etag
+
+    start_time = time.monotonic()
+    with _get(url, filename, headers, session) as req:
         new_etag = req.headers.get('etag')
 
-        total_size = None
-        if content_length:
-            total_size = int(content_length)
+        if req.status_code == HTTPStatus.NOT_MODIFIED:
+            _not_modified(url, filename, start_time)
+            return DownloadResult(etag=new_etag, saved=False, size=0, sha256=None)
+
+        if req.status_code != HTTPStatus.PARTIAL_CONTENT:
+            resume_from = 0
+
+        content_length = _content_length(req)
+        total_size = None if content_length is None else resume_from + content_length
+        logger.debug('Downloaded file {name} size: {size}'.format(name=filename, size=total_size))
+
+        sha256 = hashlib.sha256()
+        if new_etag and total_size and segments > 1 and total_size >= segments * _MIN_SEGMENT_SIZE and req.headers.get('accept-ranges') == 'bytes':
+            req.close()
+            size = _download_segments(url, part_path, total_size, new_etag, segments, resume=part_etag == new_etag, session=session, sha256=sha256)
+        else:
+            if resume_from:
+                logger.info('Resuming download of {name} from byte {start}'.format(name=filename, start=resume_from))
+                # only received part is read again, the rest is hashed as it arrives
+                _hash_file(part_path, sha256)
+            with part_path.open("ab" if resume_from else "wb") as local_file, _Progress(url, filename, total_size, resume_from) as progress:
+                size = _write_chunks(req, local_file, progress.update, url, new_etag, sha256)
+
+    digest = sha256.hexdigest()
+    if expected_sha256 is not None:
+        try:
+            verify_checksum(digest, expected_sha256, url)
+        except ChecksumMismatchException:
+            part_path.unlink()
+            raise
+
+    part_path.replace(dst)
+
+    return DownloadResult(etag=new_etag, saved=True, size=size, sha256=digest)
+
 
+def verify_checksum(digest: str, expected: str, source: str) -> None:
+    if digest.lower() != expected.lower():
+        raise ChecksumMismatchException("Checksum of {source} doesn't match. Expected SHA-256: {expected}, got: {digest}".format(
+            source=source, expected=expected, digest=digest
+        ))
+
+
+def parse_checksums(content: str) -> Dict[str, str]:
+    """
+        Parses `sha256sum` output, i.e. `<hex digest>  <filename>` lines, to mapping of filename to digest.
+        Digest without filename (some `.sha256` sidecars) is returned under empty name.
+    """
+    checksums = {}  # type: Dict[str, str]
+    for line in content.splitlines():
+        parts = line.split(None, 1)
+        if parts:
+            # `*` marks binary mode
+            checksums[parts[1].strip().lstrip('*') if len(parts) > 1 else ''] = parts[0].lower()
+
+    return checksums
+
+
+def fetch_checksum(url: str, session: Optional[requests.Session] = None) -> Optional[str]:
+    """Returns SHA-256 of file at `url` published in `<url>.sha256` sidecar, None when there's no sidecar."""
+    checksum_url = url + '.sha256'
+    with (session or requests).get(checksum_url) as req:
+        if req.status_code == HTTPStatus.NOT_FOUND:
+            logger.debug("No checksum published for {url}".format(url=url))
+            return None
+        if not req.ok:
+            raise DownloadFileException("Checksum {url} couldn't be downloaded. Status code: {code}".format(url=checksum_url, code=req.status_code))
+
+        checksums = parse_checksums(req.text)
+
+    filename = url.rsplit('/', 1)[-1]
+    digest = checksums.get(filename, checksums.get('', None))
+    if digest is None and len(checksums) == 1:
+        digest = next(iter(checksums.values()))
+
+    return digest
+
+
+def _part_path(dst: Path) -> Path:
+    return dst.with_name(dst.name + '.part')
+
+
+def _download_segments(url: str, part_path: Path, total_size: int, etag: str, segments: int, resume: bool,
+                       session: Optional[requests.Session], sha256: Any) -> int:
+    segment_size = -(-total_size // segments)
+    ranges = [(start, min(start + segment_size, total_size) - 1) for start in range(0, total_size, segment_size)]
+    segment_paths = [part_path.with_name('{name}.{idx}'.format(name=part_path.name, idx=idx)) for idx in range(len(ranges))]
+
+    if not resume:
+        for segment_path in segment_paths:
+            if segment_path.exists():
+                segment_path.unlink()
+
+    initial = sum(path.stat().st_size for path in segment_paths if path.exists())
+    progress_lock = threading.Lock()
+
+    filename = part_path.name[:-len('.part')]
+    with _Progress(url, filename, total_size, initial) as progress, futures.ThreadPoolExecutor(len(ranges)) as pool:
+        def on_chunk(size: int) -> None:
+            with progress_lock:
+                progress.update(size)
+
+        jobs = [pool.submit(_download_segment, url, etag, byte_range, segment_path, on_chunk, session)
+                for byte_range, segment_path in zip(ranges, segment_paths)]
+        for job in jobs:
+            job.result()
+
+    # segments are read once anyway while they're joined, so file is hashed on the way
+    with part_path.open("wb") as part_file:
+        for segment_path in segment_paths:
+            with segment_path.open("rb") as segment_file:
+                for chunk in iter(lambda: segment_file.read(_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+                    part_file.write(chunk)
+            segment_path.unlink()
+
+    return total_size - initial
+
+
+def _download_segment(url: str, etag: str, byte_range: Tuple[int, int], dst: Path, on_chunk: Callable[[int], None],
+                      session: Optional[requests.Session]) -> None:
+    start, end = byte_range
+    done = dst.stat().st_size if dst.exists() else 0
+    if start + done > end:
+        return
+
+    headers = {'Range': 'bytes={start}-{end}'.format(start=start + done, end=end), 'If-Range': etag}
+    with _get(url, dst.name, headers, session) as req:
+        if req.status_code != HTTPStatus.PARTIAL_CONTENT:
+            raise DownloadFileException("Package file {file} changed on {url} during segmented download".format(file=dst.name, url=url))
+
+        with dst.open("ab") as local_file:
+            _write_chunks(req, local_file, on_chunk, url, etag)
+
+
+def _write_chunks(req: requests.Response, local_file: BinaryIO, on_chunk: Callable[[int], None], url: str, etag: Optional[str],
+                  sha256: Any = None) -> int:
+    written = 0
+    try:
+        for chunk in req.iter_content(chunk_size=_CHUNK_SIZE):
+            if chunk:
+                local_file.write(chunk)
+                if sha256 is not None:
+                    sha256.update(chunk)
+                written += len(chunk)
+                on_chunk(len(chunk))
+    except requests.RequestException as e:
+        raise IncompleteDownloadException("Download from {url} interrupted after {size} bytes: {error}".format(url=url, size=written, error=e),
+                                          etag=etag) from e
+
+    expected = _content_length(req)
+    if expected is not None and written < expected and 'content-encoding' not in req.headers:
+        raise IncompleteDownloadException("Download from {url} interrupted after {size} of {expected} bytes".format(url=url, size=written, expected=expected),
+                                          etag=etag)
+
+    return written
+
+
+def download_and_extract(url: str, dst: Path, strip_level: int = 0, etag: Optional[str] = None, archive_copy: Optional[Path] = None,
+                         session: Optional[requests.Session] = None, blob_store: Optional[BlobStore] = None, include: Include = None,
+                         expected_sha256: Optional[str] = None) -> DownloadResult:
+    """
+        Streams tar.gz archive from `url` straight into `dst` directory, without storing archive on disk first.
+        If `archive_copy` is given, received bytes are also written there. Only members selected by `include`
+        patterns are extracted (see `MemberFilter`).
+
+        Archive is extracted next to `dst` and replaces it only when whole stream was read successfully and its
+        SHA-256 matches `expected_sha256` (if given). The same applies to `archive_copy`, which is written to
+        a `.part` file first, so previously kept archive survives failed download.
+    """
+    if strip_level < 0:
+        raise ValueError("strip_level argument should not be negative")
+
+    filename = archive_copy.name if archive_copy else url.rsplit('/', 1)[-1]
+
+    headers = {'If-None-Match': etag} if etag else {}
+    start_time = time.monotonic()
+    with _get(url, filename, headers, session) as req:
+        new_etag = req.headers.get('etag')
+        if req.status_code == HTTPStatus.NOT_MODIFIED:
+            _not_modified(url, filename, start_time)
+            return DownloadResult(etag=new_etag, saved=False, size=0, sha256=None)
+
+        partial_dst = dst.parent / (dst.name + '.partial')
+        if partial_dst.exists():
+            shutil.rmtree(str(partial_dst))
+
+        copy_part = _part_path(archive_copy) if archive_copy else None
+        try:
+            size, digest = _extract_response(req, partial_dst, strip_level, filename, copy_part, blob_store, include, expected_sha256)
+        except BaseException:
+            shutil.rmtree(str(partial_dst), ignore_errors=True)
+            if copy_part:
+                with contextlib.suppress(FileNotFoundError):
+                    copy_part.unlink()
+            raise
+
+        if archive_copy and copy_part:
+            os.replace(str(copy_part), str(archive_copy))
+        partial_dst.mkdir(parents=True, exist_ok=True)
+        publish_dir(partial_dst, dst)
+
+        return DownloadResult(etag=new_etag, saved=True, size=size, sha256=digest)
+
+
+def publish_dir(src: Path, dst: Path) -> None:
+    """
+        Moves complete `src` directory to `dst`. Replaced tree is renamed aside before removal, so `dst` never
+        contains half-removed tree and files still open from it (e.g. binaries of running mongod) stay valid.
+    """
+    old_dst = None
+    if dst.exists():
+        old_dst = Path(tempfile.mkdtemp(prefix='.{name}.old-'.format(name=dst.name), dir=str(dst.parent)))
+        # rename replaces empty directory
+        dst.rename(old_dst)
+
+    src.rename(dst)
+    if old_dst:
+        shutil.rmtree(str(old_dst), ignore_errors=True)
+
+
+def merge_dir(src: Path, dst: Path) -> None:
+    """Moves content of `src` directory into existing `dst`. Every file is replaced atomically, `src` is removed."""
+    for dir_name, _, file_names in os.walk(str(src)):
+        target_dir = dst / os.path.relpath(dir_name, str(src))
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for file_name in file_names:
+            os.replace(os.path.join(dir_name, file_name), str(target_dir / file_name))
+
+    shutil.rmtree(str(src))
+
+
+def tree_size(path: Path) -> int:
+    """Total size of regular files under `path` directory, 0 when it doesn't exist. Links aren't followed."""
+    size = 0
+    for dir_name, _, file_names in os.walk(str(path)):
+        for file_name in file_names:
+            with contextlib.suppress(FileNotFoundError):
+                file_stat = os.lstat(os.path.join(dir_name, file_name))
+                if stat.S_ISREG(file_stat.st_mode):
+                    size += file_stat.st_size
+
+    return size
+
+
+def _extract_response(req: requests.Response, dst: Path, strip_level: int, filename: str, archive_copy: Optional[Path],
+                      blob_store: Optional[BlobStore], include: Include, expected_sha256: Optional[str]) -> Tuple[int, str]:
+    sha256 = hashlib.sha256()
+    start_time = time.monotonic()
+
+    with contextlib.ExitStack() as stack:
+        progress = stack.enter_context(_Progress(req.url, filename, _content_length(req)))
+        copy_file = stack.enter_context(archive_copy.open("wb")) if archive_copy else None
+
+        def on_chunk(chunk: bytes) -> None:
+            if copy_file:
+                copy_file.write(chunk)
+            sha256.update(chunk)
+            progress.update(len(chunk))
+
+        stream = _ChunkStream(req.iter_content(chunk_size=_CHUNK_SIZE), on_chunk)
+        with tarfile.open(fileobj=stream, mode='r|gz') as tar:
+            if blob_store:
+                entries = extract_to_store(tar, dst, _selected_members(tar, strip_level, include), blob_store)
+                files = _count_files(entries)
+            else:
+                files = sum(1 for member in extract_members(tar, dst, _stripped_members(tar, strip_level), include) if member.isfile())
+        # tar stream ends before the end of the gzip file (padding), rest is still needed for archive copy and digest
+        stream.drain()
+    _extracted(req.url, dst, files, progress.received, start_time)
+
+    digest = sha256.hexdigest()
+    if expected_sha256 is not None:
+        verify_checksum(digest, expected_sha256, req.url)
+
+    # manifest of filtered extraction doesn't describe whole archive
+    if blob_store and include is None:
+        blob_store.save_manifest(manifest_key(digest, strip_level), entries)
+
+    return progress.received, digest
+
+
+def extract_file(src: Path, dst: Path, strip_level: Optional[int] = 0, blob_store: Optional[BlobStore] = None, include: Include = None,
+                 expected_sha256: Optional[str] = None) -> None:
+    """
+        Extracts tar.gz `src` to `dst` in one pass over archive, see `extract_members`. Only members selected by
+        `include` patterns are extracted. With `blob_store` files are linked from content-addressed store.
+
+        With `expected_sha256` archive is hashed while it's read and ChecksumMismatchException is raised when it
+        doesn't match. Files extracted by then are left in `dst`, so it should be a temporary directory.
+    """
+    if strip_level is not None and strip_level < 0:
+        raise ValueError("strip_level argument should not be negative")
+
+    start_time = time.monotonic()
+    if blob_store:
+        files = _extract_file_to_store(src, dst, strip_level or 0, blob_store, include, expected_sha256)
+        _extracted(str(src), dst, files, src.stat().st_size, start_time)
+        return
+
+    sha256 = hashlib.sha256()
+    with src.open('rb') as f:
+        stream = _ChunkStream(iter(lambda: f.read(_CHUNK_SIZE), b''), sha256.update)
+        with tarfile.open(fileobj=stream, mode='r|gz') as tar:
+            members = extract_members(tar, dst, _stripped_members(tar, strip_level or 0), include)
+        if expected_sha256 is not None:
+            stream.drain()
+            verify_checksum(sha256.hexdigest(), expected_sha256, str(src))
+    _extracted(str(src), dst, sum(1 for member in members if member.isfile()), src.stat().st_size, start_time)
+
+
+def _extract_file_to_store(src: Path, dst: Path, strip_level: int, store: BlobStore, include: Include, expected_sha256: Optional[str]) -> int:
+    digest = file_digest(src)
+    if expected_sha256 is not None:
+        verify_checksum(digest, expected_sha256, str(src))
+
+    key = manifest_key(digest, strip_level)
+    with store.using():
+        # blobs listed in manifest mustn't be pruned before they're linked
+        entries = store.load_manifest(key)
+        if entries is not None:
+            logger.debug("Archive {name} found in blob store. Linking files without decompression.".format(name=src.name))
+            selected = MemberFilter(include)
+            entries = [entry for entry in entries if selected(entry['path'])]
+            materialize(store, dst, entries)
+            return _count_files(entries)
+
+    with tarfile.open(str(src), mode='r|gz') as tar:
+        entries = extract_to_store(tar, dst, _selected_members(tar, strip_level, include), store)
+    if include is None:
+        store.save_manifest(key, entries)
+
+    return _count_files(entries)
+
+
+def _count_files(entries: List[ManifestEntry]) -> int:
+    return sum(1 for entry in entries if entry['type'] == 'file')
+
+
+def _not_modified(url: str, filename: str, start_time: float) -> None:
+    if hooks.active:
+        hooks.emit(DownloadFinished(url=url, filename=filename, size=0, duration=time.monotonic() - start_time, rate=0.0, not_modified=True))
+
+
+def _extracted(source: str, dst: Path, files: int, archive_size: int, start_time: float) -> None:
+    if hooks.active:
+        hooks.emit(ExtractFinished(source=source, dst=dst, files=files, archive_size=archive_size, duration=time.monotonic() - start_time))
+
+
+def _hash_file(path: Path, sha256: Any) -> None:
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+
+
+def _stripped_members(tar: tarfile.TarFile, strip_level: int) -> Iterator[tarfile.TarInfo]:
+    for member in tar:
+        stripped = _strip_member(member, strip_level)
+        if stripped:
+            yield stripped
+
+
+def _selected_members(tar: tarfile.TarFile, strip_level: int, include: Include) -> Iterator[tarfile.TarInfo]:
+    selected = MemberFilter(include)
+    for member in _stripped_members(tar, strip_level):
+        if selected(member.name):
+            yield member
+
+
+def _strip_member(member: tarfile.TarInfo, strip_level: int) -> Optional[tarfile.TarInfo]:
+    if not strip_level:
+        return member
+
+    member.name = '/'.join(member.name.split('/')[strip_level:])
+    if member.islnk():
+        member.linkname = '/'.join(member.linkname.split('/')[strip_level:])
+
+    return member if member.name else None
+
+
+class _ChunkStream(io.RawIOBase):
+    """Read-only file object over iterator of chunks. Every chunk is passed to `on_chunk` when it's consumed."""
+    def __init__(self, chunks: Iterator[bytes], on_chunk: Callable[[bytes], None]):
+        super().__init__()
+        self._chunks = chunks
+        self._on_chunk = on_chunk
+        self._buffer = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._on_chunk(chunk)
+            self._buffer = memoryview(chunk)
+
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+
+        return size
+
+    def drain(self) -> None:
+        for chunk in self._chunks:
+            self._on_chunk(chunk)
+
+
+@contextlib.contextmanager
+def _get(url: str, filename: str, headers: Dict[str, str], session: Optional[requests.Session] = None) -> Iterator[requests.Response]:
+    with (session or requests).get(url, headers=headers, stream=True) as req:
         if not req.ok:
             error_msg = "Package file {file} couldn't be downloaded from {url}. Status code: {code}. Msg: {msg}".format(
                 url=url,
@@ -53,49 +497,55 @@ def download_file(url: str, dst: Path, etag: Optional[str] = None) -> DownloadRe
                 msg=req.text
             )
             raise DownloadFileException(error_msg)
-        elif req.status_code == HTTPStatus.NOT_MODIFIED:
-            saved = False
-        else:
-            logger.debug('Downloaded file {name} size: {size}'.format(name=filename, size=total_size))
-            with dst.open("wb") as local_file, _progress_bar(filename, total_size) as pgbar:
-                chunk_size = 1024*1024
 
-                for chunk in req.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        local_file.write(chunk)
-                        pgbar.update(len(chunk))
-            saved = True
+        yield req
 
-        return DownloadResult(etag=new_etag, saved=saved)
 
+def _content_length(req: requests.Response) -> Optional[int]:
+    content_length = req.headers.get('content-length')
 
-def extract_file(src: Path, dst: Path, strip_level: Optional[int] = 0) -> None:
-    if strip_level is not None and strip_level < 0:
-        raise ValueError("strip_level argument should not be negative")
+    return int(content_length) if content_length else None
 
-    with tarfile.open(str(src)) as tar:
-        members = []
-        if strip_level:
-            for member in tar.getmembers():
-                member.name = '/'.join(member.name.split('/')[strip_level:])
-                if member.name:
-                    members.append(member)
-        else:
-            members = tar.getmembers()
 
-        tar.extractall(path=str(dst), members=members)
+class _Progress:
+    """
+        Progress of one download. Chunks are only counted, DownloadProgress is emitted at most every
+        `hooks.progress_interval` seconds. DownloadFinished or DownloadFailed is emitted when it's closed.
+    """
+    def __init__(self, url: str, filename: str, total: Optional[int], initial: int = 0):
+        self.received = 0
+        self._url = url
+        self._filename = filename
+        self._total = total
+        self._initial = initial
+        self._start_time = time.monotonic()
+        self._next_report = self._start_time + hooks.progress_interval
+
+        if hooks.active:
+            hooks.emit(DownloadStarted(url=url, filename=filename, total=total, resumed_from=initial))
 
+    def update(self, size: int) -> None:
+        self.received += size
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._next_report = now + hooks.progress_interval
+            if hooks.active:
+                hooks.emit(DownloadProgress(url=self._url, filename=self._filename, received=self._initial + self.received, total=self._total,
+                                            rate=self._rate(now)))
 
-def _progress_bar(desc: str, total: Optional[int]) -> tqdm.tqdm:
-    tqdm_out = TqdmToLogger(logger, level=logging.INFO)
-    bar_format = "{desc}: {percentage:3.0f}% | {n_fmt}/{total_fmt} [{elapsed}, {rate_fmt}{postfix}]"
+    def __enter__(self) -> '_Progress':
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, *_: Any) -> None:
+        if not hooks.active:
+            return
+
+        now = time.monotonic()
+        if exc_type is None:
+            hooks.emit(DownloadFinished(url=self._url, filename=self._filename, size=self.received, duration=now - self._start_time,
+                                        rate=self._rate(now), not_modified=False))
+        else:
+            hooks.emit(DownloadFailed(url=self._url, filename=self._filename, received=self._initial + self.received, error=str(exc)))
 
-    return tqdm.tqdm(
-        total=total,
-        miniters=1,
-        unit_scale=True,
-        unit='B',
-        desc=desc,
-        file=tqdm_out,
-        bar_format=bar_format
-    )
+    def _rate(self, now: float) -> float:
+        return self.received / max(now - self._start_time, 1e-6)
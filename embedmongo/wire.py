@@ -0,0 +1,298 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Minimal MongoDB wire protocol client. It's only meant for administrative commands needed by this package
+    (dropping databases, initiating replica sets, ...), so package doesn't depend on full driver.
+"""
+
+import collections
+import datetime
+import itertools
+import socket
+import struct
+import threading
+from typing import Any, Callable, Dict, List, Mapping, Tuple
+
+from .exceptions import MongoCommandException
+
+_OP_REPLY = 1
+_OP_QUERY = 2004
+_OP_MSG = 2013
+
+# OP_MSG is supported since MongoDB 3.6
+_OP_MSG_WIRE_VERSION = 6
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+_INT32 = struct.Struct('<i')
+_INT64 = struct.Struct('<q')
+_UINT64 = struct.Struct('<Q')
+_DOUBLE = struct.Struct('<d')
+_HEADER = struct.Struct('<iiii')
+
+
+class ObjectId(bytes):
+    def __repr__(self) -> str:
+        return 'ObjectId({hex})'.format(hex=self.hex())
+
+
+Timestamp = collections.namedtuple('Timestamp', ['time', 'inc'])
+
+
+def encode_document(doc: Mapping[str, Any]) -> bytes:
+    body = b''.join(_encode_element(key, value) for key, value in doc.items())
+
+    return _INT32.pack(len(body) + 5) + body + b'\x00'
+
+
+def decode_document(data: bytes, offset: int = 0) -> Tuple[Dict[str, Any], int]:
+    """Returns decoded document and offset just after it."""
+    size = _INT32.unpack_from(data, offset)[0]
+    end = offset + size - 1
+    position = offset + 4
+    doc = collections.OrderedDict()  # type: Dict[str, Any]
+    while position < end:
+        element_type = data[position]
+        key, position = _decode_cstring(data, position + 1)
+        doc[key], position = _DECODERS[element_type](data, position)
+
+    return doc, end + 1
+
+
+def _encode_cstring(value: str) -> bytes:
+    return value.encode('utf-8') + b'\x00'
+
+
+def _encode_string(value: str) -> bytes:
+    encoded = value.encode('utf-8')
+
+    return _INT32.pack(len(encoded) + 1) + encoded + b'\x00'
+
+
+def _encode_element(key: str, value: Any) -> bytes:  # noqa: C901
+    name = _encode_cstring(key)
+    if value is None:
+        return b'\x0A' + name
+    if isinstance(value, bool):
+        return b'\x08' + name + (b'\x01' if value else b'\x00')
+    if isinstance(value, int):
+        if -2 ** 31 <= value < 2 ** 31:
+            return b'\x10' + name + _INT32.pack(value)
+        return b'\x12' + name + _INT64.pack(value)
+    if isinstance(value, float):
+        return b'\x01' + name + _DOUBLE.pack(value)
+    if isinstance(value, str):
+        return b'\x02' + name + _encode_string(value)
+    if isinstance(value, Mapping):
+        return b'\x03' + name + encode_document(value)
+    if isinstance(value, Timestamp):
+        return b'\x11' + name + _UINT64.pack(value.time << 32 | value.inc)
+    if isinstance(value, (list, tuple)):
+        return b'\x04' + name + encode_document(collections.OrderedDict((str(idx), item) for idx, item in enumerate(value)))
+    if isinstance(value, ObjectId):
+        return b'\x07' + name + bytes(value)
+    if isinstance(value, bytes):
+        return b'\x05' + name + _INT32.pack(len(value)) + b'\x00' + value
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return b'\x09' + name + _INT64.pack(int((value - _EPOCH).total_seconds() * 1000))
+
+    raise TypeError("Type {type} of {key} can't be encoded to BSON".format(type=type(value).__name__, key=key))
+
+
+def _decode_cstring(data: bytes, position: int) -> Tuple[str, int]:
+    end = data.index(b'\x00', position)
+
+    return data[position:end].decode('utf-8'), end + 1
+
+
+def _decode_string(data: bytes, position: int) -> Tuple[str, int]:
+    size = _INT32.unpack_from(data, position)[0]
+    start = position + 4
+
+    return data[start:start + size - 1].decode('utf-8', errors='replace'), start + size
+
+
+def _decode_array(data: bytes, position: int) -> Tuple[List[Any], int]:
+    doc, position = decode_document(data, position)
+
+    return list(doc.values()), position
+
+
+def _decode_binary(data: bytes, position: int) -> Tuple[bytes, int]:
+    size = _INT32.unpack_from(data, position)[0]
+    start = position + 5
+
+    return data[start:start + size], start + size
+
+
+def _decode_datetime(data: bytes, position: int) -> Tuple[datetime.datetime, int]:
+    millis = _INT64.unpack_from(data, position)[0]
+
+    return _EPOCH + datetime.timedelta(milliseconds=millis), position + 8
+
+
+def _decode_timestamp(data: bytes, position: int) -> Tuple[Timestamp, int]:
+    value = _UINT64.unpack_from(data, position)[0]
+
+    return Timestamp(time=value >> 32, inc=value & 0xFFFFFFFF), position + 8
+
+
+def _decode_regex(data: bytes, position: int) -> Tuple[Tuple[str, str], int]:
+    pattern, position = _decode_cstring(data, position)
+    flags, position = _decode_cstring(data, position)
+
+    return (pattern, flags), position
+
+
+def _decode_code_with_scope(data: bytes, position: int) -> Tuple[str, int]:
+    size = _INT32.unpack_from(data, position)[0]
+    code, _ = _decode_string(data, position + 4)
+
+    return code, position + size
+
+
+def _decode_db_pointer(data: bytes, position: int) -> Tuple[str, int]:
+    namespace, position = _decode_string(data, position)
+
+    return namespace, position + 12
+
+
+def _fixed(size: int, convert: Callable[[bytes, int], Any]) -> Callable[[bytes, int], Tuple[Any, int]]:
+    return lambda data, position: (convert(data, position), position + size)
+
+
+_DECODERS = {
+    0x01: _fixed(8, lambda data, position: _DOUBLE.unpack_from(data, position)[0]),
+    0x02: _decode_string,
+    0x03: decode_document,
+    0x04: _decode_array,
+    0x05: _decode_binary,
+    0x06: _fixed(0, lambda data, position: None),  # undefined
+    0x07: _fixed(12, lambda data, position: ObjectId(data[position:position + 12])),
+    0x08: _fixed(1, lambda data, position: data[position] == 1),
+    0x09: _decode_datetime,
+    0x0A: _fixed(0, lambda data, position: None),
+    0x0B: _decode_regex,
+    0x0C: _decode_db_pointer,
+    0x0D: _decode_string,  # JavaScript code
+    0x0E: _decode_string,  # symbol
+    0x0F: _decode_code_with_scope,
+    0x10: _fixed(4, lambda data, position: _INT32.unpack_from(data, position)[0]),
+    0x11: _decode_timestamp,
+    0x12: _fixed(8, lambda data, position: _INT64.unpack_from(data, position)[0]),
+    0x13: _fixed(16, lambda data, position: data[position:position + 16]),  # decimal128 kept as raw bytes
+    0x7F: _fixed(0, lambda data, position: None),  # max key
+    0xFF: _fixed(0, lambda data, position: None),  # min key
+}  # type: Dict[int, Callable[[bytes, int], Tuple[Any, int]]]
+
+
+class WireClient:
+    """
+        Single connection to mongod/mongos. Commands are sent with OP_MSG when server supports it and with
+        OP_QUERY on `$cmd` collection otherwise. Instance can be shared between threads.
+    """
+    def __init__(self, host: str, port: int, timeout: float = 10.0):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+
+        self.server_info = self._query_command('admin', collections.OrderedDict([('isMaster', 1)]))
+        self._use_op_msg = self.server_info.get('maxWireVersion', 0) >= _OP_MSG_WIRE_VERSION
+
+    def command(self, db: str, name: str, value: Any = 1, check: bool = True, **options: Any) -> Dict[str, Any]:
+        """
+            Runs `{name: value, **options}` command on `db`. Raises MongoCommandException when server responds with
+            `ok: 0`, unless `check` is False.
+        """
+        spec = collections.OrderedDict([(name, value)])  # type: Dict[str, Any]
+        spec.update(options)
+
+        if self._use_op_msg:
+            reply = self._msg_command(db, spec)
+        else:
+            reply = self._query_command(db, spec)
+
+        if check and not reply.get('ok'):
+            raise MongoCommandException("Command {name} failed: {msg}".format(name=name, msg=reply.get('errmsg')), code=reply.get('code'))
+
+        return reply
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def __enter__(self) -> 'WireClient':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _query_command(self, db: str, spec: Mapping[str, Any]) -> Dict[str, Any]:
+        payload = (_INT32.pack(0) + _encode_cstring(db + '.$cmd') + _INT32.pack(0) + _INT32.pack(-1) + encode_document(spec))
+        reply = self._send(_OP_QUERY, payload, _OP_REPLY)
+        # responseFlags, cursorID, startingFrom, numberReturned
+        doc, _ = decode_document(reply, 20)
+
+        return doc
+
+    def _msg_command(self, db: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+        spec['$db'] = db
+        payload = _INT32.pack(0) + b'\x00' + encode_document(spec)
+        reply = self._send(_OP_MSG, payload, _OP_MSG)
+        # flagBits, section kind
+        doc, _ = decode_document(reply, 5)
+
+        return doc
+
+    def _send(self, op_code: int, payload: bytes, reply_op_code: int) -> bytes:
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._sock.sendall(_HEADER.pack(_HEADER.size + len(payload), request_id, 0, op_code) + payload)
+
+            header = self._recv(_HEADER.size)
+            length, _, response_to, received_op_code = _HEADER.unpack(header)
+            body = self._recv(length - _HEADER.size)
+
+        if response_to != request_id or received_op_code != reply_op_code:
+            raise MongoCommandException("Unexpected reply (opCode {op_code}) to request {request_id}".format(
+                op_code=received_op_code,
+                request_id=request_id
+            ))
+
+        return body
+
+    def _recv(self, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = self._sock.recv(size)
+            if not chunk:
+                raise MongoCommandException("Connection closed by server")
+            chunks.append(chunk)
+            size -= len(chunk)
+
+        return b''.join(chunks)
+
+
+def drop_databases(host: str, port: int, keep: Tuple[str, ...] = ('admin', 'config', 'local')) -> List[str]:
+    """Drops all user databases. Returns names of dropped databases."""
+    with WireClient(host, port) as client:
+        databases = client.command('admin', 'listDatabases', nameOnly=True)['databases']
+        dropped = [db['name'] for db in databases if db['name'] not in keep]
+        for name in dropped:
+            client.command(name, 'dropDatabase')
+
+    return dropped
@@ -25,8 +25,11 @@ def main() -> None:
     workspace = Path.home() / 'embemongo'
     workspace.mkdir(parents=True, exist_ok=True)
     em = EmbedMongo(workspace_dir=workspace)
-    for v in Version:
-        em.prepare(v)
+    for result in em.prepare_many(Version):
+        if result.error:
+            logger.error("{version}: {error}".format(version=result.version.version, error=result.error))
+        else:
+            logger.info("{version}: {bin_dir}".format(version=result.version.version, bin_dir=result.bin_dir))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,86 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+import subprocess
+import sys
+import typing
+
+import pytest
+
+from .http_server import RangeHTTPServer
+
+# holds exclusive flock on file given in argv until its stdin is closed
+_LOCK_HOLDER = '''
+import fcntl, os, sys
+fd = os.open(sys.argv[1], os.O_RDWR | os.O_CREAT)
+fcntl.flock(fd, fcntl.LOCK_EX)
+print('locked', flush=True)
+sys.stdin.read()
+'''
+
+
+@pytest.fixture
+def http_server() -> typing.Generator[RangeHTTPServer, None, None]:
+    server = RangeHTTPServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def fake_bin_dir(tmp_path: Path) -> Path:
+    """`bin` directory with fake mongod and mongos (see fake_mongod.py)."""
+    bin_dir = tmp_path / 'fake-bin'
+    bin_dir.mkdir()
+    for name, extra_args in [('mongod', ''), ('mongos', ' --fakeMongos')]:
+        executable = bin_dir / name
+        script = Path(__file__).parent / 'fake_mongod.py'
+        executable.write_text('#!/bin/sh\nexec "{python}" "{script}"{extra_args} "$@"\n'.format(python=sys.executable, script=script, extra_args=extra_args))
+        executable.chmod(0o755)
+
+    return bin_dir
+
+
+@pytest.fixture
+def outside(tmp_path: Path) -> Path:
+    """Directory next to extraction destinations with `secret` file, which crafted archives try to reach."""
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (outside / 'secret').write_text('secret')
+
+    return outside
+
+
+@pytest.fixture
+def file_lock_holder() -> typing.Generator[typing.Callable[[Path], 'subprocess.Popen[str]'], None, None]:
+    """Starts other process holding lock on given file. Lock is released when process stdin is closed."""
+    holders = []  # type: typing.List[subprocess.Popen[str]]
+
+    def hold(path: Path) -> 'subprocess.Popen[str]':
+        path.parent.mkdir(parents=True, exist_ok=True)
+        holder = subprocess.Popen([sys.executable, '-c', _LOCK_HOLDER, str(path)], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                  universal_newlines=True)
+        holders.append(holder)
+        assert holder.stdout is not None and holder.stdout.readline().strip() == 'locked'
+
+        return holder
+
+    yield hold
+
+    for holder in holders:
+        if holder.stdin is not None and not holder.stdin.closed:
+            holder.stdin.close()
+        holder.wait()
+        if holder.stdout is not None:
+            holder.stdout.close()
@@ -0,0 +1,215 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Minimal stand-in for mongod binary used in tests. Understands --bind_ip, --port, --dbpath, --logpath and --replSet.
+    Extra flags: --fakeExit (exits with error before listening), --fakeStartDelay SECONDS, --fakeMongos (acts as mongos),
+    --fakeElectionDelay SECONDS. --version reports 4.0.5 community build, --help lists options in mongod format, command
+    line is printed as `options:` line.
+    Every start is appended to `starts.log` in dbpath, so tests can tell initialized directory from empty one.
+
+    Commands are answered with OP_REPLY (maxWireVersion 0): isMaster, replSetInitiate (first member becomes primary,
+    the others are told to become secondaries), addShard, listDatabases and dropDatabase.
+"""
+
+import argparse
+import contextlib
+import os
+from pathlib import Path
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import types
+
+# wire module is loaded without package __init__, which would import all of its dependencies on every start
+_package = types.ModuleType('embedmongo')
+_package.__path__ = [str(Path(__file__).parent.parent / 'embedmongo')]  # type: ignore
+sys.modules.setdefault('embedmongo', _package)
+
+from embedmongo.wire import decode_document, encode_document, WireClient  # noqa: E402, I100
+
+_HEADER = struct.Struct('<iiii')
+
+_HELP = '''Options:
+
+General options:
+  -h [ --help ]                         Show this usage information
+  --version                             Show version information
+  -v [ --verbose ] [=arg(=v)]           Be more verbose (include multiple times
+                                        for more verbosity e.g. -vvvvv)
+  --port arg                            Specify port number - 27017 by default
+  --bind_ip arg                         Comma separated list of ip addresses to
+                                        listen on - localhost by default
+  --logpath arg                         Log file to send write to instead of
+                                        stdout - has to be a file, not
+                                        directory
+  --setParameter arg                    Set a configurable parameter
+
+Replication options:
+  --replSet arg                         arg is <setname>[/<optionalseedlist>]
+
+Sharding options:
+  --configsvr                           Declare this is a config db of a
+                                        cluster; default port 27019; default
+                                        dir /data/configdb
+  --shardsvr                            Declare this is a shard db of a
+                                        cluster; default port 27018
+  --configdb arg                        Connection string for communicating
+                                        with config servers
+
+SSL options:
+  --sslMode arg                         set the SSL operation mode
+                                        (disabled|allowSSL|preferSSL|requireSSL
+                                        )
+
+Storage options:
+  --storageEngine arg                   What storage engine to use - defaults
+                                        to wiredTiger if no data files present
+  --dbpath arg                          Directory for datafiles - defaults to
+                                        /data/db
+  --nojournal                           Disable journaling (journaling is on by
+                                        default for 64 bit)
+
+WiredTiger options:
+  --wiredTigerCacheSizeGB arg           Maximum amount of memory to allocate
+                                        for cache; Defaults to 1/2 of physical
+                                        RAM
+
+Fake options:
+  --fakeExit                            Exit with error before listening
+  --fakeStartDelay arg                  Delay before listening in seconds
+  --fakeMongos                          Act as mongos
+  --fakeElectionDelay arg               Delay of replica set election in
+                                        seconds
+'''
+
+
+class FakeServer:
+    def __init__(self, args: argparse.Namespace, log):
+        self.args = args
+        self.log = log
+        self.state = None if args.replSet else 'STANDALONE'
+        self.shards = []
+
+    def set_state(self, state: str) -> None:
+        old_state, self.state = self.state, state
+        self.print('REPL transition to {state} from {old_state}'.format(state=state, old_state=old_state or 'STARTUP2'))
+
+    def print(self, line: str) -> None:
+        print(line, file=self.log, flush=True)
+
+    def handle(self, cmd: dict) -> dict:
+        name = next(iter(cmd))
+        if name == 'isMaster':
+            return self.is_master()
+        if name == 'replSetInitiate':
+            threading.Thread(target=self.initiate, args=(cmd[name],), daemon=True).start()
+            return {'ok': 1.0}
+        if name == 'fakeSetState':
+            threading.Timer(self.args.fakeElectionDelay, self.set_state, args=(cmd[name],)).start()
+            return {'ok': 1.0}
+        if name == 'addShard' and self.args.fakeMongos:
+            self.shards.append(cmd[name])
+            self.print('addShard {shard}'.format(shard=cmd[name]))
+            return {'shardAdded': cmd[name].split('/')[0], 'ok': 1.0}
+        if name == 'listDatabases':
+            return {'databases': [{'name': 'admin'}], 'ok': 1.0}
+        if name == 'dropDatabase':
+            return {'ok': 1.0}
+
+        return {'ok': 0.0, 'errmsg': 'no such command: {name}'.format(name=name), 'code': 59}
+
+    def is_master(self) -> dict:
+        reply = {'ismaster': self.state in ('PRIMARY', 'STANDALONE'), 'secondary': self.state == 'SECONDARY', 'maxWireVersion': 0, 'ok': 1.0}
+        if self.args.fakeMongos:
+            reply['msg'] = 'isdbgrid'
+        if self.state in ('PRIMARY', 'SECONDARY'):
+            reply['setName'] = self.args.replSet
+
+        return reply
+
+    def initiate(self, config: dict) -> None:
+        time.sleep(self.args.fakeElectionDelay)
+        for member in config['members'][1:]:
+            host, port = member['host'].rsplit(':', 1)
+            with WireClient(host, int(port)) as client:
+                client.command('admin', 'fakeSetState', 'SECONDARY')
+        self.set_state('PRIMARY')
+
+    def serve(self, conn: socket.socket) -> None:
+        with conn, contextlib.suppress(OSError):
+            while True:
+                header = conn.recv(_HEADER.size, socket.MSG_WAITALL)
+                if len(header) < _HEADER.size:
+                    return
+                length, request_id, _, op_code = _HEADER.unpack(header)
+                body = conn.recv(length - _HEADER.size, socket.MSG_WAITALL)
+
+                collection_end = body.index(b'\x00', 4)
+                cmd, _ = decode_document(body, collection_end + 9)
+                payload = struct.pack('<iqii', 0, 0, 0, 1) + encode_document(self.handle(cmd))
+                conn.sendall(_HEADER.pack(_HEADER.size + len(payload), 0, request_id, 1) + payload)
+
+
+def main() -> None:
+    if '--help' in sys.argv:
+        print(_HELP)
+        return
+    if '--version' in sys.argv:
+        print('db version v4.0.5\ngit version: 0000000000000000000000000000000000000000\nallocator: tcmalloc\nmodules: none')
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bind_ip', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=27017)
+    parser.add_argument('--dbpath')
+    parser.add_argument('--logpath')
+    parser.add_argument('--replSet')
+    parser.add_argument('--fakeExit', action='store_true')
+    parser.add_argument('--fakeStartDelay', type=float, default=0)
+    parser.add_argument('--fakeMongos', action='store_true')
+    parser.add_argument('--fakeElectionDelay', type=float, default=0.05)
+    args, _ = parser.parse_known_args()
+
+    log = open(args.logpath, 'a') if args.logpath else sys.stdout
+    print('MongoDB starting : port={port} dbpath={dbpath}'.format(port=args.port, dbpath=args.dbpath), file=log, flush=True)
+    print('options: {options}'.format(options=' '.join(sys.argv[1:])), file=log, flush=True)
+    if args.fakeExit:
+        print('exception in initAndListen, terminating', file=log, flush=True)
+        sys.exit(100)
+
+    if args.dbpath:
+        with open(os.path.join(args.dbpath, 'starts.log'), 'a') as starts:
+            print(args.port, file=starts)
+
+    time.sleep(args.fakeStartDelay)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((args.bind_ip, args.port))
+    server.listen(16)
+    print('waiting for connections on port {port}'.format(port=args.port), file=log, flush=True)
+
+    fake_server = FakeServer(args, log)
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=fake_server.serve, args=(conn,), daemon=True).start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import re
+import socketserver
+import threading
+import typing
+
+_RANGE_RE = re.compile(r'bytes=(\d+)-(\d*)$')
+
+
+class ServedFile:
+    def __init__(self, content: bytes, etag: typing.Optional[str] = None, fail_after: typing.Optional[int] = None, unavailable: int = 0):
+        self.content = content
+        self.etag = etag
+        # connection is dropped after given number of body bytes, only once
+        self.fail_after = fail_after
+        # number of 503 responses sent before the file is served
+        self.unavailable = unavailable
+
+
+class RangeHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """Local stand-in for package repository. Supports ETag, conditional and range requests."""
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.files = {}  # type: typing.Dict[str, ServedFile]
+        self.requests = []  # type: typing.List[typing.Tuple[str, typing.Dict[str, str]]]
+        self.clients = set()  # type: typing.Set[typing.Tuple[str, int]]
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return 'http://{host}:{port}'.format(host=self.server_address[0], port=self.server_address[1])
+
+    def add(self, path: str, content: bytes, etag: typing.Optional[str] = None, fail_after: typing.Optional[int] = None, unavailable: int = 0) -> str:
+        self.files[path] = ServedFile(content, etag, fail_after, unavailable)
+
+        return self.url + path
+
+    def start(self) -> 'RangeHTTPServer':
+        self._thread.start()
+
+        return self
+
+    def handle_error(self, request: typing.Any, client_address: typing.Any) -> None:
+        # clients are allowed to drop connections in the middle of the body
+        pass
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server = None  # type: RangeHTTPServer
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format: str, *args: typing.Any) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self._serve(with_body=False)
+
+    def do_GET(self) -> None:
+        self._serve(with_body=True)
+
+    def _serve(self, with_body: bool) -> None:
+        self.server.requests.append((self.path, dict(self.headers.items())))
+        self.server.clients.add(self.client_address)
+        served = self.server.files.get(self.path)
+        if not served:
+            self._send_status(HTTPStatus.NOT_FOUND)
+            return
+
+        if served.unavailable:
+            served.unavailable -= 1
+            self._send_status(HTTPStatus.SERVICE_UNAVAILABLE)
+            return
+
+        if served.etag and self.headers.get('If-None-Match') == served.etag:
+            self._send_status(HTTPStatus.NOT_MODIFIED, served.etag)
+            return
+
+        content = served.content
+        start, end = 0, len(content) - 1
+        status = HTTPStatus.OK
+        range_match = _RANGE_RE.match(self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if range_match and (if_range is None or if_range == served.etag):
+            start = int(range_match.group(1))
+            end = min(int(range_match.group(2) or end), end)
+            status = HTTPStatus.PARTIAL_CONTENT
+
+        body = content[start:end + 1]
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Accept-Ranges', 'bytes')
+        if served.etag:
+            self.send_header('ETag', served.etag)
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', 'bytes {start}-{end}/{total}'.format(start=start, end=end, total=len(content)))
+        self.end_headers()
+
+        if not with_body:
+            return
+
+        if served.fail_after is not None:
+            body = body[:served.fail_after]
+            served.fail_after = None
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def _send_status(self, status: HTTPStatus, etag: typing.Optional[str] = None) -> None:
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
@@ -0,0 +1,187 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from http import HTTPStatus
+from pathlib import Path
+import re
+import time
+import typing
+
+import pytest
+
+from embedmongo import AsyncEmbedMongo, AsyncMongodLauncher, EmbedMongo, Version
+from embedmongo.blobstore import clone_tree, file_digest
+from embedmongo.exceptions import DownloadFileException, MongodStartException
+from embedmongo.package import PackageDiscovery
+from embedmongo.registry import InstanceRegistry
+from embedmongo.system import OSInfo
+
+if typing.TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
+    from requests_mock import Mocker
+
+pkg_file = Path(__file__).parent / 'res' / 'mongo.tgz'
+
+T = typing.TypeVar('T')
+
+
+def _run(coroutine: typing.Awaitable[T]) -> T:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestAsyncMongodLauncher:
+    def test_start_and_stop(self, fake_bin_dir: Path):
+        async def scenario():
+            process = await AsyncMongodLauncher(fake_bin_dir).start()
+            assert process.is_running()
+            assert process.startup_time is not None
+            _, writer = await asyncio.open_connection(process.host, process.port)
+            writer.close()
+
+            await process.stop()
+
+            return process
+
+        process = _run(scenario())
+
+        assert process.is_running() is False
+        assert process.dbpath.exists() is False
+
+    def test_start_many_concurrently(self, fake_bin_dir: Path):
+        async def scenario():
+            launcher = AsyncMongodLauncher(fake_bin_dir)
+            processes = await asyncio.gather(*[launcher.start(args=['--fakeStartDelay', '0.3']) for _ in range(3)])
+            for process in processes:
+                await process.stop()
+
+            return processes
+
+        processes = _run(scenario())
+
+        assert len({process.port for process in processes}) == 3
+        # instances were starting at the same time
+        assert max(process.startup_time for process in processes) < 0.9
+
+    @pytest.mark.parametrize('inline', [False, True])
+    def test_start_with_logpath_probes_port(self, fake_bin_dir: Path, tmp_path: Path, inline: bool):
+        logpath = tmp_path / 'mongod.log'
+        logpath_args = ['--logpath={}'.format(logpath)] if inline else ['--logpath', str(logpath)]
+
+        async def scenario():
+            async with await AsyncMongodLauncher(fake_bin_dir).start(args=logpath_args + ['--fakeStartDelay', '0.2']) as process:
+                assert process.startup_time >= 0.2
+                assert await process.wait_for_output(re.compile('waiting'), timeout=0.1) is False
+
+        _run(scenario())
+
+        assert 'waiting for connections' in logpath.read_text()
+
+    def test_start_leases_port_after_snapshot_copy(self, fake_bin_dir: Path, tmp_path: Path, monkeypatch):
+        registry = InstanceRegistry(tmp_path / 'registry', lease_ttl=0)
+        snapshot = tmp_path / 'snapshot'
+        snapshot.mkdir()
+
+        def slow_clone(src: Path, dst: Path) -> None:
+            InstanceRegistry(tmp_path / 'registry', lease_ttl=0).reap()
+            clone_tree(src, dst)
+
+        async def scenario():
+            async with await AsyncMongodLauncher(fake_bin_dir, registry).start(snapshot=snapshot) as process:
+                assert [instance.pid for instance in registry.instances()] == [process.pid]
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr('embedmongo.aio.clone_tree', slow_clone)
+            _run(scenario())
+
+        assert registry.instances() == []
+
+    def test_start_process_exited(self, fake_bin_dir: Path):
+        with pytest.raises(MongodStartException) as excinfo:
+            _run(AsyncMongodLauncher(fake_bin_dir).start(args=['--fakeExit']))
+
+        assert 'exited with code 100' in str(excinfo.value)
+        assert 'initAndListen' in str(excinfo.value)
+
+
+class TestAsyncEmbedMongo:
+    @pytest.fixture
+    def workspace_dir(self, tmp_path: Path, monkeypatch) -> typing.Generator[Path, None, None]:
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(OSInfo, 'type', lambda: 'linux')
+            m.setattr(OSInfo, 'architecture', lambda: 'x86_64')
+
+            yield tmp_path
+
+    def test_prepare_many(self, workspace_dir: Path, requests_mock: 'Mocker'):
+        url = PackageDiscovery().create(Version.V4_0_5).url
+        requests_mock.get(url, content=pkg_file.read_bytes())
+        requests_mock.get(url + '.sha256', text=file_digest(pkg_file))
+        missing_url = PackageDiscovery().create(Version.V3_6_9).url
+        requests_mock.get(missing_url, status_code=HTTPStatus.NOT_FOUND)
+        requests_mock.get(missing_url + '.sha256', status_code=HTTPStatus.NOT_FOUND)
+        embed_mongo = AsyncEmbedMongo(workspace_dir, streaming=True)
+
+        try:
+            ok_result, failed_result = _run(embed_mongo.prepare_many([Version.V4_0_5, Version.V3_6_9, Version.V4_0_5]))
+        finally:
+            embed_mongo.close()
+
+        assert (ok_result.bin_dir / 'mongod').exists()
+        assert isinstance(failed_result.error, DownloadFileException)
+
+    def test_start_from_snapshot(self, workspace_dir: Path, fake_bin_dir: Path, monkeypatch):
+        embed_mongo = AsyncEmbedMongo(workspace_dir)
+
+        async def scenario():
+            first, second = await asyncio.gather(embed_mongo.start(Version.V4_0_5, snapshot='default'),
+                                                 embed_mongo.start(Version.V4_0_5, snapshot='default'))
+            async with first, second:
+                assert first.dbpath != second.dbpath
+                assert len((first.dbpath / 'starts.log').read_text().splitlines()) == 2
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(EmbedMongo, 'prepare', lambda self, version, components=None: fake_bin_dir)
+            try:
+                _run(scenario())
+            finally:
+                embed_mongo.close()
+
+        assert (workspace_dir / Version.V4_0_5.version / 'snapshots' / 'default' / 'starts.log').exists()
+
+    def test_aclose_waits_for_pending_preparations(self, workspace_dir: Path, monkeypatch):
+        prepared = []
+
+        def prepare(self, version, components=None):
+            time.sleep(0.2)
+            prepared.append(version)
+            return workspace_dir
+
+        async def scenario():
+            async with AsyncEmbedMongo(workspace_dir) as embed_mongo:
+                task = asyncio.ensure_future(embed_mongo.prepare(Version.V4_0_5))
+                await asyncio.sleep(0.05)
+                # cancelled task doesn't stop preparation which already runs in executor
+                task.cancel()
+
+            assert prepared == [Version.V4_0_5]
+            assert embed_mongo._pending == set()
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(EmbedMongo, 'prepare', prepare)
+            _run(scenario())
@@ -0,0 +1,204 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http import HTTPStatus
+import io
+import os
+from pathlib import Path
+import tarfile
+import threading
+import typing
+
+import pytest
+
+from embedmongo.blobstore import BlobStore, extract_to_store, file_digest, manifest_key
+from embedmongo.utils import download_and_extract, extract_file
+from .test_extract import UNSAFE_ARCHIVES, write_archive
+
+if typing.TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
+    from requests_mock import Mocker
+
+mongo_tar_file = Path(__file__).parent / 'res' / 'mongo.tgz'
+
+
+def _archive(content: bytes) -> io.BytesIO:
+    fileobj = io.BytesIO()
+    with tarfile.open(fileobj=fileobj, mode='w') as tar:
+        info = tarfile.TarInfo('file')
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    fileobj.seek(0)
+
+    return fileobj
+
+
+def _forbid_tar_open(*args: typing.Any, **kwargs: typing.Any) -> None:
+    raise AssertionError("archive shouldn't be decompressed")
+
+
+class TestBlobStore:
+    @pytest.fixture
+    def store(self, tmp_path: Path) -> BlobStore:
+        return BlobStore(tmp_path / 'store')
+
+    def test_put_deduplicates_content(self, store: BlobStore):
+        first = store.put(io.BytesIO(b'content'), 0o755)
+        second = store.put(io.BytesIO(b'content'), 0o755)
+
+        assert first == second
+        assert store.blob_path(first).read_bytes() == b'content'
+        assert len(list((store.root / 'blobs').glob('*/*'))) == 1
+        assert list((store.root / 'tmp').iterdir()) == []
+
+    def test_materialize_hardlinks_blob(self, store: BlobStore, tmp_path: Path):
+        digest = store.put(io.BytesIO(b'content'), 0o755)
+        dst = tmp_path / 'file'
+
+        store.materialize(digest, dst, 0o755)
+
+        assert dst.read_bytes() == b'content'
+        assert dst.stat().st_ino == store.blob_path(digest).stat().st_ino
+
+    def test_materialize_copies_blob_with_other_mode(self, store: BlobStore, tmp_path: Path):
+        digest = store.put(io.BytesIO(b'content'), 0o755)
+        dst = tmp_path / 'file'
+
+        store.materialize(digest, dst, 0o644)
+
+        assert dst.read_bytes() == b'content'
+        assert dst.stat().st_ino != store.blob_path(digest).stat().st_ino
+        assert dst.stat().st_mode & 0o777 == 0o644
+
+    def test_filtered_extract_keeps_manifest_of_whole_archive(self, store: BlobStore, tmp_path: Path, monkeypatch):
+        extract_file(mongo_tar_file, tmp_path / 'partial', strip_level=1, blob_store=store, include=['bin/mongod'])
+        assert list((store.root / 'manifests').iterdir()) == []
+
+        extract_file(mongo_tar_file, tmp_path / 'full', strip_level=1, blob_store=store)
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr('tarfile.open', _forbid_tar_open)
+            extract_file(mongo_tar_file, tmp_path / 'filtered', strip_level=1, blob_store=store, include=['bin/mongod'])
+
+        assert [path.name for path in (tmp_path / 'filtered').rglob('*') if path.is_file()] == ['mongod']
+
+    def test_extract_shares_files_between_trees(self, store: BlobStore, tmp_path: Path):
+        first_dst = tmp_path / 'first'
+        second_dst = tmp_path / 'second'
+
+        extract_file(mongo_tar_file, first_dst, strip_level=1, blob_store=store)
+        extract_file(mongo_tar_file, second_dst, strip_level=1, blob_store=store)
+
+        first_file = first_dst / 'bin' / 'mongod'
+        second_file = second_dst / 'bin' / 'mongod'
+        assert first_file.read_bytes() == second_file.read_bytes()
+        assert first_file.stat().st_ino == second_file.stat().st_ino
+        assert first_file.stat().st_mode & 0o111
+
+    def test_extract_known_archive_without_decompression(self, store: BlobStore, tmp_path: Path, monkeypatch):
+        extract_file(mongo_tar_file, tmp_path / 'first', strip_level=1, blob_store=store)
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr('tarfile.open', _forbid_tar_open)
+            extract_file(mongo_tar_file, tmp_path / 'second', strip_level=1, blob_store=store)
+
+        assert (tmp_path / 'second' / 'bin' / 'mongod').exists()
+
+    def test_streaming_extract_saves_manifest(self, store: BlobStore, tmp_path: Path, requests_mock: 'Mocker', monkeypatch):
+        url = 'https://example_url.com/mongo.tgz'
+        requests_mock.get(url, content=mongo_tar_file.read_bytes(), status_code=HTTPStatus.OK)
+        download_and_extract(url, tmp_path / 'first', strip_level=1, blob_store=store)
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr('tarfile.open', _forbid_tar_open)
+            extract_file(mongo_tar_file, tmp_path / 'second', strip_level=1, blob_store=store)
+
+        assert (tmp_path / 'second' / 'bin' / 'mongod').stat().st_ino == (tmp_path / 'first' / 'bin' / 'mongod').stat().st_ino
+
+    @pytest.mark.parametrize('case', sorted(UNSAFE_ARCHIVES))
+    def test_extract_skips_unsafe_members(self, store: BlobStore, tmp_path: Path, outside: Path, case: str):
+        members, missing = UNSAFE_ARCHIVES[case]
+        archive = write_archive(tmp_path / 'crafted.tgz', members, outside)
+
+        # second extraction is replayed from manifest
+        for dst in (tmp_path / 'first', tmp_path / 'second'):
+            extract_file(archive, dst, blob_store=store)
+
+            assert sorted(path.name for path in outside.iterdir()) == ['secret']
+            assert (dst / 'bin').is_symlink() is False
+            assert [name for name in missing if os.path.lexists(str(dst / name))] == []
+
+    def test_unsafe_manifest_entries_not_materialized(self, store: BlobStore, tmp_path: Path, outside: Path):
+        archive = write_archive(tmp_path / 'archive.tgz', [('bin/mongod', tarfile.REGTYPE, 'mongod')], outside)
+        extract_file(archive, tmp_path / 'first', blob_store=store)
+        key = manifest_key(file_digest(archive), 0)
+        entries = store.load_manifest(key)
+        assert entries is not None
+        store.save_manifest(key, entries + [{'path': 'lib', 'mode': 0o755, 'type': 'symlink', 'target': '../outside'},
+                                            {'path': 'secret', 'mode': 0o644, 'type': 'link', 'target': '../outside/secret'}])
+
+        extract_file(archive, tmp_path / 'second', blob_store=store)
+
+        assert (tmp_path / 'second' / 'bin' / 'mongod').read_text() == 'mongod'
+        assert os.path.lexists(str(tmp_path / 'second' / 'lib')) is False
+        assert (tmp_path / 'second' / 'secret').exists() is False
+
+    def test_prune_removes_unused_blobs(self, store: BlobStore, tmp_path: Path):
+        used = store.put(io.BytesIO(b'used'), 0o644)
+        unused = store.put(io.BytesIO(b'unused'), 0o644)
+        store.materialize(used, tmp_path / 'file', 0o644)
+
+        freed = store.prune()
+
+        assert freed == len(b'unused')
+        assert store.blob_path(used).exists()
+        assert store.blob_path(unused).exists() is False
+
+    def test_prune_skipped_while_store_used(self, store: BlobStore):
+        digest = store.put(io.BytesIO(b'content'), 0o644)
+
+        with store.using():
+            assert store.prune() == 0
+            assert store.blob_path(digest).exists()
+
+        assert store.prune() == len(b'content')
+
+    def test_prune_concurrent_with_extract(self, store: BlobStore, tmp_path: Path):
+        errors = []  # type: typing.List[BaseException]
+        done = threading.Event()
+
+        def extract(idx: int) -> None:
+            try:
+                for run in range(50):
+                    # every archive brings new blob, unused until it's linked to extracted tree
+                    with tarfile.open(fileobj=_archive('{}-{}'.format(idx, run).encode()), mode='r') as tar:
+                        extract_to_store(tar, tmp_path / 'tree-{}-{}'.format(idx, run), tar.getmembers(), store)
+            except BaseException as e:
+                errors.append(e)
+
+        def prune() -> None:
+            while not done.is_set():
+                store.prune()
+
+        pruner = threading.Thread(target=prune)
+        pruner.start()
+        extractors = [threading.Thread(target=extract, args=(idx,)) for idx in range(3)]
+        for thread in extractors:
+            thread.start()
+        for thread in extractors:
+            thread.join()
+        done.set()
+        pruner.join()
+
+        assert errors == []
+        assert (tmp_path / 'tree-2-49' / 'file').read_bytes() == b'2-49'
@@ -0,0 +1,167 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from pathlib import Path
+import time
+import typing
+
+import pytest
+
+from embedmongo.cache import CacheManager, parse_size
+from embedmongo.cli import main
+from embedmongo.package import _PkgMetadata, _VersionDir, LocalPackage, PackageManager, Revalidate, Version
+
+if typing.TYPE_CHECKING:
+    import subprocess  # noqa: F401
+
+ARCHIVE_SIZE = 1000
+EXTRACTED_SIZE = 3000
+
+pkg_file = Path(__file__).parent / 'res' / 'mongo.tgz'
+
+
+def _prepared(workspace_dir: Path, version: Version, accessed_ago: float, archive: bool = True) -> _VersionDir:
+    version_dir = _VersionDir(workspace_dir, version, archive_filename='pkg-name.tgz')
+    if archive:
+        version_dir.archive_path.write_bytes(b'a' * ARCHIVE_SIZE)
+    (version_dir.extracted_dir / 'bin').mkdir(parents=True)
+    (version_dir.extracted_dir / 'bin' / 'mongod').write_bytes(b'm' * EXTRACTED_SIZE)
+
+    metadata = _PkgMetadata()
+    metadata.download_filename = 'pkg-name.tgz'
+    metadata.install_dirname = version_dir.extracted_dir.name
+    metadata.extract_size = EXTRACTED_SIZE
+    version_dir.save_metadata(metadata)
+    accessed_at = time.time() - accessed_ago
+    os.utime(str(version_dir.metadata_path), (accessed_at, accessed_at))
+
+    return version_dir
+
+
+@pytest.fixture
+def workspace_dir(tmp_path: Path) -> Path:
+    # least recently used first
+    _prepared(tmp_path, Version.V3_4_18, accessed_ago=300)
+    _prepared(tmp_path, Version.V3_6_9, accessed_ago=200)
+    _prepared(tmp_path, Version.V4_0_5, accessed_ago=100)
+
+    return tmp_path
+
+
+class TestCacheManager:
+    def test_entries_are_least_recently_used_first(self, workspace_dir: Path):
+        (workspace_dir / '.blobs').mkdir()
+        (workspace_dir / 'not-a-version').mkdir()
+
+        entries = CacheManager(workspace_dir).entries()
+
+        assert [entry.version for entry in entries] == [Version.V3_4_18, Version.V3_6_9, Version.V4_0_5]
+        assert all((entry.archive_size, entry.extracted_size, entry.snapshots_size) == (ARCHIVE_SIZE, EXTRACTED_SIZE, 0) for entry in entries)
+        assert CacheManager(workspace_dir).usage() == 3 * (ARCHIVE_SIZE + EXTRACTED_SIZE)
+
+    def test_collect_drops_archives_first(self, workspace_dir: Path):
+        manager = CacheManager(workspace_dir, min_idle=0)
+
+        freed = manager.collect(quota=3 * EXTRACTED_SIZE + ARCHIVE_SIZE)
+
+        assert freed == 2 * ARCHIVE_SIZE
+        assert [entry.archive_size for entry in manager.entries()] == [0, 0, ARCHIVE_SIZE]
+
+    def test_collect_evicts_least_recently_used(self, workspace_dir: Path):
+        manager = CacheManager(workspace_dir, quota=2 * EXTRACTED_SIZE, min_idle=0)
+
+        manager.collect()
+
+        assert [entry.version for entry in manager.entries()] == [Version.V3_6_9, Version.V4_0_5]
+        assert manager.usage() == 2 * EXTRACTED_SIZE
+        assert not (workspace_dir / Version.V3_4_18.version).exists()
+
+    def test_collect_under_quota_does_nothing(self, workspace_dir: Path):
+        manager = CacheManager(workspace_dir, min_idle=0)
+
+        assert manager.collect(quota=manager.usage()) == 0
+        assert len(manager.entries()) == 3
+
+    def test_collect_keeps_versions(self, workspace_dir: Path):
+        manager = CacheManager(workspace_dir, min_idle=0)
+
+        manager.collect(quota=0, keep=[Version.V3_4_18])
+
+        assert [entry.version for entry in manager.entries()] == [Version.V3_4_18]
+
+    def test_collect_skips_recently_used(self, workspace_dir: Path):
+        manager = CacheManager(workspace_dir, min_idle=150)
+
+        manager.collect(quota=0)
+
+        assert [entry.version for entry in manager.entries()] == [Version.V4_0_5]
+
+    def test_collect_skips_locked_versions(self, workspace_dir: Path, file_lock_holder: typing.Callable[[Path], 'subprocess.Popen[str]']):
+        locked_dir = _VersionDir(workspace_dir, Version.V3_4_18, archive_filename=None)
+        file_lock_holder(locked_dir.lock_path)
+        manager = CacheManager(workspace_dir, min_idle=0)
+
+        manager.collect(quota=0)
+
+        entry, = manager.entries()
+        assert entry.version == Version.V3_4_18
+        assert entry.archive_size == ARCHIVE_SIZE
+
+    def test_collect_without_quota_raises_exception(self, workspace_dir: Path):
+        with pytest.raises(ValueError):
+            CacheManager(workspace_dir).collect()
+
+    def test_drop_archives(self, workspace_dir: Path):
+        _prepared(workspace_dir, Version.V3_7_9, accessed_ago=0, archive=False)
+        manager = CacheManager(workspace_dir)
+
+        assert manager.drop_archives([Version.V3_6_9, Version.V3_7_9]) == ARCHIVE_SIZE
+        assert manager.drop_archives() == 2 * ARCHIVE_SIZE
+        assert [entry.archive_size for entry in manager.entries()] == [0, 0, 0, 0]
+        assert len(manager.entries()) == 4
+
+
+class TestAccessTracking:
+    def test_extract_records_size_and_installed_touches(self, tmp_path: Path):
+        version_dir = _VersionDir(tmp_path, Version.V4_0_5, archive_filename=pkg_file.name)
+        version_dir.archive_path.write_bytes(pkg_file.read_bytes())
+        manager = PackageManager(tmp_path)
+        manager.extract(LocalPackage(version=Version.V4_0_5, path=version_dir.archive_path, new_file=True))
+        os.utime(str(version_dir.metadata_path), (0, 0))
+
+        assert manager.installed(Version.V4_0_5, Revalidate.NEVER) is not None
+
+        entry, = CacheManager(tmp_path).entries()
+        assert entry.extracted_size == version_dir.read_metadata().extract_size > 0
+        assert entry.accessed_at > time.time() - 60
+
+
+@pytest.mark.parametrize('size,expected', [('123', 123), ('2k', 2048), ('500M', 500 * 1024**2), ('1.5GiB', 3 * 1024**3 // 2), ('2 GB', 2 * 1024**3)])
+def test_parse_size(size: str, expected: int):
+    assert parse_size(size) == expected
+
+
+def test_parse_invalid_size():
+    with pytest.raises(ValueError):
+        parse_size('2 parsecs')
+
+
+def test_cli_cache_command(workspace_dir: Path, capsys):
+    assert main(['cache', str(workspace_dir), '--drop-archives']) == 0
+
+    output = capsys.readouterr().out.splitlines()
+    assert len(output) == 4
+    assert output[0].startswith(Version.V3_4_18.version)
+    assert output[-1] == 'total: {usage} bytes'.format(usage=3 * EXTRACTED_SIZE)
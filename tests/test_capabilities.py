@@ -0,0 +1,228 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+from pathlib import Path
+import re
+import tarfile
+import typing
+
+import pytest
+
+from embedmongo.capabilities import ARG_NONE, ARG_OPTIONAL, ARG_REQUIRED, Capabilities, executables, help_outputs, parse_help
+from embedmongo.exceptions import UnsupportedOptionException
+from embedmongo.package import LocalPackage, PackageManager, Version
+from embedmongo.process import MongodLauncher
+from embedmongo.system import OSInfo
+
+if typing.TYPE_CHECKING:
+    from _pytest.logging import LogCaptureFixture
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
+
+HELP_3_6 = """Options:
+
+General options:
+  -h [ --help ]                         Show this usage information
+  -v [ --verbose ] [=arg(=v)]           Be more verbose (include multiple times
+                                        for more verbosity e.g. -vvvvv)
+  --port arg                            Specify port number - 27017 by default
+  --ipv6                                Enable IPv6 support (disabled by default)
+
+SSL options:
+  --sslMode arg                         set the SSL operation mode
+                                        (disabled|allowSSL|preferSSL|requireSSL
+                                        )
+  --sslPEMKeyFile arg                   PEM file for ssl
+
+Storage options:
+  --nojournal                           Disable journaling (journaling is on by
+                                        default for 64 bit)
+"""
+
+HELP_4_2 = """Options:
+
+General options:
+  --port arg                            Specify port number - 27017 by default
+
+TLS Options:
+  --tlsMode arg                         Set the TLS operation mode
+                                        (disabled|allowTLS|preferTLS|requireTLS
+                                        )
+  --tlsCertificateKeyFile arg           Certificate and key file for TLS
+  --sslMode arg                         set the SSL operation mode
+                                        (disabled|allowSSL|preferSSL|requireSSL
+                                        )
+"""
+
+HELP_6_1 = """Options:
+
+General options:
+  --port arg                            Specify port number - 27017 by default
+  --tlsMode arg                         Set the TLS operation mode
+"""
+
+
+def _capabilities(help_output: str, version: str = '3.6.9') -> Capabilities:
+    return Capabilities(version, {'mongod': parse_help(help_output)})
+
+
+def _write_binary(path: Path, help_output: str, runs_log: Path) -> None:
+    path.write_text("#!/bin/sh\necho \"$(basename \"$0\")\" >> '{log}'\ncat <<'EOF'\n{help}EOF\n".format(log=runs_log, help=help_output))
+    path.chmod(0o755)
+
+
+class TestParseHelp:
+    def test_options(self):
+        assert parse_help(HELP_3_6) == {'help': ARG_NONE, 'verbose': ARG_OPTIONAL, 'port': ARG_REQUIRED, 'ipv6': ARG_NONE, 'sslMode': ARG_REQUIRED,
+                                        'sslPEMKeyFile': ARG_REQUIRED, 'nojournal': ARG_NONE}
+
+    def test_not_help_output(self):
+        assert parse_help('Error parsing command line: unrecognised option \'--help\'\n') == {}
+
+
+class TestCapabilities:
+    def test_supports(self):
+        capabilities = _capabilities(HELP_3_6)
+
+        assert capabilities.supports('--port')
+        assert capabilities.supports('sslMode')
+        assert capabilities.supports('--tlsMode') is False
+        assert capabilities.supports('--anything', binary='mongos')
+        assert capabilities.binaries == ['mongod']
+
+    def test_check_keeps_supported(self):
+        args = ['--port', '27017', '-vvv', '--verbose=vv', '--ipv6', '--sslMode=requireSSL']
+
+        assert _capabilities(HELP_3_6).check(args) == args
+
+    def test_check_translates_to_old_name(self):
+        args = ['--tlsMode', 'requireTLS', '--tlsCertificateKeyFile=/tmp/server.pem']
+
+        assert _capabilities(HELP_3_6).check(args) == ['--sslMode', 'requireSSL', '--sslPEMKeyFile=/tmp/server.pem']
+
+    def test_check_translates_to_new_name(self):
+        capabilities = _capabilities(HELP_4_2, version='4.2.0')
+
+        assert capabilities.check(['--sslPEMKeyFile', '/tmp/server.pem']) == ['--tlsCertificateKeyFile', '/tmp/server.pem']
+        # both names are still supported by 4.2
+        assert capabilities.check(['--sslMode', 'requireSSL']) == ['--sslMode', 'requireSSL']
+        assert _capabilities(HELP_6_1, version='6.1.0').check(['--sslMode=preferSSL']) == ['--tlsMode=preferTLS']
+
+    def test_check_obsolete(self):
+        with pytest.raises(UnsupportedOptionException) as excinfo:
+            _capabilities(HELP_6_1, version='6.1.0').check(['--port', '1', '--nojournal'])
+
+        assert excinfo.value.option == 'nojournal'
+        assert '6.1.0' in str(excinfo.value)
+
+    def test_check_passes_not_listed(self, caplog: 'LogCaptureFixture'):
+        args = ['--port', '1', '--ipv6', '--enableMajorityReadConcern', 'false']
+
+        assert _capabilities(HELP_6_1, version='6.1.0').check(args) == args
+        assert "Option --ipv6 isn't listed by mongod 6.1.0 --help" in caplog.text
+
+    def test_check_not_indexed_binary(self):
+        assert Capabilities('4.0.5', {'mongod': None}).check(['--anything']) == ['--anything']
+
+
+class TestProbe:
+    def test_help_outputs(self, tmp_path: Path):
+        runs_log = tmp_path / 'runs.log'
+        for name in ('mongod', 'mongos', 'install_compass'):
+            _write_binary(tmp_path / name, HELP_6_1, runs_log)
+        (tmp_path / 'README').write_text('readme')
+        (tmp_path / 'broken').write_text('not executable format')
+        (tmp_path / 'broken').chmod(0o755)
+
+        outputs = help_outputs(tmp_path)
+
+        assert executables(tmp_path) == ['broken', 'mongod', 'mongos']
+        assert outputs['broken'] is None
+        assert outputs['mongod'] == outputs['mongos'] == HELP_6_1
+        assert sorted(runs_log.read_text().split()) == ['mongod', 'mongos']
+
+    def test_probe(self, fake_bin_dir: Path):
+        capabilities = Capabilities.probe('4.0.5', fake_bin_dir)
+
+        assert capabilities.binaries == ['mongod', 'mongos']
+        assert capabilities.options('mongos')['fakeStartDelay'] == ARG_REQUIRED
+
+    def test_launcher_checks_args(self, fake_bin_dir: Path):
+        launcher = MongodLauncher(fake_bin_dir, capabilities=Capabilities.probe('4.0.5', fake_bin_dir))
+
+        with launcher.start(args=['--tlsMode', 'requireTLS', '--fakeStartDelay', '0']) as process:
+            assert process.wait_for_output(re.compile(r'options: .* --sslMode requireSSL --fakeStartDelay 0$'), timeout=1)
+
+        with launcher.start(args=['--noscripting']) as process:
+            assert process.wait_for_output(re.compile(r'options: .* --noscripting$'), timeout=1)
+
+        with pytest.raises(UnsupportedOptionException):
+            launcher.start(args=['--smallfiles'])
+
+
+class TestPackageManagerCapabilities:
+    @pytest.fixture
+    def manager(self, tmp_path: Path, monkeypatch) -> typing.Generator[PackageManager, None, None]:
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(OSInfo, 'type', lambda: 'linux')
+            m.setattr(OSInfo, 'architecture', lambda: 'x86_64')
+
+            yield PackageManager(tmp_path / 'workspace')
+
+    @pytest.fixture
+    def runs_log(self, tmp_path: Path) -> Path:
+        return tmp_path / 'runs.log'
+
+    @pytest.fixture
+    def local_pkg(self, tmp_path: Path, runs_log: Path) -> LocalPackage:
+        path = tmp_path / 'mongodb-linux-x86_64-4.0.5.tgz'
+        with tarfile.open(str(path), 'w:gz') as tar:
+            for name in ('mongod', 'mongos'):
+                binary = tmp_path / name
+                _write_binary(binary, HELP_3_6, runs_log)
+                tar.add(str(binary), 'mongodb-linux-x86_64-4.0.5/bin/' + name)
+            info = tarfile.TarInfo('mongodb-linux-x86_64-4.0.5/README')
+            info.size = 6
+            tar.addfile(info, io.BytesIO(b'readme'))
+
+        return LocalPackage(version=Version.V4_0_5, path=path, new_file=True)
+
+    def test_indexed_at_extract(self, manager: PackageManager, local_pkg: LocalPackage, runs_log: Path):
+        bin_dir = manager.extract(local_pkg, components={'mongod'})
+
+        metadata = json.loads((bin_dir.parent.parent / 'metadata.json').read_text())
+        assert metadata['extract']['capabilities'] == {'mongod': parse_help(HELP_3_6)}
+
+        manager.extract(local_pkg._replace(new_file=False), components={'mongod', 'mongos'})
+        capabilities = manager.capabilities(Version.V4_0_5)
+
+        assert capabilities.version == '4.0.5'
+        assert capabilities.binaries == ['mongod', 'mongos']
+        # mongod isn't run again
+        assert runs_log.read_text().split() == ['mongod', 'mongos']
+
+    def test_indexed_on_demand(self, manager: PackageManager, local_pkg: LocalPackage, runs_log: Path):
+        bin_dir = manager.extract(local_pkg)
+        metadata_path = bin_dir.parent.parent / 'metadata.json'
+        metadata = json.loads(metadata_path.read_text())
+        metadata['extract'].pop('capabilities')
+        metadata_path.write_text(json.dumps(metadata))
+
+        assert manager.capabilities(Version.V4_0_5).binaries == ['mongod', 'mongos']
+        assert manager.capabilities(Version.V4_0_5).binaries == ['mongod', 'mongos']
+        assert len(runs_log.read_text().split()) == 4
+
+    def test_not_prepared(self, manager: PackageManager):
+        assert manager.capabilities(Version.V4_0_5) is None
@@ -0,0 +1,242 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http import HTTPStatus
+import json
+from pathlib import Path
+import typing
+
+import pytest
+
+from embedmongo.catalog import parse_spec, Release, ReleaseCatalog
+from embedmongo.exceptions import PackageNotFoundException
+from embedmongo.package import PackageDiscovery, Version
+from embedmongo.system import OSInfo
+
+if typing.TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
+    from requests_mock import Mocker
+
+feed_file = Path(__file__).parent / 'res' / 'full.json'
+
+FEED_URL = 'https://example_url.com/full.json'
+
+
+@pytest.fixture
+def catalog() -> ReleaseCatalog:
+    return ReleaseCatalog(feed_file)
+
+
+class TestRelease:
+    def test_ordering(self):
+        releases = [Release('4.4.10'), Release('5.0.0'), Release('4.4.9'), Release('5.0.0-rc10'), Release('5.0.0-rc9')]
+
+        assert [release.version for release in sorted(releases)] == ['4.4.9', '4.4.10', '5.0.0-rc9', '5.0.0-rc10', '5.0.0']
+
+    def test_equality(self):
+        assert Release('4.0.5') == Release('4.0.5')
+        assert len({Release('4.0.5'), Release('4.0.5')}) == 1
+        assert Release('4.0.5') != Version.V4_0_5
+        assert Release('4.0.5').is_latest is False
+
+    @pytest.mark.parametrize('version', ['4.0', '4.0-latest', 'v4.0.5', ''])
+    def test_invalid_version(self, version: str):
+        with pytest.raises(ValueError):
+            Release(version)
+
+
+@pytest.mark.parametrize('spec,matching,not_matching', [
+    ('4.4.x', ['4.4.0', '4.4.6'], ['4.5.0', '4.2.8']),
+    ('4.4', ['4.4.6'], ['4.5.0']),
+    ('4.*', ['4.0.0', '4.4.6'], ['5.0.3']),
+    ('>=5.0', ['5.0.0', '6.0.1'], ['4.4.6']),
+    ('>=4.2, <5', ['4.2.0', '4.4.6'], ['4.0.5', '5.0.0']),
+    ('>= 4.2 <4.4', ['4.2.8'], ['4.4.0']),
+    ('>4.4', ['4.5.0', '5.0.0'], ['4.4.6']),
+    ('<=4.4', ['4.4.6'], ['4.5.0']),
+    ('!=4.4.2', ['4.4.6'], ['4.4.2']),
+    ('4.0.5', ['4.0.5'], ['4.0.6']),
+])
+def test_parse_spec(spec: str, matching: typing.List[str], not_matching: typing.List[str]):
+    matches, _ = parse_spec(spec)
+
+    assert all(matches(Release(version)) for version in matching)
+    assert not any(matches(Release(version)) for version in not_matching)
+
+
+@pytest.mark.parametrize('spec', ['', '4.x.1', '>=4.x.y', '~4.4'])
+def test_parse_invalid_spec(spec: str):
+    with pytest.raises(ValueError):
+        parse_spec(spec)
+
+
+class TestReleaseCatalog:
+    def test_releases(self, catalog: ReleaseCatalog):
+        assert [release.version for release in catalog.releases()] == ['5.0.3', '5.0.0-rc1', '4.5.1', '4.4.6', '4.4.2', '4.2.8']
+        assert [release.version for release in catalog.releases(production_only=True)] == ['5.0.3', '4.4.6', '4.4.2', '4.2.8']
+
+    def test_lookup(self, catalog: ReleaseCatalog):
+        entry = catalog.lookup(Release('4.4.6'), 'linux', 'x86_64')
+        targeted = catalog.lookup(Release('4.4.6'), 'linux', 'x86_64', edition='targeted', target='ubuntu1804')
+
+        assert entry is not None and targeted is not None
+        assert entry.url == 'https://fastdl.mongodb.org/linux/mongodb-linux-x86_64-4.4.6.tgz'
+        assert entry.filename == 'mongodb-linux-x86_64-4.4.6.tgz'
+        assert entry.sha256 is not None and len(entry.sha256) == 64
+        assert targeted.filename == 'mongodb-linux-x86_64-ubuntu1804-4.4.6.tgz'
+        assert catalog.lookup(Release('4.4.6'), 'osx', 'x86_64') is not None
+        assert catalog.lookup(Release('4.4.6'), 'windows', 'x86_64') is None
+        assert catalog.lookup(Release('3.6.9'), 'linux', 'x86_64') is None
+
+    @pytest.mark.parametrize('spec,expected', [('4.4.x', '4.4.6'), ('4.x', '4.4.6'), ('>=4.0', '5.0.3'), ('<4.4', '4.2.8'), ('4.5.1', '4.5.1'),
+                                               ('5.0.0-rc1', '5.0.0-rc1'), ('latest', '5.0.3')])
+    def test_resolve(self, catalog: ReleaseCatalog, spec: str, expected: str):
+        assert catalog.resolve(spec) == Release(expected)
+
+    def test_resolve_for_platform(self, catalog: ReleaseCatalog):
+        assert catalog.resolve('>=4.0', 'linux', 'aarch64') == Release('4.4.6')
+
+    def test_find_prefers_distro_build(self, catalog: ReleaseCatalog):
+        targeted = catalog.find(Release('4.4.6'), 'linux', 'x86_64', targets=['ubuntu2004', 'ubuntu1804'])
+        generic = catalog.find(Release('4.4.6'), 'linux', 'x86_64', targets=['rhel80'])
+
+        assert targeted is not None and targeted.target == 'ubuntu1804'
+        assert generic is not None and generic.target == 'linux_x86_64'
+
+    def test_resolve_not_found(self, catalog: ReleaseCatalog):
+        with pytest.raises(PackageNotFoundException):
+            catalog.resolve('6.x')
+
+    def test_feed_is_loaded_on_first_lookup(self, tmp_path: Path, requests_mock: 'Mocker'):
+        requests_mock.get(FEED_URL, content=feed_file.read_bytes(), headers={'ETag': 'abcd'})
+        catalog = ReleaseCatalog(FEED_URL, cache_dir=tmp_path)
+        assert requests_mock.call_count == 0
+
+        catalog.resolve('4.4.x')
+        catalog.resolve('5.0.x')
+
+        assert requests_mock.call_count == 1
+        cached = json.loads((tmp_path / 'index.json').read_text())
+        assert cached['etag'] == 'abcd'
+        assert not (tmp_path / 'full.json').exists()
+
+    def test_cached_index_is_used_within_ttl(self, tmp_path: Path, requests_mock: 'Mocker'):
+        requests_mock.get(FEED_URL, content=feed_file.read_bytes(), headers={'ETag': 'abcd'})
+        ReleaseCatalog(FEED_URL, cache_dir=tmp_path).releases()
+
+        assert len(ReleaseCatalog(FEED_URL, cache_dir=tmp_path).releases()) == 6
+        assert requests_mock.call_count == 1
+
+    def test_cached_index_is_revalidated_with_etag(self, tmp_path: Path, requests_mock: 'Mocker'):
+        requests_mock.get(FEED_URL, content=feed_file.read_bytes(), headers={'ETag': 'abcd'})
+        ReleaseCatalog(FEED_URL, cache_dir=tmp_path).releases()
+        requests_mock.get(FEED_URL, status_code=HTTPStatus.NOT_MODIFIED, headers={'ETag': 'abcd'})
+
+        releases = ReleaseCatalog(FEED_URL, cache_dir=tmp_path, ttl=0).releases()
+
+        assert len(releases) == 6
+        assert requests_mock.last_request.headers['If-None-Match'] == 'abcd'
+
+    def test_refresh_picks_new_feed(self, tmp_path: Path, requests_mock: 'Mocker'):
+        feed = json.loads(feed_file.read_text())
+        requests_mock.get(FEED_URL, content=feed_file.read_bytes(), headers={'ETag': 'abcd'})
+        catalog = ReleaseCatalog(FEED_URL, cache_dir=tmp_path)
+        catalog.releases()
+        feed['versions'].insert(0, dict(feed['versions'][0], version='5.0.4'))
+        requests_mock.get(FEED_URL, content=json.dumps(feed).encode(), headers={'ETag': 'efgh'})
+
+        catalog.refresh()
+
+        assert catalog.resolve('5.0.x') == Release('5.0.4')
+
+    def test_stale_index_is_used_when_feed_is_unavailable(self, tmp_path: Path, requests_mock: 'Mocker'):
+        requests_mock.get(FEED_URL, content=feed_file.read_bytes(), headers={'ETag': 'abcd'})
+        ReleaseCatalog(FEED_URL, cache_dir=tmp_path).releases()
+        requests_mock.get(FEED_URL, status_code=HTTPStatus.SERVICE_UNAVAILABLE)
+
+        assert len(ReleaseCatalog(FEED_URL, cache_dir=tmp_path, ttl=0).releases()) == 6
+
+
+class TestPackageDiscoveryWithCatalog:
+    @pytest.fixture
+    def platform(self, monkeypatch) -> typing.Generator[typing.Callable[[str, typing.List[str]], None], None, None]:
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            def set_platform(arch: str, targets: typing.List[str]) -> None:
+                m.setattr(OSInfo, 'architecture', lambda: arch)
+                m.setattr(OSInfo, 'targets', lambda: targets)
+
+            m.setattr(OSInfo, 'type', lambda: 'linux')
+            set_platform('x86_64', [])
+
+            yield set_platform
+
+    @pytest.fixture
+    def discovery(self, catalog: ReleaseCatalog, platform: typing.Callable[[str, typing.List[str]], None]) -> PackageDiscovery:
+        return PackageDiscovery(catalog=catalog)
+
+    def test_create_release(self, discovery: PackageDiscovery, catalog: ReleaseCatalog):
+        pkg = discovery.create(discovery.resolve('4.4.x'))
+        entry = catalog.lookup(Release('4.4.6'), 'linux', 'x86_64')
+
+        assert entry is not None
+        assert pkg.version == Release('4.4.6')
+        assert pkg.url == 'http://downloads.mongodb.org/linux/mongodb-linux-x86_64-4.4.6.tgz'
+        assert pkg.sha256 == entry.sha256
+
+    def test_create_distro_release(self, discovery: PackageDiscovery, platform: typing.Callable[[str, typing.List[str]], None]):
+        platform('x86_64', ['ubuntu1804'])
+
+        assert discovery.create(Release('5.0.3')).filename == 'mongodb-linux-x86_64-ubuntu1804-5.0.3.tgz'
+
+    def test_create_native_arm_release(self, discovery: PackageDiscovery, platform: typing.Callable[[str, typing.List[str]], None]):
+        platform('aarch64', ['ubuntu1804'])
+
+        assert discovery.resolve('4.x') == Release('4.4.6')
+        assert discovery.create(Release('4.4.6')).filename == 'mongodb-linux-aarch64-4.4.6.tgz'
+        with pytest.raises(PackageNotFoundException):
+            discovery.create(Release('5.0.3'))
+
+    def test_predefined_version_doesnt_use_catalog(self, discovery: PackageDiscovery):
+        assert discovery.create(Version.V4_0_5).filename == 'mongodb-linux-x86_64-4.0.5.tgz'
+
+    def test_predefined_version_on_arm_uses_catalog(self, tmp_path: Path, platform: typing.Callable[[str, typing.List[str]], None]):
+        feed = json.loads(feed_file.read_text())
+        release = json.loads(json.dumps(feed['versions'][3]).replace('4.4.6', '4.0.5'))
+        feed['versions'].append(release)
+        (tmp_path / 'full.json').write_text(json.dumps(feed))
+        platform('aarch64', [])
+
+        pkg = PackageDiscovery(catalog=ReleaseCatalog(tmp_path / 'full.json')).create(Version.V4_0_5)
+
+        assert pkg.version == Version.V4_0_5
+        assert pkg.filename == 'mongodb-linux-aarch64-4.0.5.tgz'
+
+    def test_latest_version_on_arm_raises_exception(self, discovery: PackageDiscovery, platform: typing.Callable[[str, typing.List[str]], None]):
+        platform('aarch64', [])
+
+        with pytest.raises(PackageNotFoundException):
+            discovery.create(Version.V4_0_LATEST)
+
+    def test_predefined_version_on_arm_without_catalog_raises_exception(self, platform: typing.Callable[[str, typing.List[str]], None]):
+        platform('aarch64', [])
+
+        with pytest.raises(PackageNotFoundException):
+            PackageDiscovery().create(Version.V4_0_5)
+
+    def test_release_without_catalog_raises_exception(self, monkeypatch):
+        with monkeypatch.context() as m, pytest.raises(PackageNotFoundException):  # type: MonkeyPatch
+            m.setattr(OSInfo, 'type', lambda: 'linux')
+            m.setattr(OSInfo, 'architecture', lambda: 'x86_64')
+
+            PackageDiscovery().create(Release('4.4.6'))
@@ -0,0 +1,192 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http import HTTPStatus
+from pathlib import Path
+import shutil
+import typing
+
+import pytest
+
+from embedmongo import EmbedMongo, Revalidate, Version
+from embedmongo.blobstore import BlobStore, file_digest
+from embedmongo.exceptions import DownloadFileException, InvalidOSException
+from embedmongo.package import PackageDiscovery
+from embedmongo.system import OSInfo
+
+if typing.TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
+    from requests_mock import Mocker
+
+pkg_file = Path(__file__).parent / 'res' / 'mongo.tgz'
+
+
+class TestEmbedMongo:
+    @pytest.fixture
+    def workspace_dir(self, tmp_path: Path, monkeypatch) -> typing.Generator[Path, None, None]:
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(OSInfo, 'type', lambda: 'linux')
+            m.setattr(OSInfo, 'architecture', lambda: 'x86_64')
+
+            yield tmp_path
+
+    @staticmethod
+    def _mock_version(requests_mock: 'Mocker', version: Version, status_code: int = HTTPStatus.OK) -> None:
+        url = PackageDiscovery().create(version).url
+        if status_code == HTTPStatus.OK:
+            requests_mock.get(url, status_code=status_code, content=pkg_file.read_bytes())
+            requests_mock.get(url + '.sha256', text='{digest}  {name}\n'.format(digest=file_digest(pkg_file), name=url.rsplit('/', 1)[-1]))
+        else:
+            requests_mock.get(url, status_code=status_code, text=HTTPStatus(status_code).phrase)
+            requests_mock.get(url + '.sha256', status_code=status_code)
+
+    @staticmethod
+    def _archive_requests(requests_mock: 'Mocker') -> int:
+        return len([request for request in requests_mock.request_history if not request.path.endswith('.sha256')])
+
+    def test_init_without_side_effects(self, tmp_path: Path, monkeypatch):
+        workspace_dir = tmp_path / 'workspace'
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(OSInfo, 'type', lambda: 'windows')
+            embed_mongo = EmbedMongo(workspace_dir, cache_quota=1024)
+
+            assert workspace_dir.exists() is False
+            with pytest.raises(InvalidOSException):
+                embed_mongo.prepare(Version.V4_0_5)
+
+        assert embed_mongo.registry.instances() == []
+
+    def test_prepare_returns_bin_dir(self, workspace_dir: Path, requests_mock: 'Mocker'):
+        self._mock_version(requests_mock, Version.V4_0_5)
+
+        bin_dir = EmbedMongo(workspace_dir).prepare(Version.V4_0_5)
+
+        assert (bin_dir / 'mongod').exists()
+
+    def test_prepare_streaming(self, workspace_dir: Path, requests_mock: 'Mocker'):
+        self._mock_version(requests_mock, Version.V4_0_5)
+
+        results = EmbedMongo(workspace_dir, streaming=True).prepare_many([Version.V4_0_5])
+
+        assert (results[0].bin_dir / 'mongod').exists()
+        assert not list((workspace_dir / Version.V4_0_5.version).glob('*.tgz'))
+
+    @pytest.mark.parametrize('version,revalidate,ttl,expected_requests', [
+        (Version.V4_0_5, Revalidate.TTL, 0, 1),
+        (Version.V4_0_5, Revalidate.ALWAYS, 3600, 3),
+        (Version.V4_0_LATEST, Revalidate.TTL, 3600, 1),
+        (Version.V4_0_LATEST, Revalidate.TTL, 0, 3),
+        (Version.V4_0_LATEST, Revalidate.NEVER, 0, 1),
+    ])
+    def test_prepare_revalidate_policy(self, workspace_dir: Path, requests_mock: 'Mocker', version: Version, revalidate: Revalidate, ttl: float,
+                                       expected_requests: int):
+        self._mock_version(requests_mock, version)
+        embed_mongo = EmbedMongo(workspace_dir, revalidate=revalidate, revalidate_ttl=ttl)
+
+        bin_dir = embed_mongo.prepare(version)
+
+        assert embed_mongo.prepare(version) == bin_dir
+        assert embed_mongo.prepare_many([version])[0].bin_dir == bin_dir
+        assert self._archive_requests(requests_mock) == expected_requests
+
+    @pytest.mark.parametrize('streaming', [False, True])
+    def test_prepare_components(self, workspace_dir: Path, requests_mock: 'Mocker', streaming: bool):
+        self._mock_version(requests_mock, Version.V4_0_5)
+        embed_mongo = EmbedMongo(workspace_dir, streaming=streaming)
+
+        bin_dir = embed_mongo.prepare(Version.V4_0_5, components={'mongod'})
+
+        assert embed_mongo.prepare(Version.V4_0_5, components=['mongod']) == bin_dir
+        assert [path.name for path in bin_dir.iterdir()] == ['mongod']
+        assert self._archive_requests(requests_mock) == 1
+
+    def test_prepare_offline_fails_without_prepared_version(self, workspace_dir: Path, requests_mock: 'Mocker'):
+        self._mock_version(requests_mock, Version.V4_0_5, status_code=HTTPStatus.NOT_FOUND)
+
+        with pytest.raises(DownloadFileException):
+            EmbedMongo(workspace_dir, revalidate=Revalidate.NEVER).prepare(Version.V4_0_5)
+
+    def test_prepare_revalidates_removed_install(self, workspace_dir: Path, requests_mock: 'Mocker'):
+        self._mock_version(requests_mock, Version.V4_0_5)
+        embed_mongo = EmbedMongo(workspace_dir)
+        bin_dir = embed_mongo.prepare(Version.V4_0_5)
+        shutil.rmtree(str(bin_dir.parent))
+
+        assert (embed_mongo.prepare(Version.V4_0_5) / 'mongod').exists()
+        assert self._archive_requests(requests_mock) == 2
+
+    def test_start(self, workspace_dir: Path, fake_bin_dir: Path, monkeypatch):
+        embed_mongo = EmbedMongo(workspace_dir)
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(embed_mongo, 'prepare', lambda version, components=None: fake_bin_dir)
+
+            with embed_mongo.start(Version.V4_0_5) as process:
+                assert process.is_running()
+                assert process.pid > 0
+
+    def test_start_from_snapshot(self, workspace_dir: Path, fake_bin_dir: Path, monkeypatch):
+        embed_mongo = EmbedMongo(workspace_dir)
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(embed_mongo, 'prepare', lambda version, components=None: fake_bin_dir)
+
+            with embed_mongo.start(Version.V4_0_5, snapshot='default') as first, embed_mongo.start(Version.V4_0_5, snapshot='default') as second:
+                assert first.dbpath != second.dbpath
+                assert len((second.dbpath / 'starts.log').read_text().splitlines()) == 2
+
+        assert (workspace_dir / Version.V4_0_5.version / 'snapshots' / 'default' / 'starts.log').exists()
+
+    def test_prepare_shares_blob_store_between_workspaces(self, workspace_dir: Path, requests_mock: 'Mocker'):
+        self._mock_version(requests_mock, Version.V4_0_5)
+        store = BlobStore(workspace_dir / 'store')
+
+        first = EmbedMongo(workspace_dir / 'first', blob_store=store).prepare(Version.V4_0_5)
+        second = EmbedMongo(workspace_dir / 'second', blob_store=store).prepare(Version.V4_0_5)
+
+        assert (first / 'mongod').stat().st_ino == (second / 'mongod').stat().st_ino
+
+    def test_prepare_many_empty(self, workspace_dir: Path):
+        assert EmbedMongo(workspace_dir).prepare_many([]) == []
+
+    def test_prepare_many_keeps_order(self, workspace_dir: Path, requests_mock: 'Mocker'):
+        versions = [Version.V4_0_5, Version.V3_6_9, Version.V3_4_18]
+        for version in versions:
+            self._mock_version(requests_mock, version)
+
+        results = EmbedMongo(workspace_dir).prepare_many(versions, max_workers=2)
+
+        assert [result.version for result in results] == versions
+        for result in results:
+            assert result.error is None
+            assert (result.bin_dir / 'mongod').exists()
+            assert result.bin_dir.parent.parent == workspace_dir / result.version.version
+
+    def test_prepare_many_removes_duplicates(self, workspace_dir: Path, requests_mock: 'Mocker'):
+        self._mock_version(requests_mock, Version.V4_0_5)
+
+        results = EmbedMongo(workspace_dir).prepare_many([Version.V4_0_5, Version.V4_0_5])
+
+        assert len(results) == 1
+        assert self._archive_requests(requests_mock) == 1
+
+    def test_prepare_many_reports_errors_per_version(self, workspace_dir: Path, requests_mock: 'Mocker'):
+        self._mock_version(requests_mock, Version.V4_0_5)
+        self._mock_version(requests_mock, Version.V3_6_9, status_code=HTTPStatus.NOT_FOUND)
+
+        ok_result, failed_result = EmbedMongo(workspace_dir).prepare_many([Version.V4_0_5, Version.V3_6_9])
+
+        assert ok_result.error is None
+        assert ok_result.bin_dir is not None
+        assert isinstance(failed_result.error, DownloadFileException)
+        assert failed_result.bin_dir is None
@@ -0,0 +1,75 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent import futures
+from pathlib import Path
+import typing
+
+from embedmongo.downloader import Downloader, DownloadStats
+
+if typing.TYPE_CHECKING:
+    from .http_server import RangeHTTPServer
+
+tar_file = Path(__file__).parent / 'res' / 'example.tgz'
+
+
+class TestDownloader:
+    def test_download_reuses_connection(self, tmp_path: Path, http_server: 'RangeHTTPServer'):
+        urls = [http_server.add('/file{idx}'.format(idx=idx), b'content') for idx in range(3)]
+        downloader = Downloader()
+
+        for idx, url in enumerate(urls):
+            downloader.download(url, tmp_path / str(idx))
+
+        assert len(http_server.clients) == 1
+
+    def test_download_concurrently(self, tmp_path: Path, http_server: 'RangeHTTPServer'):
+        urls = [http_server.add('/file{idx}'.format(idx=idx), b'content') for idx in range(8)]
+        downloader = Downloader(pool_size=4)
+
+        with futures.ThreadPoolExecutor(4) as pool:
+            list(pool.map(lambda idx: downloader.download(urls[idx], tmp_path / str(idx)), range(len(urls))))
+
+        assert all((tmp_path / str(idx)).read_bytes() == b'content' for idx in range(len(urls)))
+        assert downloader.stats.requests == len(urls)
+        assert len(http_server.clients) <= 4
+
+    def test_download_retries_unavailable_server(self, tmp_path: Path, http_server: 'RangeHTTPServer'):
+        url = http_server.add('/file', b'content', unavailable=2)
+        dst_file = tmp_path / 'file'
+
+        Downloader(retries=2, backoff_factor=0).download(url, dst_file)
+
+        assert dst_file.read_bytes() == b'content'
+        assert len(http_server.requests) == 3
+
+    def test_stats(self, tmp_path: Path, http_server: 'RangeHTTPServer'):
+        url = http_server.add('/file', b'content', etag='abcd')
+        dst_file = tmp_path / 'file'
+        downloader = Downloader()
+
+        downloader.download(url, dst_file)
+        downloader.download(url, dst_file, etag='abcd')
+
+        assert downloader.stats == DownloadStats(requests=2, not_modified=1, bytes_downloaded=len(b'content'), bytes_saved=len(b'content'))
+
+    def test_stats_download_and_extract(self, tmp_path: Path, http_server: 'RangeHTTPServer'):
+        url = http_server.add('/example.tgz', tar_file.read_bytes(), etag='abcd')
+        dst_dir = tmp_path / 'dst'
+        downloader = Downloader()
+
+        downloader.download_and_extract(url, dst_dir)
+        downloader.download_and_extract(url, dst_dir, etag='abcd', cached_size=100)
+
+        assert downloader.stats == DownloadStats(requests=2, not_modified=1, bytes_downloaded=tar_file.stat().st_size, bytes_saved=100)
@@ -0,0 +1,177 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http import HTTPStatus
+from pathlib import Path
+import typing
+
+import pytest
+
+from embedmongo.events import (DownloadFinished, DownloadProgress, DownloadStarted, ExtractFinished, Hooks, hooks, MongodStarted, OpenTelemetrySpans,
+                               PrometheusMetrics)
+from embedmongo.process import MongodLauncher
+from embedmongo.utils import download_and_extract, download_file, extract_file
+
+if typing.TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
+    from requests_mock import Mocker
+
+tar_file = Path(__file__).parent / 'res' / 'example.tgz'
+
+
+@pytest.fixture
+def events() -> typing.Generator[typing.List[typing.Any], None, None]:
+    received = []  # type: typing.List[typing.Any]
+    hooks.subscribe(received.append)
+    yield received
+    hooks.unsubscribe(received.append)
+
+
+class TestHooks:
+    def test_listener_of_event_types(self):
+        registry = Hooks()
+        received = []  # type: typing.List[typing.Any]
+        registry.subscribe(received.append, ExtractFinished)
+
+        registry.emit(DownloadStarted(url='url', filename='file', total=None, resumed_from=0))
+        registry.emit(ExtractFinished(source='file', dst=Path('dst'), files=1, archive_size=10, duration=0.1))
+
+        assert [type(event) for event in received] == [ExtractFinished]
+
+    def test_unsubscribe(self):
+        registry = Hooks()
+        received = []  # type: typing.List[typing.Any]
+        listener = registry.subscribe(received.append)
+        assert registry.active
+
+        registry.unsubscribe(listener)
+        registry.emit(MongodStarted(binary='mongod', address='127.0.0.1:27017', pid=1, startup_time=0.1))
+
+        assert not registry.active
+        assert received == []
+
+    def test_failing_listener_doesnt_stop_others(self):
+        def fail(event: typing.Any) -> None:
+            raise ValueError('broken listener')
+
+        registry = Hooks()
+        received = []  # type: typing.List[typing.Any]
+        registry.subscribe(fail)
+        registry.subscribe(received.append)
+
+        registry.emit(MongodStarted(binary='mongod', address='127.0.0.1:27017', pid=1, startup_time=0.1))
+
+        assert len(received) == 1
+
+
+class TestPipelineEvents:
+    def test_download(self, tmp_path: Path, requests_mock: 'Mocker', events: typing.List[typing.Any]):
+        url = 'https://example_url.com/file'
+        requests_mock.get(url, content=b'x' * 100, headers={'Content-Length': '100'}, status_code=HTTPStatus.OK)
+
+        download_file(url, tmp_path / 'file')
+
+        assert events[0] == DownloadStarted(url=url, filename='file', total=100, resumed_from=0)
+        finished = events[-1]
+        assert isinstance(finished, DownloadFinished)
+        assert (finished.size, finished.not_modified) == (100, False)
+        assert finished.duration > 0
+
+    def test_download_not_modified(self, tmp_path: Path, requests_mock: 'Mocker', events: typing.List[typing.Any]):
+        url = 'https://example_url.com/file'
+        requests_mock.get(url, status_code=HTTPStatus.NOT_MODIFIED)
+
+        download_file(url, tmp_path / 'file', etag='abcd')
+
+        assert [(type(event), event.not_modified, event.size) for event in events] == [(DownloadFinished, True, 0)]
+
+    @pytest.mark.parametrize('interval,expected_reports', [(0.0, 16), (3600.0, 0)])
+    def test_download_progress_is_throttled(self, tmp_path: Path, requests_mock: 'Mocker', monkeypatch, events: typing.List[typing.Any],
+                                            interval: float, expected_reports: int):
+        url = 'https://example_url.com/file'
+        requests_mock.get(url, content=b'x' * 16 * 1024, status_code=HTTPStatus.OK)
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr('embedmongo.utils._CHUNK_SIZE', 1024)
+            m.setattr(hooks, 'progress_interval', interval)
+            download_file(url, tmp_path / 'file')
+
+        progress = [event for event in events if isinstance(event, DownloadProgress)]
+        assert len(progress) == expected_reports
+        assert [event.received for event in progress] == [1024 * idx for idx in range(1, expected_reports + 1)]
+
+    def test_extract_file(self, tmp_path: Path, events: typing.List[typing.Any]):
+        extract_file(tar_file, tmp_path, strip_level=1)
+
+        assert len(events) == 1
+        assert events[0].files == 1
+        assert events[0].archive_size == tar_file.stat().st_size
+
+    def test_download_and_extract(self, tmp_path: Path, requests_mock: 'Mocker', events: typing.List[typing.Any]):
+        url = 'https://example_url.com/example.tgz'
+        requests_mock.get(url, content=tar_file.read_bytes(), status_code=HTTPStatus.OK)
+
+        download_and_extract(url, tmp_path / 'dst', strip_level=1)
+
+        assert [type(event) for event in events] == [DownloadStarted, DownloadFinished, ExtractFinished]
+        assert events[2].files == 1
+
+    def test_mongod_started(self, fake_bin_dir: Path, events: typing.List[typing.Any]):
+        with MongodLauncher(fake_bin_dir).start() as process:
+            pass
+
+        assert events == [MongodStarted(binary='mongod', address=process.address, pid=process.pid, startup_time=process.startup_time)]
+
+
+class TestAdapters:
+    def test_prometheus_metrics(self):
+        metrics = PrometheusMetrics()
+        metrics(DownloadFinished(url='url', filename='file', size=100, duration=0.5, rate=200.0, not_modified=False))
+        metrics(DownloadFinished(url='url', filename='file', size=0, duration=0.1, rate=0.0, not_modified=True))
+        metrics(MongodStarted(binary='mongod', address='127.0.0.1:27017', pid=1, startup_time=0.25))
+
+        assert metrics.value('embedmongo_downloads_total', not_modified='true') == 1
+        assert metrics.value('embedmongo_download_bytes_total') == 100
+        assert metrics.value('embedmongo_process_startup_seconds_total', binary='mongod') == 0.25
+        exposition = metrics.exposition()
+        assert '# TYPE embedmongo_downloads_total counter' in exposition
+        assert 'embedmongo_downloads_total{not_modified="false"} 1.0' in exposition
+        assert 'embedmongo_download_seconds_total 0.6' in exposition
+
+    def test_open_telemetry_spans(self):
+        class Span:
+            def __init__(self, name: str, start_time: int, attributes: typing.Dict[str, typing.Any]):
+                self.name = name
+                self.start_time = start_time
+                self.attributes = attributes
+                self.end_time = None  # type: typing.Optional[int]
+
+            def end(self, end_time: int) -> None:
+                self.end_time = end_time
+
+        class Tracer:
+            spans = []  # type: typing.List[Span]
+
+            def start_span(self, name: str, start_time: int, attributes: typing.Dict[str, typing.Any]) -> Span:
+                self.spans.append(Span(name, start_time, attributes))
+                return self.spans[-1]
+
+        tracer = Tracer()
+        OpenTelemetrySpans(tracer)(ExtractFinished(source='file.tgz', dst=Path('dst'), files=3, archive_size=10, duration=2.0))
+
+        span, = tracer.spans
+        assert span.name == 'embedmongo.extract'
+        assert span.attributes['embedmongo.files'] == 3
+        assert span.end_time is not None
+        assert span.end_time - span.start_time == 2 * 10**9
@@ -0,0 +1,180 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+from pathlib import Path
+import tarfile
+import typing
+
+import pytest
+
+from embedmongo.extract import extract_members, MemberFilter
+from embedmongo.utils import extract_file
+
+
+def _add_file(tar: tarfile.TarFile, name: str, content: bytes, mode: int = 0o644) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mode = mode
+    info.mtime = 1500000000
+    tar.addfile(info, io.BytesIO(content))
+
+
+@pytest.fixture
+def archive(tmp_path: Path) -> Path:
+    path = tmp_path / 'mongodb-linux-x86_64-4.0.5.tgz'
+    with tarfile.open(str(path), 'w:gz') as tar:
+        info = tarfile.TarInfo('mongodb/bin')
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        tar.addfile(info)
+        _add_file(tar, 'mongodb/bin/mongod', b'd' * 3000, mode=0o755)
+        _add_file(tar, 'mongodb/bin/mongo', b'm' * 2000, mode=0o755)
+        _add_file(tar, 'mongodb/bin/mongodump', b'x' * 1000, mode=0o755)
+        link = tarfile.TarInfo('mongodb/bin/mongod-link')
+        link.type = tarfile.LNKTYPE
+        link.linkname = 'mongodb/bin/mongod'
+        tar.addfile(link)
+        symlink = tarfile.TarInfo('mongodb/LICENSE')
+        symlink.type = tarfile.SYMTYPE
+        symlink.linkname = 'bin/mongo'
+        tar.addfile(symlink)
+        _add_file(tar, 'mongodb/../outside', b'evil')
+
+    return path
+
+
+# crafted archives: members as (name, type, link target or content), extracted paths which must not exist
+UNSAFE_ARCHIVES = {
+    'absolute_symlink': ([('bin', tarfile.SYMTYPE, '{outside}'), ('bin/x', tarfile.REGTYPE, 'evil')], []),
+    'escaping_symlink': ([('bin', tarfile.SYMTYPE, '../outside'), ('bin/x', tarfile.REGTYPE, 'evil')], []),
+    'write_through_symlink': ([('real', tarfile.DIRTYPE, ''), ('lib', tarfile.SYMTYPE, 'real'), ('lib/x', tarfile.REGTYPE, 'evil')], ['real/x']),
+    'escaping_hard_link': ([('x', tarfile.LNKTYPE, '../outside/secret')], ['x']),
+    'hard_link_through_symlink': ([('real/f', tarfile.REGTYPE, 'f'), ('lib', tarfile.SYMTYPE, 'real'), ('y', tarfile.LNKTYPE, 'lib/f')], ['y']),
+    'symlink_up_from_symlink': ([('sub/x', tarfile.SYMTYPE, '.'), ('d', tarfile.SYMTYPE, 'sub/x/../..')], ['d']),
+}  # type: typing.Dict[str, typing.Tuple[typing.List[typing.Tuple[str, bytes, str]], typing.List[str]]]
+
+
+def write_archive(path: Path, members: typing.List[typing.Tuple[str, bytes, str]], outside: Path) -> Path:
+    with tarfile.open(str(path), 'w:gz') as tar:
+        for name, member_type, value in members:
+            if member_type == tarfile.REGTYPE:
+                _add_file(tar, name, value.encode())
+                continue
+            info = tarfile.TarInfo(name)
+            info.type = member_type
+            info.mode = 0o755
+            info.linkname = value.format(outside=outside)
+            tar.addfile(info)
+
+    return path
+
+
+class TestMemberFilter:
+    @pytest.mark.parametrize('include,name,expected', [
+        (None, 'bin/mongod', True),
+        (['bin/mongod'], 'bin/mongod', True),
+        (['bin/mongod'], 'bin/mongodump', False),
+        (['bin'], 'bin/mongodump', True),
+        (['bin/mongo*'], 'bin/mongodump', True),
+        (['bin/mongo*'], 'LICENSE', False),
+    ])
+    def test_match(self, include: typing.Optional[typing.List[str]], name: str, expected: bool):
+        assert MemberFilter(include)(name) is expected
+
+    def test_done_only_for_literal_files(self):
+        literal = MemberFilter(['bin/mongod'])
+        pattern = MemberFilter(['bin/mongo*'])
+        for selected in (literal, pattern):
+            selected.found(tarfile.TarInfo('bin/mongod'))
+
+        assert literal.done is True
+        assert pattern.done is False
+        assert MemberFilter().done is False
+
+
+class TestExtractFile:
+    def test_extract_whole_archive(self, archive: Path, tmp_path: Path):
+        dst = tmp_path / 'dst'
+
+        extract_file(archive, dst, strip_level=1)
+
+        assert (dst / 'bin' / 'mongod').read_bytes() == b'd' * 3000
+        assert (dst / 'bin' / 'mongod').stat().st_mode & 0o777 == 0o755
+        assert (dst / 'bin' / 'mongod').stat().st_mtime == 1500000000
+        assert (dst / 'bin' / 'mongod-link').stat().st_ino == (dst / 'bin' / 'mongod').stat().st_ino
+        assert (dst / 'LICENSE').read_bytes() == b'm' * 2000
+        assert (tmp_path / 'outside').exists() is False
+
+    def test_extract_included_members(self, archive: Path, tmp_path: Path):
+        dst = tmp_path / 'dst'
+
+        extract_file(archive, dst, strip_level=1, include=['bin/mongod', 'bin/mongo'])
+
+        assert sorted(path.name for path in (dst / 'bin').iterdir()) == ['mongo', 'mongod']
+        assert (dst / 'LICENSE').exists() is False
+
+    def test_stops_reading_when_included_files_are_found(self, archive: Path, tmp_path: Path):
+        seen = []  # type: typing.List[str]
+
+        def members(tar: tarfile.TarFile) -> typing.Iterator[tarfile.TarInfo]:
+            for member in tar:
+                seen.append(member.name)
+                yield member
+
+        with tarfile.open(str(archive), mode='r|gz') as tar:
+            extracted = extract_members(tar, tmp_path / 'dst', members(tar), include=['mongodb/bin/mongod'])
+
+        assert [member.name for member in extracted] == ['mongodb/bin/mongod']
+        assert seen == ['mongodb/bin', 'mongodb/bin/mongod']
+
+    @pytest.mark.parametrize('max_pending', [1, 2500, 1024 * 1024])
+    def test_pending_bytes_limit(self, archive: Path, tmp_path: Path, max_pending: int):
+        dst = tmp_path / 'dst'
+
+        with tarfile.open(str(archive), mode='r|gz') as tar:
+            extract_members(tar, dst, tar, workers=2, max_pending=max_pending)
+
+        assert (dst / 'mongodb' / 'bin' / 'mongod').read_bytes() == b'd' * 3000
+        assert (dst / 'mongodb' / 'bin' / 'mongodump').read_bytes() == b'x' * 1000
+
+    def test_write_error_is_raised(self, archive: Path, tmp_path: Path):
+        dst = tmp_path / 'dst'
+        (dst / 'mongodb' / 'bin' / 'mongo').mkdir(parents=True)
+
+        with tarfile.open(str(archive), mode='r|gz') as tar, pytest.raises(IsADirectoryError):
+            extract_members(tar, dst, tar)
+
+
+class TestUnsafeMembers:
+    @pytest.mark.parametrize('case', sorted(UNSAFE_ARCHIVES))
+    def test_skipped(self, tmp_path: Path, outside: Path, case: str):
+        members, missing = UNSAFE_ARCHIVES[case]
+        dst = tmp_path / 'dst'
+
+        extract_file(write_archive(tmp_path / 'crafted.tgz', members, outside), dst)
+
+        assert sorted(path.name for path in outside.iterdir()) == ['secret']
+        assert (outside / 'secret').read_text() == 'secret'
+        assert (dst / 'bin').is_symlink() is False
+        assert [name for name in missing if os.path.lexists(str(dst / name))] == []
+
+    def test_relative_symlink_inside(self, tmp_path: Path, outside: Path):
+        members = [('lib/mongod', tarfile.REGTYPE, 'mongod'), ('bin/mongod', tarfile.SYMTYPE, '../lib/mongod')]
+        dst = tmp_path / 'dst'
+
+        extract_file(write_archive(tmp_path / 'archive.tgz', members, outside), dst)
+
+        assert (dst / 'bin' / 'mongod').read_text() == 'mongod'
@@ -0,0 +1,76 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+import subprocess
+import threading
+import typing
+
+from embedmongo.locks import FileLock
+
+
+def _release_later(holder: 'subprocess.Popen[str]', delay: float = 0.2) -> None:
+    assert holder.stdin is not None
+    threading.Timer(delay, holder.stdin.close).start()
+
+
+class TestFileLock:
+    def test_get_returns_shared_instance(self, tmp_path: Path):
+        assert FileLock.get(tmp_path / 'locks' / 'a.lock') is FileLock.get(tmp_path / 'locks' / 'a.lock')
+        assert FileLock.get(tmp_path / 'locks' / 'a.lock') is not FileLock.get(tmp_path / 'locks' / 'b.lock')
+
+    def test_reentrant(self, tmp_path: Path):
+        lock = FileLock.get(tmp_path / 'a.lock')
+
+        with lock.hold() as outer_waited, lock.hold() as inner_waited:
+            assert outer_waited is False
+            assert inner_waited is False
+
+    def test_waits_for_other_process(self, tmp_path: Path, file_lock_holder: typing.Callable[[Path], 'subprocess.Popen[str]']):
+        lock = FileLock.get(tmp_path / 'a.lock')
+        holder = file_lock_holder(lock.path)
+        _release_later(holder)
+
+        with lock.hold() as waited:
+            assert waited is True
+            assert holder.wait(1) == 0
+
+    def test_excludes_other_process(self, tmp_path: Path, file_lock_holder: typing.Callable[[Path], 'subprocess.Popen[str]']):
+        lock = FileLock.get(tmp_path / 'a.lock')
+        with lock.hold():
+            holder = threading.Thread(target=file_lock_holder, args=(lock.path,))
+            holder.start()
+            holder.join(0.2)
+
+            assert holder.is_alive()
+
+        holder.join(5)
+        assert not holder.is_alive()
+
+    def test_waits_for_other_thread(self, tmp_path: Path):
+        lock = FileLock.get(tmp_path / 'a.lock')
+        results = []  # type: typing.List[bool]
+
+        def acquire() -> None:
+            with lock.hold() as waited:
+                results.append(waited)
+
+        with lock.hold():
+            thread = threading.Thread(target=acquire)
+            thread.start()
+            thread.join(0.1)
+            assert not results
+
+        thread.join()
+        assert results == [True]
@@ -0,0 +1,167 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+from pathlib import Path
+import typing
+
+import pytest
+
+from embedmongo.cli import main, mirror
+from embedmongo.downloader import Downloader
+from embedmongo.exceptions import DownloadFileException
+from embedmongo.mirrors import PackageSource, SourceChain
+from embedmongo.package import PackageDiscovery, Version
+from embedmongo.system import OSInfo
+
+if typing.TYPE_CHECKING:
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
+
+    from .http_server import RangeHTTPServer
+
+FILENAME = 'mongodb-linux-x86_64-4.0.5.tgz'
+
+
+@pytest.fixture
+def local_repo(tmp_path: Path) -> Path:
+    repo = tmp_path / 'repo'
+    (repo / 'linux').mkdir(parents=True)
+    (repo / 'linux' / FILENAME).write_bytes(b'local package')
+
+    return repo
+
+
+class TestPackageSource:
+    def test_create_from_path(self, local_repo: Path):
+        source = PackageSource.create(local_repo)
+
+        assert source.is_local
+        assert source.package_url('linux', FILENAME) == (local_repo / 'linux' / FILENAME).as_uri()
+        assert PackageSource.create(str(local_repo)).url == source.url
+
+    def test_probe_local(self, local_repo: Path):
+        source = PackageSource.create(local_repo)
+
+        assert source.probe('linux', FILENAME, Downloader(), timeout=1) is not None
+        assert source.probe('osx', FILENAME, Downloader(), timeout=1) is None
+
+    def test_probe_http(self, http_server: 'RangeHTTPServer'):
+        http_server.add('/linux/' + FILENAME, b'content')
+        source = PackageSource.create(http_server.url)
+
+        assert source.is_local is False
+        assert source.probe('linux', FILENAME, Downloader(), timeout=1) is not None
+        assert source.probe('osx', FILENAME, Downloader(), timeout=1) is None
+        assert PackageSource('http://127.0.0.1:1').probe('linux', FILENAME, Downloader(retries=0), timeout=1) is None
+
+
+class TestSourceChain:
+    def test_orders_available_sources_first(self, local_repo: Path, http_server: 'RangeHTTPServer'):
+        http_server.add('/linux/' + FILENAME, b'content')
+        empty_repo = PackageSource.create(local_repo.parent / 'empty')
+        chain = SourceChain([empty_repo, PackageSource(http_server.url), PackageSource.create(local_repo)])
+
+        urls = chain.urls('linux', FILENAME)
+
+        assert urls[-1] == empty_repo.package_url('linux', FILENAME)
+        assert set(urls[:2]) == {http_server.url + '/linux/' + FILENAME, (local_repo / 'linux' / FILENAME).as_uri()}
+
+    def test_probe_results_kept(self, local_repo: Path, monkeypatch):
+        downloader = Downloader()
+        chain = SourceChain([PackageSource('http://mirror'), PackageSource.create(local_repo)], downloader=downloader)
+        heads = []
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(Downloader, 'exists', lambda self, url, timeout=None: heads.append((self, url)) or True)
+            first = chain.urls('linux', FILENAME)
+            second = chain.urls('linux', FILENAME)
+            chain.urls('osx', FILENAME)
+
+        assert first == second
+        assert len(heads) == 4
+        assert {probe_downloader for probe_downloader, _ in heads} == {downloader}
+
+    def test_single_source_is_not_probed(self, http_server: 'RangeHTTPServer'):
+        assert SourceChain([PackageSource(http_server.url)]).urls('linux', FILENAME) == [http_server.url + '/linux/' + FILENAME]
+        assert http_server.requests == []
+
+
+class TestPackageDiscoveryMirrors:
+    def test_create_with_fallback_to_upstream(self, local_repo: Path, monkeypatch):
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(OSInfo, 'type', lambda: 'linux')
+            m.setattr(OSInfo, 'architecture', lambda: 'x86_64')
+            m.setattr(PackageSource, 'probe', lambda self, os_type, filename, downloader, timeout: 0.5 if self.is_local else None)
+
+            pkg = PackageDiscovery(mirrors=[local_repo]).create(Version.V4_0_5)
+
+        assert pkg.url == (local_repo / 'linux' / FILENAME).as_uri()
+        assert pkg.fallback_urls == ('http://downloads.mongodb.org/linux/' + FILENAME,)
+
+    def test_known_packages(self):
+        packages = PackageDiscovery('http://mirror').known_packages(['linux'])
+
+        assert len(packages) == len(Version)
+        assert {pkg.os_type for pkg in packages} == {'linux'}
+        assert all(pkg.url == 'http://mirror/linux/' + pkg.filename for pkg in packages)
+
+
+class TestFileDownload:
+    def test_download_from_file_url(self, local_repo: Path, tmp_path: Path):
+        url = (local_repo / 'linux' / FILENAME).as_uri()
+        dst = tmp_path / FILENAME
+        downloader = Downloader()
+
+        result = downloader.download(url, dst)
+        not_modified = downloader.download(url, dst, etag=result.etag)
+
+        assert dst.read_bytes() == b'local package'
+        assert result.saved is True
+        assert not_modified.saved is False
+
+    def test_download_missing_file(self, tmp_path: Path):
+        with pytest.raises(DownloadFileException):
+            Downloader().download((tmp_path / 'missing.tgz').as_uri(), tmp_path / 'dst.tgz')
+
+
+class TestMirrorCommand:
+    def test_mirror(self, tmp_path: Path, http_server: 'RangeHTTPServer'):
+        http_server.add('/linux/' + FILENAME, b'content', etag='"v1"')
+        dst_dir = tmp_path / 'mirror'
+
+        failed = mirror(dst_dir, ['linux'], [Version.V4_0_5], repo_url=http_server.url)
+        assert mirror(dst_dir, ['linux'], [Version.V4_0_5], repo_url=http_server.url) == []
+
+        assert failed == []
+        assert (dst_dir / 'linux' / FILENAME).read_bytes() == b'content'
+        assert (dst_dir / 'linux' / (FILENAME + '.etag')).read_text() == '"v1"'
+        digest = hashlib.sha256(b'content').hexdigest()
+        assert (dst_dir / 'linux' / (FILENAME + '.sha256')).read_text() == '{digest}  {name}\n'.format(digest=digest, name=FILENAME)
+        assert http_server.requests[-1][1].get('If-None-Match') == '"v1"'
+
+    def test_mirror_verifies_upstream_checksum(self, tmp_path: Path, http_server: 'RangeHTTPServer'):
+        http_server.add('/linux/' + FILENAME, b'content')
+        http_server.add('/linux/' + FILENAME + '.sha256', '{digest}  {name}\n'.format(digest='0' * 64, name=FILENAME).encode())
+
+        failed = mirror(tmp_path, ['linux'], [Version.V4_0_5], repo_url=http_server.url)
+
+        assert [pkg.filename for pkg in failed] == [FILENAME]
+        assert not (tmp_path / 'linux' / FILENAME).exists()
+
+    def test_mirror_command_reports_failures(self, tmp_path: Path, http_server: 'RangeHTTPServer'):
+        http_server.add('/linux/' + FILENAME, b'content')
+
+        assert main(['mirror', str(tmp_path), '--os', 'linux', '--version', '4.0.5', '--repo-url', http_server.url]) == 0
+        assert main(['mirror', str(tmp_path), '--os', 'linux', '--version', '4.0-latest', '--repo-url', http_server.url]) == 1
+        assert main([]) == 2
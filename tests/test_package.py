@@ -13,15 +13,22 @@
 # limitations under the License.
 
 from http import HTTPStatus
+import io
 import logging
 from pathlib import Path
+import re
 import shutil
+import subprocess
+import tarfile
+import threading
 import typing
 
 import pytest
 
-from embedmongo.exceptions import InvalidOSException, PackageNotFoundException
-from embedmongo.package import _PkgMetadata, _VersionDir, ExternalPackage, LocalPackage, PackageDiscovery, PackageManager, Version
+from embedmongo.blobstore import file_digest
+from embedmongo.exceptions import (ChecksumMismatchException, IncompleteDownloadException, InvalidOSException, PackageManagerException,
+                                   PackageNotFoundException)
+from embedmongo.package import _PkgMetadata, _VersionDir, ExternalPackage, LocalPackage, PackageDiscovery, PackageManager, Revalidate, Version
 from embedmongo.system import OSInfo
 
 if typing.TYPE_CHECKING:
@@ -29,9 +36,19 @@ if typing.TYPE_CHECKING:
     from requests_mock import Mocker
     from requests.models import Request
 
+    from .http_server import RangeHTTPServer
+
 logger = logging.getLogger(__name__)
 
 
+@pytest.fixture
+def requests_mock(requests_mock: 'Mocker') -> 'Mocker':
+    """Packages have no published checksums, unless test registers one."""
+    requests_mock.get(re.compile(r'\.sha256$'), status_code=HTTPStatus.NOT_FOUND)
+
+    return requests_mock
+
+
 class TestPackageDiscovery:
     def test_create_unsupported_os_raises_exception(self, monkeypatch):
         with monkeypatch.context() as m, pytest.raises(InvalidOSException):  # type: MonkeyPatch
@@ -75,6 +92,11 @@ class TestPackageDiscovery:
         assert pkg.url == 'http://downloads.mongodb.org/{os_type}/{pkg_name}'.format(os_type=os_type, pkg_name=expected_pkg_name)
 
 
+@pytest.mark.parametrize('version,is_latest', [(Version.V4_0_LATEST, True), (Version.V4_0_5, False)])
+def test_version_is_latest(version: Version, is_latest: bool):
+    assert version.is_latest is is_latest
+
+
 _PKGFile = typing.NamedTuple("_PKGFile", [('local_path', Path), ('ref', typing.BinaryIO)])
 
 
@@ -197,6 +219,23 @@ class TestPackageManager:
         assert expected_metadata_path.exists()
         assert local_pkg.new_file is False
 
+    def test_download_resumes_interrupted_download(self, version_dir: _VersionDir, external_file: _PKGFile, external_pkg: ExternalPackage,
+                                                   http_server: 'RangeHTTPServer'):
+        content = external_file.local_path.read_bytes() + bytes(3 * 1024 * 1024)
+        external_pkg = external_pkg._replace(url=http_server.add('/pkg-name.tgz', content, etag='abcd', fail_after=len(content) // 2))
+        manager = PackageManager(version_dir.path.parent)
+
+        with pytest.raises(IncompleteDownloadException):
+            manager.download(external_pkg)
+
+        assert version_dir.read_metadata().download_part_etag == 'abcd'
+
+        local_pkg = manager.download(external_pkg)
+
+        assert local_pkg.path.read_bytes() == content
+        assert version_dir.read_metadata().download_part_etag is None
+        assert http_server.requests[-1][1]['Range'] == 'bytes=1048576-'
+
     def test_extract_skip_if_extracted_dir_exists(self, loaded_version_dir: _VersionDir):
         local_pkg = LocalPackage(version=loaded_version_dir.version, path=loaded_version_dir.archive_path, new_file=False)
         dummy_file = loaded_version_dir.extracted_dir / 'dummy'
@@ -227,6 +266,164 @@ class TestPackageManager:
         assert bin_dir.parent == loaded_version_dir.extracted_dir
         assert dummy_file.exists() is False
 
+    def test_extract_skips_archive_extracted_by_other_worker(self, loaded_version_dir: _VersionDir):
+        metadata = loaded_version_dir.read_metadata()
+        metadata.extract_etag = metadata.download_etag
+        loaded_version_dir.save_metadata(metadata)
+        local_pkg = LocalPackage(version=loaded_version_dir.version, path=loaded_version_dir.archive_path, new_file=True)
+        dummy_file = loaded_version_dir.extracted_dir / 'dummy'
+        dummy_file.touch()
+
+        PackageManager(loaded_version_dir.path.parent).extract(local_pkg)
+
+        assert dummy_file.exists()
+
+    def test_extract_records_extracted_etag(self, loaded_version_dir: _VersionDir):
+        local_pkg = LocalPackage(version=loaded_version_dir.version, path=loaded_version_dir.archive_path, new_file=True)
+
+        PackageManager(loaded_version_dir.path.parent).extract(local_pkg)
+
+        assert loaded_version_dir.read_metadata().extract_etag == 'abcd'
+        assert [path.name for path in loaded_version_dir.path.iterdir() if path.name.startswith('.')] == []
+
+    def test_download_fails_over_to_next_source(self, version_dir: _VersionDir, external_file: _PKGFile, external_pkg: ExternalPackage,
+                                                requests_mock: 'Mocker'):
+        mirror_url = 'https://mirror.example.com/pkg/pkg-name.tgz'
+        requests_mock.get(mirror_url, status_code=HTTPStatus.NOT_FOUND, text='Not Found')
+        requests_mock.get(TestPackageManager.PKG_URL, status_code=HTTPStatus.OK, body=external_file.ref)
+
+        local_pkg = PackageManager(version_dir.path.parent).download(external_pkg._replace(url=mirror_url, fallback_urls=(external_pkg.url,)))
+
+        assert local_pkg.path.read_bytes() == external_file.local_path.read_bytes()
+        assert version_dir.read_metadata().download_url == TestPackageManager.PKG_URL
+
+    def test_download_verifies_published_checksum(self, version_dir: _VersionDir, external_file: _PKGFile, external_pkg: ExternalPackage,
+                                                  requests_mock: 'Mocker'):
+        digest = file_digest(external_file.local_path)
+        requests_mock.get(TestPackageManager.PKG_URL, status_code=HTTPStatus.OK, body=external_file.ref)
+        requests_mock.get(TestPackageManager.PKG_URL + '.sha256', text='{digest}  pkg-name.tgz\n'.format(digest=digest))
+
+        PackageManager(version_dir.path.parent).download(external_pkg)
+
+        assert version_dir.read_metadata().download_sha256 == digest
+
+    def test_download_checksum_mismatch(self, version_dir: _VersionDir, external_file: _PKGFile, external_pkg: ExternalPackage,
+                                        requests_mock: 'Mocker'):
+        requests_mock.get(TestPackageManager.PKG_URL, status_code=HTTPStatus.OK, body=external_file.ref)
+        requests_mock.get(TestPackageManager.PKG_URL + '.sha256', text='0' * 64)
+
+        with pytest.raises(ChecksumMismatchException):
+            PackageManager(version_dir.path.parent).download(external_pkg)
+
+        assert not version_dir.archive_path.exists()
+        assert version_dir.read_metadata().download_etag is None
+
+    def test_download_pinned_checksum_skips_sidecar(self, version_dir: _VersionDir, external_file: _PKGFile, external_pkg: ExternalPackage,
+                                                    requests_mock: 'Mocker'):
+        requests_mock.get(TestPackageManager.PKG_URL, status_code=HTTPStatus.OK, body=external_file.ref)
+        manager = PackageManager(version_dir.path.parent, checksums={'pkg-name.tgz': '0' * 64})
+
+        with pytest.raises(ChecksumMismatchException):
+            manager.download(external_pkg)
+
+        assert requests_mock.call_count == 1
+
+    def test_download_package_checksum_skips_sidecar(self, version_dir: _VersionDir, external_file: _PKGFile, external_pkg: ExternalPackage,
+                                                     requests_mock: 'Mocker'):
+        requests_mock.get(TestPackageManager.PKG_URL, status_code=HTTPStatus.OK, body=external_file.ref)
+
+        with pytest.raises(ChecksumMismatchException):
+            PackageManager(version_dir.path.parent).download(external_pkg._replace(sha256='0' * 64))
+
+        assert requests_mock.call_count == 1
+
+    def test_download_redownloads_cached_package_with_other_checksum(self, loaded_version_dir: _VersionDir, external_file: _PKGFile,
+                                                                     external_pkg: ExternalPackage, requests_mock: 'Mocker'):
+        metadata = loaded_version_dir.read_metadata()
+        metadata.download_sha256 = '0' * 64
+        loaded_version_dir.save_metadata(metadata)
+        requests_mock.get(TestPackageManager.PKG_URL, status_code=HTTPStatus.OK, additional_matcher=_without_etag_cache_matcher, body=external_file.ref)
+        digest = file_digest(external_file.local_path)
+
+        local_pkg = PackageManager(loaded_version_dir.path.parent, checksums={'pkg-name.tgz': digest}).download(external_pkg)
+
+        assert local_pkg.new_file is True
+        assert loaded_version_dir.read_metadata().download_sha256 == digest
+
+    def test_extract_removes_corrupted_archive(self, loaded_version_dir: _VersionDir):
+        metadata = loaded_version_dir.read_metadata()
+        metadata.download_sha256 = '0' * 64
+        loaded_version_dir.save_metadata(metadata)
+        local_pkg = LocalPackage(version=loaded_version_dir.version, path=loaded_version_dir.archive_path, new_file=True)
+
+        with pytest.raises(ChecksumMismatchException):
+            PackageManager(loaded_version_dir.path.parent).extract(local_pkg)
+
+        assert not loaded_version_dir.archive_path.exists()
+        assert (loaded_version_dir.extracted_dir / 'bin' / 'mongod').exists()
+        assert loaded_version_dir.read_metadata().download_etag is None
+
+    def test_download_reuses_package_published_while_waiting(self, loaded_version_dir: _VersionDir, external_pkg: ExternalPackage,
+                                                             requests_mock: 'Mocker', file_lock_holder: typing.Callable[[Path], 'subprocess.Popen[str]']):
+        holder = file_lock_holder(loaded_version_dir.lock_path)
+        assert holder.stdin is not None
+        threading.Timer(0.2, holder.stdin.close).start()
+
+        local_pkg = PackageManager(loaded_version_dir.path.parent).download(external_pkg)
+
+        assert local_pkg.new_file is False
+        assert requests_mock.call_count == 0
+
+    def test_extract_new_archive_removes_snapshots(self, loaded_version_dir: _VersionDir):
+        local_pkg = LocalPackage(version=loaded_version_dir.version, path=loaded_version_dir.archive_path, new_file=True)
+        golden = loaded_version_dir.snapshots_dir / 'default'
+        golden.mkdir(parents=True)
+
+        PackageManager(loaded_version_dir.path.parent).extract(local_pkg)
+
+        assert loaded_version_dir.snapshots_dir.exists() is False
+
+    def test_download_and_extract_without_archive(self, version_dir: _VersionDir, external_file: _PKGFile, external_pkg: ExternalPackage,
+                                                  requests_mock: 'Mocker'):
+        requests_mock.get(TestPackageManager.PKG_URL, status_code=HTTPStatus.OK, headers={'ETag': 'abcd'}, body=external_file.ref)
+
+        bin_dir = PackageManager(version_dir.path.parent).download_and_extract(external_pkg)
+
+        assert (bin_dir / 'mongod').exists()
+        assert bin_dir.parent == version_dir.extracted_dir
+        assert version_dir.archive_path.exists() is False
+        assert version_dir.read_metadata().download_etag == 'abcd'
+
+    def test_download_and_extract_keep_archive(self, version_dir: _VersionDir, external_file: _PKGFile, external_pkg: ExternalPackage,
+                                               requests_mock: 'Mocker'):
+        requests_mock.get(TestPackageManager.PKG_URL, status_code=HTTPStatus.OK, body=external_file.ref)
+
+        PackageManager(version_dir.path.parent).download_and_extract(external_pkg, keep_archive=True)
+
+        assert version_dir.archive_path.read_bytes() == external_file.local_path.read_bytes()
+
+    def test_download_and_extract_not_modified(self, loaded_version_dir: _VersionDir, external_pkg: ExternalPackage, requests_mock: 'Mocker'):
+        expected_etag = loaded_version_dir.read_metadata().download_etag
+        dummy_file = loaded_version_dir.extracted_dir / 'dummy'
+        dummy_file.touch()
+        requests_mock.get(TestPackageManager.PKG_URL, status_code=HTTPStatus.NOT_MODIFIED, request_headers={'if-none-match': expected_etag})
+
+        bin_dir = PackageManager(loaded_version_dir.path.parent).download_and_extract(external_pkg)
+
+        assert (bin_dir / 'mongod').exists()
+        assert dummy_file.exists()
+
+    def test_installed_after_extract(self, loaded_version_dir: _VersionDir):
+        local_pkg = LocalPackage(version=loaded_version_dir.version, path=loaded_version_dir.archive_path, new_file=False)
+        manager = PackageManager(loaded_version_dir.path.parent)
+        assert manager.installed(loaded_version_dir.version, Revalidate.NEVER) is None
+
+        bin_dir = manager.extract(local_pkg)
+
+        assert manager.installed(loaded_version_dir.version, Revalidate.NEVER) == bin_dir
+        assert manager.installed(loaded_version_dir.version, Revalidate.TTL) is None
+        assert manager.installed(loaded_version_dir.version, Revalidate.ALWAYS) is None
+
     def test_clean_removes_recurse_version_dir(self, loaded_version_dir: _VersionDir):
         PackageManager(loaded_version_dir.path.parent).clean(loaded_version_dir.version)
 
@@ -234,5 +431,92 @@ class TestPackageManager:
         assert loaded_version_dir.path.parent.exists()
 
 
+class TestPackageManagerComponents:
+    BINARIES = ('mongo', 'mongod', 'mongodump', 'mongorestore')
+
+    @pytest.fixture
+    def manager(self, tmp_path: Path, monkeypatch) -> typing.Generator[PackageManager, None, None]:
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(OSInfo, 'type', lambda: 'linux')
+            m.setattr(OSInfo, 'architecture', lambda: 'x86_64')
+
+            yield PackageManager(tmp_path / 'workspace')
+
+    @pytest.fixture
+    def local_pkg(self, tmp_path: Path) -> LocalPackage:
+        path = tmp_path / 'mongodb-linux-x86_64-4.0.5.tgz'
+        with tarfile.open(str(path), 'w:gz') as tar:
+            for name in ('README',) + tuple('bin/' + binary for binary in self.BINARIES):
+                content = name.encode()
+                info = tarfile.TarInfo('mongodb-linux-x86_64-4.0.5/' + name)
+                info.size = len(content)
+                info.mode = 0o755
+                tar.addfile(info, io.BytesIO(content))
+
+        return LocalPackage(version=Version.V4_0_5, path=path, new_file=True)
+
+    @staticmethod
+    def _installed(bin_dir: Path) -> typing.List[str]:
+        return sorted(path.name for path in bin_dir.iterdir())
+
+    def test_extract_only_components(self, manager: PackageManager, local_pkg: LocalPackage):
+        bin_dir = manager.extract(local_pkg, components={'mongod'})
+
+        assert self._installed(bin_dir) == ['mongod']
+        assert (bin_dir.parent / 'README').exists() is False
+        assert manager.installed(Version.V4_0_5, Revalidate.NEVER, components=['mongod']) == bin_dir
+        assert manager.installed(Version.V4_0_5, Revalidate.NEVER, components=['mongod', 'mongo']) is None
+        assert manager.installed(Version.V4_0_5, Revalidate.NEVER) is None
+
+    def test_extract_tops_up_components(self, manager: PackageManager, local_pkg: LocalPackage):
+        bin_dir = manager.extract(local_pkg, components={'mongod'})
+        mongod_inode = (bin_dir / 'mongod').stat().st_ino
+
+        manager.extract(local_pkg._replace(new_file=False), components={'mongod', 'mongorestore'})
+
+        assert self._installed(bin_dir) == ['mongod', 'mongorestore']
+        assert (bin_dir / 'mongod').stat().st_ino == mongod_inode
+        assert manager.installed(Version.V4_0_5, Revalidate.NEVER, components=['mongorestore']) == bin_dir
+
+        manager.extract(local_pkg._replace(new_file=False))
+
+        assert self._installed(bin_dir) == sorted(self.BINARIES)
+        assert (bin_dir.parent / 'README').exists()
+        assert manager.installed(Version.V4_0_5, Revalidate.NEVER, components=['mongo']) == bin_dir
+        assert [path.name for path in bin_dir.parent.parent.iterdir() if path.name.endswith('.partial')] == []
+
+    def test_new_archive_keeps_installed_components(self, manager: PackageManager, local_pkg: LocalPackage):
+        manager.extract(local_pkg, components={'mongod'})
+
+        bin_dir = manager.extract(local_pkg, components={'mongo'})
+
+        assert self._installed(bin_dir) == ['mongo', 'mongod']
+
+    def test_missing_component(self, manager: PackageManager, local_pkg: LocalPackage):
+        with pytest.raises(PackageManagerException):
+            manager.extract(local_pkg, components={'mongod', 'mongos'})
+
+        assert manager.installed(Version.V4_0_5, Revalidate.NEVER) is None
+
+    def test_invalid_component(self, manager: PackageManager, local_pkg: LocalPackage):
+        with pytest.raises(ValueError):
+            manager.extract(local_pkg, components={'../README'})
+
+    def test_download_and_extract_tops_up_components(self, manager: PackageManager, local_pkg: LocalPackage, requests_mock: 'Mocker'):
+        url = 'https://example_url.com/pkg/mongodb-linux-x86_64-4.0.5.tgz'
+        external_pkg = ExternalPackage(version=Version.V4_0_5, url=url, os_type='linux', filename=local_pkg.path.name)
+        requests_mock.get(url, status_code=HTTPStatus.OK, headers={'ETag': 'abcd'}, content=local_pkg.path.read_bytes())
+
+        bin_dir = manager.download_and_extract(external_pkg, components={'mongod'})
+        assert self._installed(bin_dir) == ['mongod']
+
+        manager.download_and_extract(external_pkg, components={'mongod'})
+        assert requests_mock.last_request.headers['If-None-Match'] == 'abcd'
+
+        manager.download_and_extract(external_pkg, components={'mongo'})
+        assert 'If-None-Match' not in requests_mock.last_request.headers
+        assert self._installed(bin_dir) == ['mongo', 'mongod']
+
+
 def _without_etag_cache_matcher(request: 'Request'):
     return 'etag' not in request.headers and 'if-none-match' not in request.headers
@@ -0,0 +1,124 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+import threading
+import typing
+
+import pytest
+
+from embedmongo.exceptions import MongodPoolException
+from embedmongo.pool import MongodPool
+from embedmongo.process import MongodProcess
+
+
+class TestMongodPool:
+    @pytest.fixture
+    def resets(self) -> typing.List[MongodProcess]:
+        return []
+
+    @pytest.fixture
+    def pool(self, fake_bin_dir: Path, resets: typing.List[MongodProcess]) -> typing.Generator[MongodPool, None, None]:
+        with MongodPool(fake_bin_dir, size=2, max_size=3, reset=resets.append) as pool:
+            yield pool
+
+    def test_start_warms_instances(self, pool: MongodPool):
+        assert pool.size == 2
+
+    def test_acquire_reuses_released_instance(self, pool: MongodPool, resets: typing.List[MongodProcess]):
+        process = pool.acquire()
+        pid = process.pid
+        pool.release(process)
+
+        with pool.lease() as process:
+            assert process.pid == pid
+
+        assert resets[0].pid == pid
+        assert pool.size == 2
+        assert pool.stats.leases == 2
+        assert pool.stats.hits == 2
+        assert pool.stats.hit_rate == 1.0
+
+    def test_acquire_grows_to_max_size(self, pool: MongodPool):
+        processes = [pool.acquire() for _ in range(3)]
+
+        assert len({process.port for process in processes}) == 3
+        assert pool.stats.misses == 1
+        with pytest.raises(MongodPoolException):
+            pool.acquire(timeout=0.05)
+
+        for process in processes:
+            pool.release(process)
+
+    def test_acquire_waits_for_release(self, pool: MongodPool):
+        processes = [pool.acquire() for _ in range(3)]
+        timer = threading.Timer(0.1, pool.release, args=(processes[0],))
+        timer.start()
+
+        process = pool.acquire(timeout=5)
+
+        assert process is processes[0]
+        assert pool.stats.max_lease_time >= 0.1
+        for process in processes:
+            pool.release(process)
+
+    def test_release_twice(self, pool: MongodPool, resets: typing.List[MongodProcess]):
+        process = pool.acquire()
+        pool.release(process)
+
+        with pytest.raises(MongodPoolException):
+            pool.release(process)
+
+        assert len(resets) == 1
+        assert pool.size == 2
+        first, second = pool.acquire(), pool.acquire()
+        assert first is not second
+        pool.release(first)
+        pool.release(second)
+
+    def test_release_not_leased(self, pool: MongodPool, fake_bin_dir: Path):
+        with MongodPool(fake_bin_dir, size=1) as other_pool, other_pool.lease() as process:
+            with pytest.raises(MongodPoolException):
+                pool.release(process)
+
+        assert pool.size == 2
+
+    def test_release_replaces_instance_when_reset_fails(self, fake_bin_dir: Path):
+        def failing_reset(process: MongodProcess) -> None:
+            raise RuntimeError("reset failed")
+
+        with MongodPool(fake_bin_dir, size=1, reset=failing_reset) as pool:
+            process = pool.acquire()
+            pool.release(process)
+
+            assert process.is_running() is False
+            assert pool.size == 0
+
+            with pool.lease() as new_process:
+                assert new_process.is_running()
+
+    def test_close_stops_instances(self, fake_bin_dir: Path):
+        pool = MongodPool(fake_bin_dir, size=2, reset=lambda process: None).start()
+        leased = pool.acquire()
+        idle = pool.acquire()
+        pool.release(idle)
+
+        pool.close()
+
+        assert idle.is_running() is False
+        assert leased.is_running()
+        pool.release(leased)
+        assert leased.is_running() is False
+        with pytest.raises(MongodPoolException):
+            pool.acquire()
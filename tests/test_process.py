@@ -0,0 +1,71 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+import re
+import socket
+
+import pytest
+
+from embedmongo.exceptions import MongodStartException
+from embedmongo.process import free_port, MongodLauncher
+
+
+class TestMongodLauncher:
+    def test_start_and_stop(self, fake_bin_dir: Path):
+        process = MongodLauncher(fake_bin_dir).start()
+
+        assert process.is_running()
+        assert process.startup_time is not None
+        with socket.create_connection((process.host, process.port)):
+            pass
+
+        process.stop()
+
+        assert process.is_running() is False
+        assert process.dbpath.exists() is False
+
+    def test_start_on_given_port_and_dbpath(self, fake_bin_dir: Path, tmp_path: Path):
+        port = free_port()
+        dbpath = tmp_path / 'db'
+
+        with MongodLauncher(fake_bin_dir).start(port=port, dbpath=dbpath) as process:
+            assert process.port == port
+            assert process.uri == 'mongodb://127.0.0.1:{port}'.format(port=port)
+            assert process.wait_for_output(re.compile(re.escape(str(dbpath))), timeout=1)
+
+        assert dbpath.exists()
+
+    @pytest.mark.parametrize('inline', [False, True])
+    def test_start_with_logpath_probes_port(self, fake_bin_dir: Path, tmp_path: Path, inline: bool):
+        logpath = tmp_path / 'mongod.log'
+        logpath_args = ['--logpath={}'.format(logpath)] if inline else ['--logpath', str(logpath)]
+
+        with MongodLauncher(fake_bin_dir).start(args=logpath_args + ['--fakeStartDelay', '0.2']) as process:
+            assert process.startup_time >= 0.2
+
+        assert 'waiting for connections' in logpath.read_text()
+
+    def test_start_process_exited(self, fake_bin_dir: Path):
+        with pytest.raises(MongodStartException) as excinfo:
+            MongodLauncher(fake_bin_dir).start(args=['--fakeExit'])
+
+        assert 'exited with code 100' in str(excinfo.value)
+        assert 'exception in initAndListen' in str(excinfo.value)
+
+    def test_start_timeout(self, fake_bin_dir: Path):
+        with pytest.raises(MongodStartException) as excinfo:
+            MongodLauncher(fake_bin_dir).start(args=['--fakeStartDelay', '5'], timeout=0.2)
+
+        assert 'not ready in 0.2s' in str(excinfo.value)
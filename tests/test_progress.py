@@ -0,0 +1,119 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http import HTTPStatus
+import io
+import logging
+from pathlib import Path
+import subprocess
+import sys
+import typing
+
+import pytest
+
+from embedmongo.events import DownloadFailed, DownloadProgress, DownloadStarted, hooks
+from embedmongo.progress import LoggingReporter, ProgressReporter, set_progress_reporter, TqdmReporter
+from embedmongo.utils import download_file
+
+if typing.TYPE_CHECKING:
+    from _pytest.logging import LogCaptureFixture  # noqa: F401
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
+    from requests_mock import Mocker
+
+
+@pytest.fixture
+def reporter() -> typing.Generator[typing.Callable[[typing.Any], None], None, None]:
+    yield set_progress_reporter
+    set_progress_reporter(LoggingReporter())
+
+
+class RecordingReporter(ProgressReporter):
+    def __init__(self) -> None:
+        self.calls = []  # type: typing.List[typing.Tuple[str, typing.Any]]
+
+    def started(self, event: typing.Any) -> None:
+        self.calls.append(('started', event.total))
+
+    def progress(self, event: typing.Any) -> None:
+        self.calls.append(('progress', event.received))
+
+    def finished(self, event: typing.Any) -> None:
+        self.calls.append(('finished', event.size))
+
+    def failed(self, event: typing.Any) -> None:
+        self.calls.append(('failed', event.received))
+
+
+def _download(tmp_path: Path, requests_mock: 'Mocker', monkeypatch, status_code: HTTPStatus = HTTPStatus.OK) -> None:
+    url = 'https://example_url.com/file.tgz'
+    requests_mock.get(url, content=b'x' * 4096, headers={'Content-Length': '4096'}, status_code=status_code)
+
+    with monkeypatch.context() as m:  # type: MonkeyPatch
+        m.setattr('embedmongo.utils._CHUNK_SIZE', 1024)
+        m.setattr(hooks, 'progress_interval', 0.0)
+        download_file(url, tmp_path / 'file.tgz', etag='abcd')
+
+
+class TestReporters:
+    def test_callbacks(self, tmp_path: Path, requests_mock: 'Mocker', monkeypatch, reporter: typing.Callable[[typing.Any], None]):
+        recording = RecordingReporter()
+        reporter(recording)
+
+        _download(tmp_path, requests_mock, monkeypatch)
+
+        assert recording.calls == [('started', 4096), ('progress', 1024), ('progress', 2048), ('progress', 3072), ('progress', 4096), ('finished', 4096)]
+
+    def test_not_modified_isnt_reported(self, tmp_path: Path, requests_mock: 'Mocker', monkeypatch, reporter: typing.Callable[[typing.Any], None]):
+        recording = RecordingReporter()
+        reporter(recording)
+
+        _download(tmp_path, requests_mock, monkeypatch, status_code=HTTPStatus.NOT_MODIFIED)
+
+        assert recording.calls == []
+
+    def test_disabled(self, tmp_path: Path, requests_mock: 'Mocker', monkeypatch, reporter: typing.Callable[[typing.Any], None]):
+        reporter(None)
+
+        _download(tmp_path, requests_mock, monkeypatch)
+
+        assert not hooks.active
+
+    def test_logging_reporter(self, tmp_path: Path, requests_mock: 'Mocker', monkeypatch, caplog: 'LogCaptureFixture',
+                              reporter: typing.Callable[[typing.Any], None]):
+        reporter(LoggingReporter())
+
+        with caplog.at_level(logging.INFO, logger='embedmongo.progress'):
+            _download(tmp_path, requests_mock, monkeypatch)
+
+        messages = [record.getMessage() for record in caplog.records if record.name == 'embedmongo.progress']
+        assert len(messages) == 5
+        assert messages[0].startswith('file.tgz:  25% | 1.0kB/4.1kB [')
+        assert messages[-1].startswith('file.tgz: 4.1kB downloaded in ')
+
+    def test_tqdm_reporter(self):
+        pytest.importorskip('tqdm')
+        output = io.StringIO()
+        tqdm_reporter = TqdmReporter(file=output)
+
+        tqdm_reporter(DownloadStarted(url='url', filename='file.tgz', total=2000, resumed_from=0))
+        tqdm_reporter(DownloadProgress(url='url', filename='file.tgz', received=1000, total=2000, rate=1000.0))
+        tqdm_reporter(DownloadFailed(url='url', filename='file.tgz', received=1000, error='connection reset'))
+
+        assert 'file.tgz' in output.getvalue()
+        assert '50%' in output.getvalue()
+
+    def test_tqdm_isnt_imported_with_package(self):
+        code = 'import sys, embedmongo; print("tqdm" in sys.modules)'
+
+        assert subprocess.check_output([sys.executable, '-c', code], cwd=str(Path(__file__).parent.parent)).strip() == b'False'
@@ -0,0 +1,212 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from pathlib import Path
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import threading
+import typing
+
+import pytest
+
+from embedmongo.blobstore import clone_tree
+from embedmongo.exceptions import InstanceRegistryException, MongodStartException
+from embedmongo.process import MongodLauncher
+from embedmongo.registry import _process_start, _terminate, InstanceRegistry
+
+if typing.TYPE_CHECKING:
+    from _pytest.logging import LogCaptureFixture
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
+
+_ORPHAN_OWNER = textwrap.dedent("""
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    from embedmongo.registry import InstanceRegistry
+
+    registry = InstanceRegistry(Path(sys.argv[1]))
+    port = registry.allocate()
+    child = subprocess.Popen(['sleep', '60'], stdout=subprocess.DEVNULL)
+    registry.register(port, child.pid, Path(sys.argv[2]))
+    print(child.pid)
+""")
+
+
+class TestInstanceRegistry:
+    def test_allocate_distinct_ports_in_range(self, tmp_path: Path):
+        registry = InstanceRegistry(tmp_path, port_range=(30000, 30010))
+
+        ports = [registry.allocate() for _ in range(10)]
+
+        assert sorted(ports) == list(range(30000, 30010))
+        assert [instance.owner for instance in registry.instances()] == [os.getpid()] * 10
+        with pytest.raises(InstanceRegistryException):
+            registry.allocate()
+
+    def test_allocate_skips_bound_port(self, tmp_path: Path):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            taken = sock.getsockname()[1]
+            registry = InstanceRegistry(tmp_path, port_range=(taken, taken + 2))
+
+            assert registry.allocate() == taken + 1
+
+    def test_registries_share_directory(self, tmp_path: Path):
+        first = InstanceRegistry(tmp_path, port_range=(30000, 30002))
+        second = InstanceRegistry(tmp_path, port_range=(30000, 30002))
+
+        assert {first.allocate(), second.allocate()} == {30000, 30001}
+
+    def test_register_and_release(self, tmp_path: Path):
+        registry = InstanceRegistry(tmp_path)
+        port = registry.allocate()
+
+        registry.register(port, os.getpid(), tmp_path / 'db')
+
+        instance, = registry.instances()
+        assert (instance.port, instance.pid, instance.dbpath) == (port, os.getpid(), tmp_path / 'db')
+
+        registry.release(port)
+
+        assert registry.instances() == []
+
+    def test_register_not_leased_port(self, tmp_path: Path):
+        with pytest.raises(InstanceRegistryException):
+            InstanceRegistry(tmp_path).register(30000, os.getpid())
+
+    def test_expired_lease_dropped(self, tmp_path: Path):
+        registry = InstanceRegistry(tmp_path, port_range=(30000, 30001), lease_ttl=0)
+
+        registry.allocate()
+
+        assert registry.allocate() == 30000
+        assert len(registry.instances()) == 1
+
+    def test_corrupted_state_reset(self, tmp_path: Path):
+        (tmp_path / 'instances.json').write_text('{')
+
+        assert InstanceRegistry(tmp_path).instances() == []
+
+    def test_reap_orphaned_instance(self, tmp_path: Path):
+        dbpath = tmp_path / 'db'
+        dbpath.mkdir()
+        env = dict(os.environ, PYTHONPATH=str(Path(__file__).parents[1]))
+        output = subprocess.check_output([sys.executable, '-c', _ORPHAN_OWNER, str(tmp_path / 'registry'), str(dbpath)], env=env,
+                                         universal_newlines=True)
+        pid = int(output)
+        registry = InstanceRegistry(tmp_path / 'registry')
+
+        assert _process_start(pid) is not None
+
+        reaped, = registry.reap()
+
+        assert reaped.pid == pid
+        assert _process_start(pid) is None
+        assert dbpath.exists() is False
+        assert registry.instances() == []
+
+    def test_reap_stops_orphans_without_lock(self, tmp_path: Path, monkeypatch):
+        env = dict(os.environ, PYTHONPATH=str(Path(__file__).parents[1]))
+        subprocess.check_output([sys.executable, '-c', _ORPHAN_OWNER, str(tmp_path), str(tmp_path / 'db')], env=env)
+        registry = InstanceRegistry(tmp_path)
+        read_during_termination = []
+
+        def terminate(pid, start):
+            # other thread would wait for registry lock if it was held during termination
+            reader = threading.Thread(target=registry.instances, daemon=True)
+            reader.start()
+            reader.join(timeout=2)
+            read_during_termination.append(not reader.is_alive())
+            os.kill(pid, signal.SIGKILL)
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr('embedmongo.registry._terminate', terminate)
+            registry.reap()
+
+        assert read_during_termination == [True]
+
+    def test_terminate_warns_before_kill(self, caplog: 'LogCaptureFixture', monkeypatch):
+        child = subprocess.Popen(['sh', '-c', 'trap "" TERM; echo ready; exec sleep 60'], stdout=subprocess.PIPE, universal_newlines=True)
+        assert child.stdout is not None and child.stdout.readline().strip() == 'ready'
+        signals = []
+        kill = os.kill
+
+        def recording_kill(pid, sig):
+            signals.append((sig, [record.getMessage() for record in caplog.records]))
+            kill(pid, sig)
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(os, 'kill', recording_kill)
+            _terminate(child.pid, _process_start(child.pid), timeout=0.5)
+        child.communicate()
+
+        (term, before_term), (kill_sig, before_kill) = signals
+        assert (term, kill_sig) == (signal.SIGTERM, signal.SIGKILL)
+        assert before_term == []
+        assert "didn't stop in 0.5s. Killing it." in before_kill[-1]
+
+    def test_launcher_uses_registry(self, fake_bin_dir: Path, tmp_path: Path):
+        registry = InstanceRegistry(tmp_path / 'registry')
+
+        with MongodLauncher(fake_bin_dir, registry).start() as process:
+            instance, = registry.instances()
+            assert (instance.port, instance.pid, instance.dbpath) == (process.port, process.pid, process.dbpath)
+
+        assert registry.instances() == []
+
+    def test_launcher_leases_port_after_snapshot_copy(self, fake_bin_dir: Path, tmp_path: Path, monkeypatch):
+        registry = InstanceRegistry(tmp_path / 'registry', lease_ttl=0)
+        snapshot = tmp_path / 'snapshot'
+        snapshot.mkdir()
+        (snapshot / 'data').write_text('data')
+
+        def slow_clone(src: Path, dst: Path) -> None:
+            # other process drops leases which weren't registered within lease_ttl
+            InstanceRegistry(tmp_path / 'registry', lease_ttl=0).reap()
+            clone_tree(src, dst)
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr('embedmongo.process.clone_tree', slow_clone)
+            with MongodLauncher(fake_bin_dir, registry).start(snapshot=snapshot) as process:
+                assert [instance.pid for instance in registry.instances()] == [process.pid]
+
+    def test_launcher_stops_process_when_register_fails(self, fake_bin_dir: Path, tmp_path: Path, monkeypatch):
+        registry = InstanceRegistry(tmp_path / 'registry')
+        pids = []
+
+        def register(self, port, pid, dbpath=None):
+            pids.append(pid)
+            raise InstanceRegistryException("Port {port} isn't leased by this process".format(port=port))
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(InstanceRegistry, 'register', register)
+            with pytest.raises(InstanceRegistryException):
+                MongodLauncher(fake_bin_dir, registry).start()
+
+        pid, = pids
+        assert _process_start(pid) is None
+        assert registry.instances() == []
+
+    def test_launcher_releases_port_on_failure(self, fake_bin_dir: Path, tmp_path: Path):
+        registry = InstanceRegistry(tmp_path / 'registry')
+
+        with pytest.raises(MongodStartException):
+            MongodLauncher(fake_bin_dir, registry).start(args=['--fakeExit'])
+
+        assert registry.instances() == []
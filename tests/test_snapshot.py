@@ -0,0 +1,92 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+import threading
+import typing  # noqa: F401
+
+import pytest
+
+from embedmongo.blobstore import clone_tree
+from embedmongo.exceptions import MongodStartException
+from embedmongo.process import MongodLauncher, MongodProcess
+from embedmongo.snapshot import DataSnapshots
+
+
+class TestDataSnapshots:
+    @pytest.fixture
+    def snapshots(self, fake_bin_dir: Path, tmp_path: Path) -> DataSnapshots:
+        return DataSnapshots(tmp_path / 'snapshots', MongodLauncher(fake_bin_dir))
+
+    def test_golden_is_initialized_once(self, snapshots: DataSnapshots):
+        seeded = []  # type: typing.List[MongodProcess]
+
+        golden = snapshots.golden(seed=seeded.append)
+        assert snapshots.golden(seed=seeded.append) == golden
+
+        assert golden == snapshots.root / 'default'
+        assert len(seeded) == 1
+        assert len((golden / 'starts.log').read_text().splitlines()) == 1
+        assert [path.name for path in snapshots.root.iterdir()] == ['default']
+
+    def test_start_from_clone_keeps_golden_untouched(self, snapshots: DataSnapshots, fake_bin_dir: Path):
+        def seed(process: MongodProcess) -> None:
+            (process.dbpath / 'fixture.json').write_text('{}')
+
+        golden = snapshots.golden('fixture', seed=seed)
+
+        with MongodLauncher(fake_bin_dir).start(snapshot=golden) as process:
+            assert (process.dbpath / 'fixture.json').read_text() == '{}'
+            assert len((process.dbpath / 'starts.log').read_text().splitlines()) == 2
+
+        assert process.dbpath.exists() is False
+        assert len((golden / 'starts.log').read_text().splitlines()) == 1
+
+    def test_failed_initialization_leaves_nothing(self, snapshots: DataSnapshots):
+        with pytest.raises(MongodStartException):
+            snapshots.golden(args=['--fakeExit'])
+
+        assert list(snapshots.root.iterdir()) == []
+
+    def test_concurrent_initialization(self, snapshots: DataSnapshots):
+        results = []  # type: typing.List[Path]
+        threads = [threading.Thread(target=lambda: results.append(snapshots.golden())) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(set(results)) == 1
+        assert [path.name for path in snapshots.root.iterdir()] == ['default']
+
+    def test_invalid_name(self, snapshots: DataSnapshots):
+        with pytest.raises(ValueError):
+            snapshots.path('../other')
+
+
+def test_clone_tree(tmp_path: Path):
+    src = tmp_path / 'src'
+    (src / 'journal').mkdir(parents=True)
+    (src / 'journal' / 'WiredTigerLog.0000000001').write_bytes(b'log')
+    (src / 'WiredTiger').write_text('WiredTiger')
+    (src / 'WiredTiger').chmod(0o600)
+    dst = tmp_path / 'dst'
+    dst.mkdir()
+
+    clone_tree(src, dst)
+    (dst / 'WiredTiger').write_text('modified')
+
+    assert (dst / 'journal' / 'WiredTigerLog.0000000001').read_bytes() == b'log'
+    assert (dst / 'WiredTiger').stat().st_mode & 0o777 == 0o600
+    assert (src / 'WiredTiger').read_text() == 'WiredTiger'
@@ -0,0 +1,89 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+import re
+
+import pytest
+
+from embedmongo.exceptions import MongodStartException
+from embedmongo.process import MongodLauncher
+from embedmongo.storage import binary_info, BinaryInfo, parse_version_output, ram_args, ram_dir
+
+NO_FTDC = ['--setParameter', 'diagnosticDataCollectionEnabled=false']
+
+
+class TestParseVersionOutput:
+    def test_community(self):
+        output = 'db version v3.6.9\ngit version: 167861a164723168adfaaa866f310cb94010428f\nallocator: tcmalloc\nmodules: none\n'
+
+        assert parse_version_output(output) == BinaryInfo(version=(3, 6, 9), enterprise=False)
+
+    def test_enterprise(self):
+        assert parse_version_output('db version v4.0.5\nmodules: enterprise\n') == BinaryInfo(version=(4, 0, 5), enterprise=True)
+
+    def test_enterprise_build_info(self):
+        output = 'db version v4.4.1\nBuild Info: {\n    "version": "4.4.1",\n    "modules": [\n        "enterprise"\n    ],\n}\n'
+
+        assert parse_version_output(output).enterprise is True
+
+    def test_unknown(self):
+        with pytest.raises(MongodStartException):
+            parse_version_output('MongoDB shell version v4.0.5')
+
+
+class TestRamArgs:
+    @pytest.mark.parametrize('version, expected', [
+        ((3, 0, 15), ['--nojournal', '--smallfiles']),
+        ((3, 2, 21), ['--wiredTigerCacheSizeGB', '1', '--nojournal'] + NO_FTDC),
+        ((3, 6, 9), ['--wiredTigerCacheSizeGB', '0.25', '--nojournal'] + NO_FTDC),
+        ((4, 0, 5), ['--wiredTigerCacheSizeGB', '0.25', '--nojournal'] + NO_FTDC),
+        ((6, 2, 0), ['--wiredTigerCacheSizeGB', '0.25'] + NO_FTDC),
+    ])
+    def test_community(self, version, expected):
+        assert ram_args(BinaryInfo(version=version, enterprise=False)) == expected
+
+    def test_replica_set_member_keeps_journal(self):
+        assert ram_args(BinaryInfo(version=(3, 6, 9), enterprise=False), ['--replSet', 'rs0'])[2:3] == ['--nojournal']
+        assert '--nojournal' not in ram_args(BinaryInfo(version=(4, 0, 5), enterprise=False), ['--replSet', 'rs0'])
+        assert '--nojournal' not in ram_args(BinaryInfo(version=(4, 0, 5), enterprise=False), ['--configsvr'])
+
+    def test_enterprise_in_memory(self):
+        info = BinaryInfo(version=(4, 0, 5), enterprise=True)
+
+        assert ram_args(info) == ['--storageEngine', 'inMemory', '--inMemorySizeGB', '1'] + NO_FTDC
+        assert ram_args(info, in_memory=False) == ['--wiredTigerCacheSizeGB', '0.25', '--nojournal'] + NO_FTDC
+        assert ram_args(BinaryInfo(version=(3, 2, 5), enterprise=True))[:2] == ['--wiredTigerCacheSizeGB', '1']
+
+    def test_user_args_not_overridden(self):
+        info = BinaryInfo(version=(4, 0, 5), enterprise=True)
+
+        assert ram_args(info, ['--storageEngine', 'wiredTiger', '--wiredTigerCacheSizeGB=2']) == ['--nojournal'] + NO_FTDC
+        assert ram_args(info, ['--storageEngine=inMemory', '--setParameter', 'diagnosticDataCollectionEnabled=true']) == ['--inMemorySizeGB', '1']
+
+
+class TestRamLauncher:
+    def test_binary_info(self, fake_bin_dir: Path):
+        assert binary_info(fake_bin_dir / 'mongod') == BinaryInfo(version=(4, 0, 5), enterprise=False)
+
+    def test_start(self, fake_bin_dir: Path):
+        with MongodLauncher(fake_bin_dir, ram=True).start(args=['--wiredTigerCacheSizeGB', '0.5']) as process:
+            assert process.dbpath.parent == ram_dir()
+            assert process.wait_for_output(re.compile(r'options: .* --wiredTigerCacheSizeGB 0\.5 --nojournal --setParameter'), timeout=1)
+
+        assert process.dbpath.exists() is False
+
+    def test_start_on_given_dbpath(self, fake_bin_dir: Path, tmp_path: Path):
+        with MongodLauncher(fake_bin_dir, ram=True).start(dbpath=tmp_path / 'db') as process:
+            assert process.dbpath == tmp_path / 'db'
@@ -12,12 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from pathlib import Path
 import typing
 
 import pytest
 
 from embedmongo.exceptions import InvalidOSException
-from embedmongo.system import OSInfo, WorkingOSGuard
+from embedmongo.system import Distro, distro_targets, OSInfo, parse_os_release, WorkingOSGuard
 
 if typing.TYPE_CHECKING:
     from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
@@ -36,6 +37,57 @@ class TestOSInfo:
 
             assert OSInfo.type() == 'osx'
 
+    @pytest.mark.parametrize('machine,expected', [('x86_64', 'x86_64'), ('AMD64', 'x86_64'), ('aarch64', 'aarch64'), ('arm64', 'aarch64')])
+    def test_architecture_is_normalized(self, machine: str, expected: str, monkeypatch):
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr('platform.machine', lambda: machine)
+
+            assert OSInfo.architecture() == expected
+
+    def test_distro_from_os_release(self, tmp_path: Path, monkeypatch):
+        os_release = tmp_path / 'os-release'
+        os_release.write_text('NAME="Rocky Linux"\nID="rocky"\nID_LIKE="rhel centos fedora"\nVERSION_ID="8.4"\n')
+
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr('embedmongo.system._OS_RELEASE_PATHS', (tmp_path / 'missing', os_release))
+            OSInfo.distro.cache_clear()
+            try:
+                distro = OSInfo.distro()
+                os_release.write_text('ID=ubuntu\n')
+
+                # read once per process
+                assert OSInfo.distro() is distro
+            finally:
+                OSInfo.distro.cache_clear()
+
+        assert distro == Distro(id='rocky', version_id='8.4', id_like=('rhel', 'centos', 'fedora'))
+
+    def test_targets_on_osx(self, monkeypatch):
+        with monkeypatch.context() as m:  # type: MonkeyPatch
+            m.setattr(OSInfo, 'type', lambda: 'osx')
+
+            assert OSInfo.targets() == []
+
+
+def test_parse_os_release():
+    content = '# comment\nID=debian\nVERSION_ID="10"\nPRETTY_NAME=\'Debian GNU/Linux 10 (buster)\'\n\n'
+
+    assert parse_os_release(content) == {'ID': 'debian', 'VERSION_ID': '10', 'PRETTY_NAME': 'Debian GNU/Linux 10 (buster)'}
+
+
+@pytest.mark.parametrize('distro,expected', [
+    (Distro(id='ubuntu', version_id='20.04', id_like=('debian',)), ['ubuntu2004']),
+    (Distro(id='debian', version_id='11', id_like=()), ['debian11']),
+    (Distro(id='rhel', version_id='8.2', id_like=('fedora',)), ['rhel82', 'rhel81', 'rhel80']),
+    (Distro(id='centos', version_id='7', id_like=('rhel', 'fedora')), ['rhel70']),
+    (Distro(id='amzn', version_id='2', id_like=('centos', 'rhel', 'fedora')), ['amazon2']),
+    (Distro(id='amzn', version_id='2018.03', id_like=('rhel', 'fedora')), ['amazon']),
+    (Distro(id='sles', version_id='15.1', id_like=('suse',)), ['suse15']),
+    (Distro(id='arch', version_id='', id_like=()), []),
+])
+def test_distro_targets(distro: Distro, expected: typing.List[str]):
+    assert distro_targets(distro) == expected
+
 
 class TestWorkingOSGuard:
     @pytest.mark.parametrize("os_type", ['linux', 'osx'])
@@ -50,9 +102,10 @@ class TestWorkingOSGuard:
 
             WorkingOSGuard.ensure_valid_type()
 
-    def test_ensure_valid_architecture_with_supported_arch(self, monkeypatch):
+    @pytest.mark.parametrize("arch", ['x86_64', 'aarch64'])
+    def test_ensure_valid_architecture_with_supported_arch(self, arch: str, monkeypatch):
         with monkeypatch.context() as m:  # type: MonkeyPatch
-            m.setattr(OSInfo, 'architecture', lambda: 'x86_64')
+            m.setattr(OSInfo, 'architecture', lambda: arch)
 
             WorkingOSGuard.ensure_valid_architecture()
 
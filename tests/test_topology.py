@@ -0,0 +1,71 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+import re
+
+import pytest
+
+from embedmongo.exceptions import TopologyException
+from embedmongo.topology import ReplicaSet, ShardedCluster
+from embedmongo.wire import WireClient
+
+
+class TestReplicaSet:
+    def test_start_and_stop(self, fake_bin_dir: Path):
+        with ReplicaSet(fake_bin_dir, members=3, name='rs-test') as replica_set:
+            members = replica_set.members
+
+            assert replica_set.primary is members[0]
+            assert [member.role for member in replica_set.startup] == ['PRIMARY', 'SECONDARY', 'SECONDARY']
+            assert all(member.total_time >= member.process_time > 0 for member in replica_set.startup)
+            assert replica_set.uri == 'mongodb://{hosts}/?replicaSet=rs-test'.format(hosts=','.join(member.address for member in members))
+            with WireClient(members[1].host, members[1].port) as client:
+                assert client.command('admin', 'isMaster')['setName'] == 'rs-test'
+
+        assert replica_set.members == []
+        assert not any(member.is_running() for member in members)
+
+    def test_state_change_is_detected_from_output(self, fake_bin_dir: Path):
+        with ReplicaSet(fake_bin_dir, members=1, args=['--fakeElectionDelay', '0.2']) as replica_set:
+            member = replica_set.members[0]
+
+            assert any(re.search('transition to PRIMARY', line) for line in member.output)
+            # probe interval is 0.5s, transition after 0.2s is noticed without waiting for it
+            assert replica_set.startup[0].total_time < 0.2 + 0.4 + member.startup_time
+
+    def test_member_start_failure_stops_other_members(self, fake_bin_dir: Path):
+        with pytest.raises(TopologyException):
+            ReplicaSet(fake_bin_dir, members=2, args=['--fakeExit']).start()
+
+    def test_invalid_members_count(self, fake_bin_dir: Path):
+        with pytest.raises(ValueError):
+            ReplicaSet(fake_bin_dir, members=0)
+
+
+class TestShardedCluster:
+    def test_start_and_stop(self, fake_bin_dir: Path):
+        with ShardedCluster(fake_bin_dir, shards=2, routers=1) as cluster:
+            router = cluster.routers[0]
+            members = cluster.config_servers.members + [member for shard in cluster.shards for member in shard.members]
+
+            assert cluster.uri == 'mongodb://' + router.address
+            # output is read in background, last line may be not there yet
+            assert router.wait_for_output(re.compile(re.escape('addShard ' + cluster.shards[-1].connection_string)), 5.0)
+            added_shards = [line for line in router.output if line.startswith('addShard')]
+            assert added_shards == ['addShard ' + shard.connection_string for shard in cluster.shards]
+            assert sorted(member.role for member in cluster.startup) == ['CONFIG_PRIMARY', 'MONGOS', 'SHARD_PRIMARY', 'SHARD_PRIMARY']
+
+        assert not router.is_running()
+        assert not any(member.is_running() for member in members)
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 from http import HTTPStatus
 import io
 from pathlib import Path
@@ -19,13 +20,16 @@ import typing
 
 import pytest
 
-from embedmongo.exceptions import DownloadFileException
-from embedmongo.utils import download_file, extract_file
+from embedmongo.exceptions import ChecksumMismatchException, DownloadFileException, IncompleteDownloadException
+from embedmongo.utils import download_and_extract, download_file, extract_file, fetch_checksum, parse_checksums
 
 if typing.TYPE_CHECKING:
     from _pytest._code import ExceptionInfo  # noqa: F401
+    from _pytest.monkeypatch import MonkeyPatch  # noqa: F401
     from requests_mock import Mocker
 
+    from .http_server import RangeHTTPServer
+
 tar_file = Path(__file__).parent / 'res' / 'example.tgz'
 
 
@@ -85,6 +89,145 @@ def test_download_file_fail(tmp_path: Path, requests_mock: 'Mocker'):
     ) in str(excinfo.value)
 
 
+def test_download_interrupted_keeps_part_file(tmp_path: Path, http_server: 'RangeHTTPServer'):
+    content = bytes(range(256)) * 4096 * 3
+    url = http_server.add('/file', content, etag='abcd', fail_after=len(content) // 2)
+    dst_file = tmp_path / 'file'
+
+    with pytest.raises(IncompleteDownloadException) as excinfo:  # type: ExceptionInfo
+        download_file(url, dst_file)
+
+    part_content = (tmp_path / 'file.part').read_bytes()
+    assert excinfo.value.etag == 'abcd'
+    assert dst_file.exists() is False
+    assert part_content
+    assert content.startswith(part_content)
+
+
+def test_download_resumes_part_file(tmp_path: Path, http_server: 'RangeHTTPServer'):
+    content = bytes(range(256)) * 64
+    url = http_server.add('/file', content, etag='abcd')
+    dst_file = tmp_path / 'file'
+    (tmp_path / 'file.part').write_bytes(content[:1000])
+
+    result = download_file(url, dst_file, part_etag='abcd')
+
+    assert result.saved is True
+    assert dst_file.read_bytes() == content
+    assert (tmp_path / 'file.part').exists() is False
+    _, headers = http_server.requests[-1]
+    assert headers['Range'] == 'bytes=1000-'
+    assert headers['If-Range'] == 'abcd'
+
+
+def test_download_restarts_part_file_of_other_version(tmp_path: Path, http_server: 'RangeHTTPServer'):
+    content = bytes(range(256)) * 64
+    url = http_server.add('/file', content, etag='new')
+    dst_file = tmp_path / 'file'
+    (tmp_path / 'file.part').write_bytes(b'x' * 1000)
+
+    download_file(url, dst_file, part_etag='old')
+
+    assert dst_file.read_bytes() == content
+
+
+def test_download_segments(tmp_path: Path, http_server: 'RangeHTTPServer', monkeypatch):
+    content = bytes(range(256)) * 64
+    url = http_server.add('/file', content, etag='abcd')
+    dst_file = tmp_path / 'file'
+
+    with monkeypatch.context() as m:  # type: MonkeyPatch
+        m.setattr('embedmongo.utils._MIN_SEGMENT_SIZE', 1024)
+        download_file(url, dst_file, segments=4)
+
+    assert dst_file.read_bytes() == content
+    assert list(tmp_path.iterdir()) == [dst_file]
+    ranges = sorted(headers['Range'] for _, headers in http_server.requests if 'Range' in headers)
+    assert ranges == ['bytes=0-4095', 'bytes=12288-16383', 'bytes=4096-8191', 'bytes=8192-12287']
+
+
+def test_download_segments_resume(tmp_path: Path, http_server: 'RangeHTTPServer', monkeypatch):
+    content = bytes(range(256)) * 64
+    url = http_server.add('/file', content, etag='abcd')
+    dst_file = tmp_path / 'file'
+    (tmp_path / 'file.part.1').write_bytes(content[4096:5096])
+
+    with monkeypatch.context() as m:  # type: MonkeyPatch
+        m.setattr('embedmongo.utils._MIN_SEGMENT_SIZE', 1024)
+        download_file(url, dst_file, part_etag='abcd', segments=4)
+
+    assert dst_file.read_bytes() == content
+    ranges = [headers['Range'] for _, headers in http_server.requests if 'Range' in headers]
+    assert 'bytes=5096-8191' in ranges
+
+
+def test_download_file_checksum(tmp_path: Path, requests_mock: 'Mocker'):
+    url = 'https://example_url.com'
+    content = b'example content'
+    digest = hashlib.sha256(content).hexdigest()
+    requests_mock.get(url, content=content, status_code=HTTPStatus.OK)
+
+    result = download_file(url, tmp_path / 'file', expected_sha256=digest.upper())
+
+    assert result.sha256 == digest
+
+
+def test_download_file_checksum_mismatch(tmp_path: Path, requests_mock: 'Mocker'):
+    url = 'https://example_url.com'
+    requests_mock.get(url, content=b'example content', status_code=HTTPStatus.OK)
+
+    with pytest.raises(ChecksumMismatchException):
+        download_file(url, tmp_path / 'file', expected_sha256='0' * 64)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_resumed_file_checksum(tmp_path: Path, http_server: 'RangeHTTPServer'):
+    content = bytes(range(256)) * 64
+    url = http_server.add('/file', content, etag='abcd')
+    dst_file = tmp_path / 'file'
+    (tmp_path / 'file.part').write_bytes(content[:1000])
+
+    result = download_file(url, dst_file, part_etag='abcd')
+
+    assert result.size == len(content) - 1000
+    assert result.sha256 == hashlib.sha256(content).hexdigest()
+
+
+def test_download_segments_checksum(tmp_path: Path, http_server: 'RangeHTTPServer', monkeypatch):
+    content = bytes(range(256)) * 64
+    url = http_server.add('/file', content, etag='abcd')
+
+    with monkeypatch.context() as m:  # type: MonkeyPatch
+        m.setattr('embedmongo.utils._MIN_SEGMENT_SIZE', 1024)
+        result = download_file(url, tmp_path / 'file', segments=4)
+
+    assert result.sha256 == hashlib.sha256(content).hexdigest()
+
+
+def test_parse_checksums():
+    content = '{a}  mongodb-linux-x86_64-4.0.5.tgz\n{b} *mongodb-osx-ssl-x86_64-4.0.5.tgz\n\n'.format(a='a' * 64, b='B' * 64)
+
+    assert parse_checksums(content) == {'mongodb-linux-x86_64-4.0.5.tgz': 'a' * 64, 'mongodb-osx-ssl-x86_64-4.0.5.tgz': 'b' * 64}
+    assert parse_checksums('c' * 64) == {'': 'c' * 64}
+
+
+@pytest.mark.parametrize('status_code,text,expected', [
+    (HTTPStatus.OK, 'a' * 64 + '  pkg.tgz\n', 'a' * 64),
+    (HTTPStatus.OK, 'a' * 64 + '  other.tgz\n', 'a' * 64),
+    (HTTPStatus.NOT_FOUND, 'Not Found', None),
+])
+def test_fetch_checksum(requests_mock: 'Mocker', status_code: HTTPStatus, text: str, expected: typing.Optional[str]):
+    requests_mock.get('https://example_url.com/pkg.tgz.sha256', status_code=status_code, text=text)
+
+    assert fetch_checksum('https://example_url.com/pkg.tgz') == expected
+
+
+def test_extract_file_checksum_mismatch(tmp_path: Path):
+    with pytest.raises(ChecksumMismatchException):
+        extract_file(tar_file, tmp_path, expected_sha256='0' * 64)
+
+
 def test_extract_illegal_strip_level():
     with pytest.raises(ValueError):
         extract_file(Path(), Path(), -1)
@@ -111,3 +254,101 @@ def test_extract_no_files(tmp_path: Path):
     dst_subitems = [child for child in tmp_path.iterdir()]
 
     assert len(dst_subitems) == 0
+
+
+def test_download_and_extract_success(tmp_path: Path, requests_mock: 'Mocker'):
+    url = 'https://example_url.com/example.tgz'
+    dst_dir = tmp_path / 'dst'
+    requests_mock.get(url, content=tar_file.read_bytes(), headers={'ETag': 'abcd'}, status_code=HTTPStatus.OK)
+
+    result = download_and_extract(url, dst_dir, strip_level=1)
+
+    assert (dst_dir / 'b/c/file.ext').exists()
+    assert result.etag == 'abcd'
+    assert result.saved is True
+    assert [child.name for child in tmp_path.iterdir()] == ['dst']
+
+
+def test_download_and_extract_saves_archive_copy(tmp_path: Path, requests_mock: 'Mocker'):
+    url = 'https://example_url.com/example.tgz'
+    archive_copy = tmp_path / 'example.tgz'
+    requests_mock.get(url, content=tar_file.read_bytes(), status_code=HTTPStatus.OK)
+
+    download_and_extract(url, tmp_path / 'dst', archive_copy=archive_copy)
+
+    assert archive_copy.read_bytes() == tar_file.read_bytes()
+
+
+def test_download_and_extract_replaces_old_content(tmp_path: Path, requests_mock: 'Mocker'):
+    url = 'https://example_url.com/example.tgz'
+    dst_dir = tmp_path / 'dst'
+    old_file = dst_dir / 'old'
+    dst_dir.mkdir()
+    old_file.touch()
+    requests_mock.get(url, content=tar_file.read_bytes(), status_code=HTTPStatus.OK)
+
+    download_and_extract(url, dst_dir)
+
+    assert old_file.exists() is False
+    assert (dst_dir / 'a/b/c/file.ext').exists()
+
+
+def test_download_and_extract_not_modified(tmp_path: Path, requests_mock: 'Mocker'):
+    url = 'https://example_url.com/example.tgz'
+    dst_dir = tmp_path / 'dst'
+    dst_dir.mkdir()
+    requests_mock.get(url, status_code=HTTPStatus.NOT_MODIFIED, request_headers={'if-none-match': 'abcd'})
+
+    result = download_and_extract(url, dst_dir, etag='abcd')
+
+    assert result.saved is False
+    assert list(dst_dir.iterdir()) == []
+
+
+def test_download_and_extract_broken_archive_keeps_old_content(tmp_path: Path, requests_mock: 'Mocker'):
+    url = 'https://example_url.com/example.tgz'
+    dst_dir = tmp_path / 'dst'
+    old_file = dst_dir / 'old'
+    dst_dir.mkdir()
+    old_file.touch()
+    archive_copy = tmp_path / 'example.tgz'
+    requests_mock.get(url, content=tar_file.read_bytes()[:100], status_code=HTTPStatus.OK)
+
+    with pytest.raises(Exception):
+        download_and_extract(url, dst_dir, archive_copy=archive_copy)
+
+    assert old_file.exists()
+    assert archive_copy.exists() is False
+    assert sorted(child.name for child in tmp_path.iterdir()) == ['dst']
+
+
+def test_download_and_extract_checksum_mismatch_keeps_archive_copy(tmp_path: Path, requests_mock: 'Mocker'):
+    url = 'https://example_url.com/example.tgz'
+    archive_copy = tmp_path / 'example.tgz'
+    archive_copy.write_bytes(b'old archive')
+    requests_mock.get(url, content=tar_file.read_bytes(), status_code=HTTPStatus.OK)
+
+    with pytest.raises(ChecksumMismatchException):
+        download_and_extract(url, tmp_path / 'dst', archive_copy=archive_copy, expected_sha256='0' * 64)
+
+    assert archive_copy.read_bytes() == b'old archive'
+    assert sorted(child.name for child in tmp_path.iterdir()) == ['example.tgz']
+
+
+def test_download_and_extract_checksum_mismatch_keeps_old_content(tmp_path: Path, requests_mock: 'Mocker'):
+    url = 'https://example_url.com/example.tgz'
+    dst_dir = tmp_path / 'dst'
+    old_file = dst_dir / 'old'
+    dst_dir.mkdir()
+    old_file.touch()
+    requests_mock.get(url, content=tar_file.read_bytes(), status_code=HTTPStatus.OK)
+
+    with pytest.raises(ChecksumMismatchException):
+        download_and_extract(url, dst_dir, expected_sha256='0' * 64)
+
+    assert [child.name for child in dst_dir.iterdir()] == ['old']
+
+    result = download_and_extract(url, dst_dir, expected_sha256=hashlib.sha256(tar_file.read_bytes()).hexdigest())
+
+    assert result.sha256 == hashlib.sha256(tar_file.read_bytes()).hexdigest()
+    assert not old_file.exists()
@@ -0,0 +1,131 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import datetime
+import socket
+import struct
+import threading
+import typing
+
+import pytest
+
+from embedmongo.exceptions import MongoCommandException
+from embedmongo.wire import decode_document, drop_databases, encode_document, ObjectId, Timestamp, WireClient
+
+_HEADER = struct.Struct('<iiii')
+
+
+class FakeWireServer:
+    """Answers isMaster with OP_REPLY and other commands with reply of the same opCode as request."""
+    def __init__(self, max_wire_version: int):
+        self.max_wire_version = max_wire_version
+        self.databases = ['admin', 'local', 'app', 'tests']
+        self.commands = []  # type: typing.List[typing.Tuple[int, typing.Dict[str, typing.Any]]]
+        self._sock = socket.socket()
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(1)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self) -> None:
+        conn, _ = self._sock.accept()
+        with conn:
+            while True:
+                header = conn.recv(_HEADER.size, socket.MSG_WAITALL)
+                if not header:
+                    return
+                length, request_id, _, op_code = _HEADER.unpack(header)
+                body = conn.recv(length - _HEADER.size, socket.MSG_WAITALL)
+
+                if op_code == 2004:
+                    collection_end = body.index(b'\x00', 4)
+                    cmd, _ = decode_document(body, collection_end + 9)
+                    payload = struct.pack('<iqii', 0, 0, 0, 1) + encode_document(self._handle(op_code, cmd))
+                    reply_op_code = 1
+                else:
+                    cmd, _ = decode_document(body, 5)
+                    payload = struct.pack('<i', 0) + b'\x00' + encode_document(self._handle(op_code, cmd))
+                    reply_op_code = op_code
+                conn.sendall(_HEADER.pack(_HEADER.size + len(payload), 0, request_id, reply_op_code) + payload)
+
+    def _handle(self, op_code: int, cmd: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        self.commands.append((op_code, cmd))
+        name = next(iter(cmd))
+        if name == 'isMaster':
+            return {'ismaster': True, 'maxWireVersion': self.max_wire_version, 'ok': 1.0}
+        if name == 'listDatabases':
+            return {'databases': [{'name': db} for db in self.databases], 'ok': 1.0}
+        if name == 'dropDatabase':
+            return {'ok': 1.0}
+
+        return {'ok': 0.0, 'errmsg': 'no such command', 'code': 59}
+
+
+def test_bson_roundtrip():
+    doc = collections.OrderedDict([
+        ('none', None),
+        ('bool', True),
+        ('int32', 42),
+        ('int64', 2 ** 40),
+        ('double', 1.5),
+        ('string', 'zażółć'),
+        ('doc', {'a': 1}),
+        ('array', [1, 'two', {'three': 3}]),
+        ('binary', b'\x00\x01'),
+        ('oid', ObjectId(bytes(range(12)))),
+        ('date', datetime.datetime(2019, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)),
+        ('ts', Timestamp(time=1500000000, inc=7)),
+    ])
+
+    decoded, end = decode_document(encode_document(doc))
+
+    assert decoded == doc
+    assert list(decoded) == list(doc)
+    assert end == len(encode_document(doc))
+
+
+def test_bson_encode_unsupported_type():
+    with pytest.raises(TypeError):
+        encode_document({'set': {1, 2}})
+
+
+@pytest.mark.parametrize('max_wire_version,op_code', [(5, 2004), (6, 2013)])
+def test_command_uses_protocol_supported_by_server(max_wire_version: int, op_code: int):
+    server = FakeWireServer(max_wire_version)
+
+    with WireClient('127.0.0.1', server.port) as client:
+        reply = client.command('admin', 'listDatabases', nameOnly=True)
+
+    assert len(reply['databases']) == 4
+    assert server.commands[-1][0] == op_code
+    assert server.commands[-1][1]['nameOnly'] is True
+
+
+def test_command_failure():
+    server = FakeWireServer(7)
+
+    with WireClient('127.0.0.1', server.port) as client, pytest.raises(MongoCommandException) as excinfo:
+        client.command('admin', 'unknown')
+
+    assert excinfo.value.code == 59
+
+
+def test_drop_databases_keeps_system_databases():
+    server = FakeWireServer(7)
+
+    dropped = drop_databases('127.0.0.1', server.port)
+
+    assert dropped == ['app', 'tests']
+    assert [cmd.get('$db') for _, cmd in server.commands if 'dropDatabase' in cmd] == ['app', 'tests']
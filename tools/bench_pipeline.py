@@ -0,0 +1,273 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Benchmarks of package pipeline against local HTTP server serving synthetic mongodb-shaped archive:
+    cold prepare (download + extract, also streaming), warm prepare (304 response), prepared version lookup,
+    extraction throughput and peak Python memory of `PackageManager.download()` and `extract()`.
+
+    Results are printed (or written to --output) as JSON, two result files can be compared with --compare.
+
+    Usage:
+    python tools/bench_pipeline.py [--size-mb 150] [--runs 5] [--output results.json]
+    python tools/bench_pipeline.py --compare baseline.json results.json
+"""
+
+import argparse
+import contextlib
+import hashlib
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import io
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+import random
+import shutil
+import socketserver
+import statistics
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from embedmongo.package import ExternalPackage, PackageManager, Version
+from embedmongo.progress import set_progress_reporter
+from embedmongo.system import OSInfo
+from embedmongo.utils import extract_file
+
+VERSION = Version.V4_0_5
+FILENAME = 'mongodb-linux-x86_64-4.0.5.tgz'
+# relative sizes of binaries in real 4.0 linux package
+BINARIES = {'mongod': 0.28, 'mongos': 0.16, 'mongo': 0.16, 'mongodump': 0.08, 'mongorestore': 0.08, 'mongoexport': 0.06,
+            'mongoimport': 0.06, 'mongostat': 0.04, 'mongotop': 0.04, 'mongofiles': 0.04}
+# metrics where higher value is better, for other ones lower is better
+HIGHER_IS_BETTER = {'extract_throughput_mb_s'}
+
+
+def build_archive(size: int, seed: int = 0) -> bytes:
+    """tar.gz with mongodb package layout. Contents compress about 3:1, similar to real binaries."""
+    rnd = random.Random(seed)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        root = FILENAME[:-len('.tgz')]
+        for name, content in [('README', b'MongoDB README\n' * 100), ('LICENSE-Community.txt', b'license\n' * 1000)]:
+            _add(tar, '{root}/{name}'.format(root=root, name=name), content, 0o644)
+        for binary, share in sorted(BINARIES.items()):
+            binary_size = int(size * share)
+            # random blocks mixed with repeated ones
+            blocks = [rnd.getrandbits(8 * 4096).to_bytes(4096, 'little') if idx % 3 == 0 else bytes([idx % 256]) * 4096
+                      for idx in range(binary_size // 4096)]
+            _add(tar, '{root}/bin/{name}'.format(root=root, name=binary), b''.join(blocks), 0o755)
+
+    return buffer.getvalue()
+
+
+def _add(tar: tarfile.TarFile, name: str, content: bytes, mode: int) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mode = mode
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(content))
+
+
+class PackageServer(socketserver.ThreadingMixIn, HTTPServer):
+    """Serves one archive with ETag and `.sha256` sidecar, answers conditional requests with 304."""
+    daemon_threads = True
+
+    def __init__(self, content: bytes):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.content = content
+        self.etag = '"{digest}"'.format(digest=hashlib.md5(content).hexdigest())
+        self.sha256 = hashlib.sha256(content).hexdigest()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return 'http://{host}:{port}/linux/{name}'.format(host=host.decode() if isinstance(host, bytes) else host, port=port, name=FILENAME)
+
+    @contextlib.contextmanager
+    def running(self) -> Iterator['PackageServer']:
+        self._thread.start()
+        try:
+            yield self
+        finally:
+            self.shutdown()
+            self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server = None  # type: PackageServer  # type: ignore
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.endswith('.sha256'):
+            self._send(HTTPStatus.OK, '{digest}  {name}\n'.format(digest=self.server.sha256, name=FILENAME).encode())
+        elif self.headers.get('If-None-Match') == self.server.etag:
+            self._send(HTTPStatus.NOT_MODIFIED, b'')
+        else:
+            self._send(HTTPStatus.OK, self.server.content)
+
+    def _send(self, status: HTTPStatus, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.server.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def timings(func: Callable[[], Any], runs: int, setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    times = []
+    for _ in range(runs):
+        if setup:
+            setup()
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+
+    return {'min': min(times), 'median': statistics.median(times), 'max': max(times)}
+
+
+def peak_memory(func: Callable[[], Any]) -> int:
+    """Peak of memory allocated by Python while `func` runs, in bytes."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(size_mb: int, runs: int, work_dir: Path) -> Dict[str, Any]:
+    archive = build_archive(size_mb * 1024 * 1024)
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        unpacked_size = sum(member.size for member in tar.getmembers())
+
+    workspace = work_dir / 'workspace'
+    local_archive = work_dir / FILENAME
+    local_archive.write_bytes(archive)
+    results = {}  # type: Dict[str, Any]
+
+    def clean() -> None:
+        shutil.rmtree(str(workspace), ignore_errors=True)
+
+    with PackageServer(archive).running() as server:
+        pkg = ExternalPackage(version=VERSION, url=server.url, os_type='linux', filename=FILENAME, fallback_urls=(), sha256=None)
+
+        def manager() -> PackageManager:
+            return PackageManager(workspace)
+
+        def prepare() -> None:
+            pkg_manager = manager()
+            pkg_manager.extract(pkg_manager.download(pkg))
+
+        results['cold_prepare_s'] = timings(prepare, runs, setup=clean)
+        results['cold_prepare_streaming_s'] = timings(lambda: manager().download_and_extract(pkg), runs, setup=clean)
+        results['cold_prepare_mongod_only_s'] = timings(lambda: manager().download_and_extract(pkg, components={'mongod'}), runs, setup=clean)
+
+        clean()
+        prepare()
+        results['warm_prepare_s'] = timings(prepare, runs)
+        results['installed_lookup_s'] = timings(lambda: manager().installed(VERSION), runs)
+
+        clean()
+        results['download_peak_memory_bytes'] = peak_memory(lambda: manager().download(pkg))
+        local_pkg = manager().download(pkg)
+        results['extract_peak_memory_bytes'] = peak_memory(lambda: manager().extract(local_pkg._replace(new_file=True)))
+
+    extract_dir = work_dir / 'extracted'
+    extract_times = timings(lambda: extract_file(local_archive, extract_dir, strip_level=1), runs,
+                            setup=lambda: shutil.rmtree(str(extract_dir), ignore_errors=True))
+    results['extract_s'] = extract_times
+    results['extract_throughput_mb_s'] = unpacked_size / 1024 / 1024 / extract_times['median']
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'archive_bytes': len(archive),
+            'unpacked_bytes': unpacked_size,
+            'runs': runs,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """Lines with relative change of every metric, medians of timings. Positive change is an improvement."""
+    lines = ['{metric:32} {old:>14} {new:>14} {change:>9}'.format(metric='metric', old='baseline', new='current', change='change')]
+    for metric, value in sorted(current['results'].items()):
+        if metric not in baseline['results']:
+            continue
+        old, new = _scalar(baseline['results'][metric]), _scalar(value)
+        change = (new - old) / old if metric in HIGHER_IS_BETTER else (old - new) / old
+        lines.append('{metric:32} {old:14.4f} {new:14.4f} {change:+8.1%}'.format(metric=metric, old=old, new=new, change=change))
+
+    return lines
+
+
+def _scalar(value: Any) -> float:
+    return float(value['median'] if isinstance(value, dict) else value)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=str(Path(__file__).parent), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=150, help='unpacked size of synthetic package')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', type=Path, help='results file, stdout by default')
+    parser.add_argument('--compare', type=Path, nargs=2, metavar=('BASELINE', 'CURRENT'), help='compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        baseline, current = (json.loads(path.read_text()) for path in args.compare)
+        print('\n'.join(compare(baseline, current)))
+        return
+
+    # progress reports and per-download logs would distort timings
+    logging.disable(logging.INFO)
+    set_progress_reporter(None)
+    OSInfo.type = staticmethod(lambda: 'linux')  # type: ignore
+    OSInfo.architecture = staticmethod(lambda: 'x86_64')  # type: ignore
+
+    with tempfile.TemporaryDirectory(prefix='embedmongo-bench-') as work_dir:
+        results = run(args.size_mb, args.runs, Path(work_dir))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Compares mongod startup on empty data directory (storage engine bootstrap) with startup from golden snapshot clone.
+
+    Usage:
+    python tools/bench_snapshot.py [version] [runs] [workspace_dir]
+"""
+
+import json
+from pathlib import Path
+import statistics
+import sys
+import time
+
+from embedmongo import EmbedMongo, MongodLauncher, Version
+
+
+def measure(launcher: MongodLauncher, runs: int, snapshot: Path = None) -> dict:
+    times = []
+    for _ in range(runs):
+        start_time = time.monotonic()
+        process = launcher.start(snapshot=snapshot)
+        times.append(time.monotonic() - start_time)
+        process.stop()
+
+    return {'runs': runs, 'min': min(times), 'median': statistics.median(times), 'max': max(times)}
+
+
+def main(version: Version, runs: int, workspace_dir: Path) -> None:
+    em = EmbedMongo(workspace_dir)
+    bin_dir = em.prepare(version)
+    launcher = MongodLauncher(bin_dir)
+    snapshots = em.snapshots(version)
+    snapshots.remove('bench')
+
+    start_time = time.monotonic()
+    golden = snapshots.golden('bench')
+    golden_time = time.monotonic() - start_time
+
+    results = {
+        'version': version.version,
+        'golden_init': golden_time,
+        'cold': measure(launcher, runs),
+        'clone': measure(launcher, runs, snapshot=golden),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    version = Version(sys.argv[1]) if len(sys.argv) > 1 else Version.V4_0_5
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    workspace_dir = Path(sys.argv[3]) if len(sys.argv) > 3 else Path.home() / '.pyembedmongo'
+    main(version, runs, workspace_dir)
@@ -0,0 +1,85 @@
+# Copyright 2019 Karol Horowski
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Compares insert/query latency of mongod with default on-disk storage and RAM backed one (`MongodLauncher(ram=True)`).
+    Every operation is separate command over `WireClient`: single document inserts, inserts of 100 documents batches,
+    finds by indexed field and updates. Latencies are in milliseconds. `find` command needs mongod 3.2 or newer.
+
+    Usage:
+    python tools/bench_storage.py [version] [operations] [workspace_dir]
+"""
+
+import json
+from pathlib import Path
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List  # noqa: F401
+
+from embedmongo import EmbedMongo, MongodLauncher, Version
+from embedmongo.wire import WireClient
+
+BATCH_SIZE = 100
+
+
+def latencies(operation: Callable[[int], Any], count: int) -> Dict[str, float]:
+    times = []  # type: List[float]
+    for idx in range(count):
+        start_time = time.perf_counter()
+        operation(idx)
+        times.append((time.perf_counter() - start_time) * 1000)
+    times.sort()
+
+    return {'median': statistics.median(times), 'p95': times[int(len(times) * 0.95)], 'max': times[-1]}
+
+
+def measure(launcher: MongodLauncher, count: int) -> Dict[str, Any]:
+    start_time = time.monotonic()
+    process = launcher.start()
+    startup = time.monotonic() - start_time
+    try:
+        with WireClient(process.host, process.port) as client:
+            client.command('bench', 'createIndexes', 'docs', indexes=[{'key': {'n': 1}, 'name': 'n_1'}])
+            payload = 'x' * 512
+            return {
+                'startup': startup,
+                'insert': latencies(lambda idx: client.command('bench', 'insert', 'docs', documents=[{'n': idx, 'payload': payload}]), count),
+                'insert_batch': latencies(lambda idx: client.command('bench', 'insert', 'batches', documents=[
+                    {'n': idx * BATCH_SIZE + offset, 'payload': payload} for offset in range(BATCH_SIZE)]), count // 10 or 1),
+                'find': latencies(lambda idx: client.command('bench', 'find', 'docs', filter={'n': idx}), count),
+                'update': latencies(lambda idx: client.command('bench', 'update', 'docs', updates=[{'q': {'n': idx}, 'u': {'$set': {'updated': True}}}]),
+                                    count),
+            }
+    finally:
+        process.stop()
+
+
+def main(version: Version, count: int, workspace_dir: Path) -> None:
+    bin_dir = EmbedMongo(workspace_dir).prepare(version, components={'mongod'})
+
+    results = {
+        'version': version.version,
+        'operations': count,
+        'disk': measure(MongodLauncher(bin_dir), count),
+        'ram': measure(MongodLauncher(bin_dir, ram=True), count),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    version = Version(sys.argv[1]) if len(sys.argv) > 1 else Version.V4_0_5
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    workspace_dir = Path(sys.argv[3]) if len(sys.argv) > 3 else Path.home() / '.pyembedmongo'
+    main(version, count, workspace_dir)
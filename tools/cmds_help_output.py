@@ -12,60 +12,53 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""
+    Tool for fetching help output from all commands in bin/ dir of every extracted version. Binaries of one version
+    are run in parallel (see `embedmongo.capabilities.help_outputs()`). Output is written to
+    `[dst_dir]/<cmd>/<version>.out` and options parsed from it to `[dst_dir]/<version>.json`, the index which is
+    kept in version metadata.
+
+    Usage:
+    python cmds_help_output.py [workspace_dir] [dst_dir]
+
+    workspace_dir - directory where all mongo extracted packages are stored,
+    dst_dir - output directory, default: [workspace_dir]/cmd
+"""
+
+import json
 from pathlib import Path
-import subprocess
 import sys
+from typing import Optional
 
-excluded_files = (
-    "%s.py" % __file__,
-    'install_compass',
-)
+from embedmongo.capabilities import help_outputs, parse_help
 
 
-def main(workspace_dir, dst_dir=None):
-    workspace_dir = Path(workspace_dir)
-    if not dst_dir:
-        root_dir = workspace_dir / 'cmd'
-    else:
-        root_dir = Path(dst_dir)
+def main(workspace_dir: Path, dst_dir: Optional[Path] = None) -> None:
+    root_dir = dst_dir or workspace_dir / 'cmd'
 
-    for i in workspace_dir.glob("**/bin/*"):
-        if not i.is_file() or i.parts[-1] in excluded_files:
+    for bin_dir in sorted(workspace_dir.glob('*/*/bin')):
+        if bin_dir.parent.name.endswith('.partial'):
+            # interrupted or still running extraction
             continue
-        relative_path = i.relative_to(workspace_dir)
-        version = relative_path.parts[0]
-        cmd = relative_path.parts[-1]
-
-        cmd_dir = root_dir / cmd
-        cmd_dir.mkdir(parents=True, exist_ok=True)
 
-        cmd_version_out = cmd_dir / ('%s.out' % version)
-        cmd_version_err = cmd_dir / ('%s.err' % version)
-        with cmd_version_out.open("w") as out, cmd_version_err.open("w") as err:
-            subprocess.run([str(i), '--help'], stdout=out, stderr=err)
+        version = bin_dir.relative_to(workspace_dir).parts[0]
+        index = {}
+        for cmd, output in help_outputs(bin_dir).items():
+            if output is None:
+                continue
 
-        if cmd_version_out.stat().st_size == 0:
-            cmd_version_out.unlink()
+            cmd_dir = root_dir / cmd
+            cmd_dir.mkdir(parents=True, exist_ok=True)
+            (cmd_dir / '{version}.out'.format(version=version)).write_text(output)
+            index[cmd] = parse_help(output)
 
-        if cmd_version_err.stat().st_size == 0:
-            cmd_version_err.unlink()
+        root_dir.mkdir(parents=True, exist_ok=True)
+        (root_dir / '{version}.json'.format(version=version)).write_text(json.dumps(index, indent=2, sort_keys=True))
 
 
 if __name__ == '__main__':
-    '''
-        Tool for fetching help output from all commands in bin/ dir. 
-        
-        Usage:
-        python cmds_help_output.py [workspace_dir]
-        
-        workspace_dir - directory where all mongo extracted packages are stored.
-    '''
     if len(sys.argv) < 2:
         print("[workspace_dir] arg is required")
 
         exit(1)
-    src_dir = sys.argv[1]
-    output_dir = None
-    if len(sys.argv) > 2:
-        output_dir = sys.argv[2]
-    main(src_dir, output_dir)
+    main(Path(sys.argv[1]), Path(sys.argv[2]) if len(sys.argv) > 2 else None)